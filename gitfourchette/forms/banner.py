@@ -43,6 +43,7 @@ class Banner(QFrame):
 
         self.icon = icon
         self.label = label
+        self.title = ""
         self.lastWarningWasDismissed = False
         self.orientation = orientation
         self.buttons = []
@@ -82,6 +83,19 @@ class Banner(QFrame):
         self.setProperty("heeded", str(heeded).lower())
         self.setStyleSheet("* {}")  # reset stylesheet to percolate property change
 
+        self.title = title
+        self.setText(text)
+        self.icon.setVisible(withIcon)
+
+        self.dismissButton.setVisible(canDismiss)
+        self.lastWarningWasDismissed = False
+
+        self.setVisible(True)
+
+    def setText(self, text: str):
+        """ Replace the text below the title (e.g. to report progress). """
+        title = self.title
+
         smallPt = adjustedWidgetFontSize(self.label, FONT_POINT_PERCENT)
         markup = f"<style>sm {{ font-size: {smallPt}pt; }}</style>"
         if title:
@@ -93,12 +107,6 @@ class Banner(QFrame):
 
         self.label.setTextFormat(Qt.TextFormat.RichText)
         self.label.setText(markup)
-        self.icon.setVisible(withIcon)
-
-        self.dismissButton.setVisible(canDismiss)
-        self.lastWarningWasDismissed = False
-
-        self.setVisible(True)
 
     def dismiss(self):
         self.lastWarningWasDismissed = True
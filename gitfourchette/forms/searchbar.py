@@ -34,7 +34,8 @@ class SearchBar(QWidget):
 
     buddy: QWidget
     """ Widget in which the search is carried out.
-    Must implement the `searchRange` callback. """
+    Must implement the `searchRange` callback.
+    May implement the `prepareSearch` callback (see `prepareBuddy`). """
 
     detectHashes: bool
     """ Try to optimize for 40-character SHA-1 hashes.
@@ -210,6 +211,15 @@ class SearchBar(QWidget):
         assert hasattr(self.buddy, "searchRange"), "missing searchRange callback"
         return self.buddy.searchRange(r)
 
+    def prepareBuddy(self, retry: Callable[[], object]) -> bool:
+        """ Proxy for buddy.prepareSearch, if the buddy implements it.
+
+        Return False if the buddy isn't ready to search for the current term
+        yet (e.g. it's looking for matches in the background). In that case,
+        the buddy will call `retry` once it's ready. """
+        prepareSearch = getattr(self.buddy, "prepareSearch", None)
+        return prepareSearch is None or prepareSearch(retry)
+
     @staticmethod
     def defaultNotFoundMessage(searchTerm: str) -> str:
         return _("{text} not found.", text=bquo(searchTerm))
@@ -248,6 +258,9 @@ class SearchBar(QWidget):
 
         didWrap = wrapCount > 0
 
+        if not didWrap and not self.prepareBuddy(lambda: self.searchItemView(op)):
+            return NOT_FOUND
+
         # Find start bound of search range
         if not didWrap and len(view.selectedIndexes()) != 0:
             start = view.currentIndex().row()
@@ -296,6 +309,9 @@ class SearchBar(QWidget):
         view = self.buddy
         assert isinstance(view, QAbstractItemView)
 
+        if not self.prepareBuddy(self.pulseItemView):
+            return
+
         def generateSearchRanges():
             rowCount = view.model().rowCount()
 
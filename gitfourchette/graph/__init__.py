@@ -9,6 +9,7 @@ from gitfourchette.graph.graph import (
     ArcJunction,
     BatchRow,
     ChainHandle,
+    CommitRowIndex,
     Frame,
     Graph,
     KF_INTERVAL,
@@ -22,3 +23,8 @@ from gitfourchette.graph.graphbuilder import (
     MockCommit,
     MockOid,
 )
+from gitfourchette.graph.commitsequence import CommitSequence
+from gitfourchette.graph.graphcache import GraphCache
+from gitfourchette.graph.parenttable import ParentTable
+from gitfourchette.graph.reachability import ReachabilityIndex
+from gitfourchette.graph.aheadbehind import countAheadBehind
@@ -5,10 +5,18 @@
 # -----------------------------------------------------------------------------
 
 if __name__ == '__main__':
+    import sys
+
+    # "bench" mode: python -m gitfourchette.graph bench --help
+    if sys.argv[1:2] == ["bench"]:
+        from gitfourchette.graph.graphbench import main
+        main(sys.argv[2:])
+        sys.exit(0)
+
     from gitfourchette.graph import *
     from argparse import ArgumentParser
 
-    parser = ArgumentParser(description="GitFourchette ASCII graph tool")
+    parser = ArgumentParser(description="GitFourchette ASCII graph tool (use 'bench' as the first argument to run benchmarks)")
     parser.add_argument("definition", help="Graph definition (e.g.: \"u:z i:b m:a,b a:z b-c-z\")", nargs="+")
     parser.add_argument("-t", "--tips", nargs="*", default=[])
     parser.add_argument("-x", "--hide", nargs="*", default=[])
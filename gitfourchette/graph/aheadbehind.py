@@ -0,0 +1,103 @@
+# -----------------------------------------------------------------------------
+# Copyright (C) 2025 Iliyas Jorio.
+# This file is part of GitFourchette, distributed under the GNU GPL v3.
+# For full terms, see the included LICENSE file.
+# -----------------------------------------------------------------------------
+
+"""
+Ahead/behind counts for many pairs of commits in a single walk.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Callable
+
+from gitfourchette.graph.commitsequence import OID_SIZE, CommitSequence
+from gitfourchette.graph.graph import Oid
+
+
+def countAheadBehind(sequence: CommitSequence, pairs: list[tuple[Oid, Oid]],
+                     rowOf: Callable[[Oid], int]) -> list[tuple[int, int] | None]:
+    """
+    For each pair of commits (a, b), count the commits that are only in the
+    history of a (ahead) and those that are only in the history of b (behind),
+    like `git rev-list --count --left-right a...b`.
+
+    All pairs are counted in a single pass down the commit sequence. Each
+    pair gets two bits (one for a, one for b) that trickle down to the
+    parents. The sequence is in topological order, so by the time we get to
+    a commit, it has received the bits of all its children: if only one bit
+    of a pair is set, the commit counts towards ahead or behind. The walk
+    stops once every commit left to visit is common to both sides of all
+    pairs. `rowOf` gives the row of a commit in the sequence; row numbers
+    stand in for generation numbers.
+
+    A pair's count is None if its commits aren't in the sequence, or if the
+    walk ran off the end of the sequence (e.g. truncated history) before the
+    pair could be settled.
+    """
+
+    counts: list[list[int] | None] = [None] * len(pairs)
+    pending: dict[bytes, int] = {}
+    leftBits = 0  # bit 2i is set if pair i is being counted
+    startRow = len(sequence)
+
+    for i, (a, b) in enumerate(pairs):
+        try:
+            startRow = min(startRow, rowOf(a), rowOf(b))
+        except KeyError:
+            continue
+        pending[a.raw] = pending.get(a.raw, 0) | (1 << 2 * i)
+        pending[b.raw] = pending.get(b.raw, 0) | (2 << 2 * i)
+        leftBits |= 1 << 2 * i
+        counts[i] = [0, 0]
+
+    def isUncommon(mask: int) -> bool:
+        return bool((mask ^ (mask >> 1)) & leftBits)
+
+    ids, parentIds, parentEnds = sequence.buffers()
+    numRows = len(parentEnds)
+    numUncommon = sum(isUncommon(mask) for mask in pending.values())
+
+    row = startRow
+    while numUncommon and row < numRows:
+        raw = ids[row * OID_SIZE: (row + 1) * OID_SIZE]
+        mask = pending.pop(raw, 0)
+        if not mask:
+            row += 1
+            continue
+
+        ahead = mask & ~(mask >> 1) & leftBits
+        behind = (mask >> 1) & ~mask & leftBits
+        if ahead or behind:
+            numUncommon -= 1
+        while ahead:
+            lowest = ahead & -ahead
+            counts[lowest.bit_length() >> 1][0] += 1
+            ahead ^= lowest
+        while behind:
+            lowest = behind & -behind
+            counts[lowest.bit_length() >> 1][1] += 1
+            behind ^= lowest
+
+        for j in range(parentEnds[row - 1] if row else 0, parentEnds[row]):
+            parent = parentIds[j * OID_SIZE: (j + 1) * OID_SIZE]
+            old = pending.get(parent, 0)
+            merged = old | mask
+            if merged != old:
+                pending[parent] = merged
+                numUncommon += isUncommon(merged) - isUncommon(old)
+
+        row += 1
+
+    # Some commits weren't visited: the pairs that still had uncommon commits to visit are unsettled
+    if numUncommon:
+        unsettled = 0
+        for mask in pending.values():
+            unsettled |= (mask ^ (mask >> 1)) & leftBits
+        while unsettled:
+            lowest = unsettled & -unsettled
+            counts[lowest.bit_length() >> 1] = None
+            unsettled ^= lowest
+
+    return [tuple(c) if c is not None else None for c in counts]
@@ -0,0 +1,443 @@
+# -----------------------------------------------------------------------------
+# Copyright (C) 2025 Iliyas Jorio.
+# This file is part of GitFourchette, distributed under the GNU GPL v3.
+# For full terms, see the included LICENSE file.
+# -----------------------------------------------------------------------------
+
+"""
+Read Git's commit-graph files (objects/info/commit-graph, or a split chain in
+objects/info/commit-graphs/) to walk the history without inflating any commit
+objects.
+
+The format is documented in Git's gitformat-commit-graph(5).
+"""
+
+from __future__ import annotations
+
+import bisect
+import mmap
+import os
+import struct
+from collections.abc import Iterable, Iterator
+
+from gitfourchette.graph.graph import Oid
+from gitfourchette.graph.graphbuilder import MockCommit
+
+SIGNATURE = b"CGPH"
+HASH_SIZE = 20  # SHA-1 only
+
+CHUNK_OIDFANOUT = b"OIDF"
+CHUNK_OIDLOOKUP = b"OIDL"
+CHUNK_COMMITDATA = b"CDAT"
+CHUNK_EXTRAEDGES = b"EDGE"
+
+PARENT_NONE = 0x70000000
+PARENT_OCTOPUS = 0x80000000
+EDGE_LAST = 0x80000000
+
+_cdatStruct = struct.Struct(f">{HASH_SIZE}xIIII")  # skip root tree, then parent1, parent2, gen+time hi, time lo
+_u32 = struct.Struct(">I")
+
+
+class CommitGraphError(Exception):
+    pass
+
+
+class CommitGraphLayer:
+    """
+    One memory-mapped commit-graph file: either a standalone commit-graph,
+    or one link in a split chain.
+
+    Commit positions are global across the chain: the commits in this layer
+    are numbered from `baseCount` onwards, in lexicographic order of their ids.
+    """
+
+    def __init__(self, path: str, baseCount: int = 0, numBaseLayers: int = 0):
+        self.path = path
+        self.baseCount = baseCount
+
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            self._parse(numBaseLayers)
+        except (struct.error, IndexError, ValueError) as exc:
+            self.close()
+            raise CommitGraphError(f"{path}: truncated or corrupt ({exc})") from exc
+        except CommitGraphError:
+            self.close()
+            raise
+
+    def _parse(self, numBaseLayers: int):
+        mm = self.mm
+
+        signature, version, hashVersion, numChunks, numBases = struct.unpack_from(">4sBBBB", mm, 0)
+        if signature != SIGNATURE:
+            raise CommitGraphError(f"{self.path}: bad signature")
+        if version != 1:
+            raise CommitGraphError(f"{self.path}: unsupported version {version}")
+        if hashVersion != 1:
+            raise CommitGraphError(f"{self.path}: unsupported hash version {hashVersion}")
+        if numBases != numBaseLayers:
+            raise CommitGraphError(f"{self.path}: expected {numBaseLayers} base graphs, got {numBases}")
+
+        # Table of contents: (numChunks + 1) entries; the last one only marks the end of the final chunk
+        chunks = {}
+        for i in range(numChunks):
+            chunkId, offset = struct.unpack_from(">4sQ", mm, 8 + 12 * i)
+            chunks[chunkId] = offset
+
+        try:
+            fanoutOffset = chunks[CHUNK_OIDFANOUT]
+            self.oidOffset = chunks[CHUNK_OIDLOOKUP]
+            self.dataOffset = chunks[CHUNK_COMMITDATA]
+        except KeyError as exc:
+            raise CommitGraphError(f"{self.path}: missing chunk {exc}") from exc
+
+        self.edgeOffset = chunks.get(CHUNK_EXTRAEDGES, -1)
+        self.fanout = struct.unpack_from(">256I", mm, fanoutOffset)
+        self.numCommits = self.fanout[-1]
+
+        if self.dataOffset + self.numCommits * _cdatStruct.size > len(mm):
+            raise CommitGraphError(f"{self.path}: commit data chunk runs past end of file")
+
+    def close(self):
+        self.mm.close()
+
+    def rawId(self, index: int) -> bytes:
+        offset = self.oidOffset + index * HASH_SIZE
+        return self.mm[offset: offset + HASH_SIZE]
+
+    def find(self, raw: bytes) -> int:
+        """ Return the index of a commit within this layer, or -1 if it isn't in this layer. """
+        first = raw[0]
+        lo = self.fanout[first - 1] if first > 0 else 0
+        hi = self.fanout[first]
+        mm = self.mm
+        base = self.oidOffset
+
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = base + mid * HASH_SIZE
+            probe = mm[offset: offset + HASH_SIZE]
+            if probe < raw:
+                lo = mid + 1
+            elif probe > raw:
+                hi = mid
+            else:
+                return mid
+        return -1
+
+    def data(self, index: int) -> tuple[int, int, int, int]:
+        return _cdatStruct.unpack_from(self.mm, self.dataOffset + index * _cdatStruct.size)
+
+    def extraEdges(self, edgeIndex: int) -> list[int]:
+        if self.edgeOffset < 0:
+            raise CommitGraphError(f"{self.path}: octopus merge without extra edges chunk")
+        parents = []
+        offset = self.edgeOffset + edgeIndex * 4
+        while True:
+            if offset + 4 > len(self.mm):
+                raise CommitGraphError(f"{self.path}: extra edge list runs past end of file")
+            edge, = _u32.unpack_from(self.mm, offset)
+            parents.append(edge & ~EDGE_LAST)
+            if edge & EDGE_LAST:
+                return parents
+            offset += 4
+
+
+class CommitGraph:
+    """
+    Read-only view of a repository's commit-graph (standalone or split chain).
+
+    Commits are referred to by their position in the graph, which keeps the
+    walk cheap: we only turn positions into Oids when yielding commits.
+    """
+
+    def __init__(self, layers: list[CommitGraphLayer]):
+        assert layers
+        self.layers = layers
+        self.layerStarts = [layer.baseCount for layer in layers]
+        self.numCommits = layers[-1].baseCount + layers[-1].numCommits
+
+    def __len__(self):
+        return self.numCommits
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        for layer in self.layers:
+            layer.close()
+        self.layers = []
+
+    @staticmethod
+    def open(objectsDir: str) -> CommitGraph | None:
+        """
+        Open the commit-graph in the given objects directory.
+        Return None if the repository doesn't have one.
+        Raise CommitGraphError if the commit-graph is unusable.
+        """
+        infoDir = os.path.join(objectsDir, "info")
+
+        # Like Git, prefer a standalone commit-graph over a split chain
+        standalonePath = os.path.join(infoDir, "commit-graph")
+        if os.path.isfile(standalonePath):
+            return CommitGraph([CommitGraphLayer(standalonePath)])
+
+        chainDir = os.path.join(infoDir, "commit-graphs")
+        try:
+            with open(os.path.join(chainDir, "commit-graph-chain"), encoding="ascii") as f:
+                hashes = f.read().split()
+        except OSError:
+            return None
+
+        if not hashes:
+            return None
+
+        layers: list[CommitGraphLayer] = []
+        baseCount = 0
+        try:
+            for i, h in enumerate(hashes):
+                layer = CommitGraphLayer(os.path.join(chainDir, f"graph-{h}.graph"), baseCount, i)
+                layers.append(layer)
+                baseCount += layer.numCommits
+        except (OSError, CommitGraphError) as exc:
+            for layer in layers:
+                layer.close()
+            if isinstance(exc, OSError):
+                raise CommitGraphError(f"broken commit-graph chain: {exc}") from exc
+            raise
+
+        return CommitGraph(layers)
+
+    def _layerOf(self, position: int) -> CommitGraphLayer:
+        if len(self.layers) == 1:
+            return self.layers[0]
+        return self.layers[bisect.bisect_right(self.layerStarts, position) - 1]
+
+    def position(self, oid: Oid) -> int:
+        """ Return the position of a commit in the graph, or -1 if it isn't in the graph. """
+        raw = oid.raw
+        for layer in reversed(self.layers):
+            index = layer.find(raw)
+            if index >= 0:
+                return layer.baseCount + index
+        return -1
+
+    def oid(self, position: int) -> Oid:
+        layer = self._layerOf(position)
+        return Oid(raw=layer.rawId(position - layer.baseCount))
+
+    def parentsAndTime(self, position: int) -> tuple[list[int], int]:
+        layer = self._layerOf(position)
+        parent1, parent2, genAndTimeHi, timeLo = layer.data(position - layer.baseCount)
+        commitTime = ((genAndTimeHi & 3) << 32) | timeLo
+
+        if parent1 == PARENT_NONE:
+            parents = []
+        elif parent2 == PARENT_NONE:
+            parents = [parent1]
+        elif parent2 & PARENT_OCTOPUS:
+            parents = [parent1] + layer.extraEdges(parent2 & ~PARENT_OCTOPUS)
+        else:
+            parents = [parent1, parent2]
+
+        if parents and max(parents) >= self.numCommits:
+            raise CommitGraphError(f"{layer.path}: parent position out of range")
+
+        return parents, commitTime
+
+    def topologicalOrder(self, tips: Iterable[Oid], sortTime: bool = False) -> tuple[list[int], dict[int, list[int]]]:
+        """
+        Sort all commits reachable from the tips in topological order.
+        Return their positions, and the positions of their parents.
+
+        This replicates what libgit2's revwalk does in topological mode (with
+        or without time sorting), so that the result is interchangeable with
+        the sequence that Walker would produce with the tips pushed in the
+        same order.
+
+        Raise KeyError if a tip isn't in the commit-graph, i.e. the
+        commit-graph is stale.
+        """
+
+        parentsAndTime = self.parentsAndTime
+        parentCache: dict[int, list[int]] = {}
+        timeCache: dict[int, int] = {}
+
+        def lookUp(pos: int):
+            parents, commitTime = parentsAndTime(pos)
+            parentCache[pos] = parents
+            timeCache[pos] = commitTime
+
+        # libgit2 starts from the last tip that was pushed. If a tip was pushed
+        # several times, only its last push counts.
+        start: list[int] = []
+        seen = set()
+        for tip in reversed(list(tips)):
+            pos = self.position(tip)
+            if pos < 0:
+                raise KeyError(tip)
+            if pos not in seen:
+                seen.add(pos)
+                start.append(pos)
+
+        for pos in start:
+            lookUp(pos)
+
+        # Pass 1: Limit the list (date-ordered traversal of everything that's reachable)
+        pending = start  # newest first; the tips are not sorted amongst themselves
+        added = set()
+        limited = []
+
+        while pending:
+            pos = pending.pop(0)
+            if pos in added:
+                continue
+            added.add(pos)
+            limited.append(pos)
+
+            for parent in parentCache[pos]:
+                if parent in added:
+                    continue
+                if parent not in timeCache:
+                    lookUp(parent)
+                # Insert before the first pending commit that's strictly older
+                parentTime = timeCache[parent]
+                i = 0
+                while i < len(pending) and timeCache[pending[i]] >= parentTime:
+                    i += 1
+                pending.insert(i, parent)
+
+        # Pass 2: Topological sort
+        inDegree = dict.fromkeys(limited, 1)
+        for pos in limited:
+            for parent in parentCache[pos]:
+                if inDegree.get(parent, 0):
+                    inDegree[parent] += 1
+
+        tipsInOrder = [pos for pos in limited if inDegree[pos] == 1]
+
+        output = []
+        if not sortTime:
+            # Plain stack: pop the tips in the order they came out of the traversal
+            stack = tipsInOrder[::-1]
+            while stack:
+                pos = stack.pop()
+                for parent in parentCache[pos]:
+                    degree = inDegree.get(parent, 0)
+                    if degree == 0:
+                        continue
+                    degree -= 1
+                    inDegree[parent] = degree
+                    if degree == 1:
+                        stack.append(parent)
+                inDegree[pos] = 0
+                output.append(pos)
+        else:
+            heap = _TimeHeap(timeCache)
+            for pos in tipsInOrder:
+                heap.push(pos)
+            while heap:
+                pos = heap.pop()
+                for parent in parentCache[pos]:
+                    degree = inDegree.get(parent, 0)
+                    if degree == 0:
+                        continue
+                    degree -= 1
+                    inDegree[parent] = degree
+                    if degree == 1:
+                        heap.push(parent)
+                inDegree[pos] = 0
+                output.append(pos)
+
+        return output, parentCache
+
+    def walk(self, tips: Iterable[Oid], sortTime: bool = False) -> Iterator[MockCommit]:
+        """
+        Return an iterator over lightweight commits (id and parent ids)
+        reachable from the tips, in the same order as a topological Walker.
+
+        The commits are sorted upfront, so this raises KeyError right away
+        if the commit-graph is stale.
+        """
+        order, parentCache = self.topologicalOrder(tips, sortTime)
+        return self._yieldCommits(order, parentCache)
+
+    def _yieldCommits(self, order: list[int], parentCache: dict[int, list[int]]) -> Iterator[MockCommit]:
+        oids: dict[int, Oid] = {}
+        oid = self.oid
+
+        def sharedOid(pos: int) -> Oid:
+            # Share Oid instances between commits and their children to save memory
+            try:
+                return oids[pos]
+            except KeyError:
+                o = oids[pos] = oid(pos)
+                return o
+
+        for pos in order:
+            yield MockCommit(sharedOid(pos), [sharedOid(p) for p in parentCache[pos]])
+            del parentCache[pos]
+
+
+class _TimeHeap:
+    """
+    Binary heap of commit positions, newest first.
+
+    This mirrors libgit2's git_pqueue exactly (including how it breaks ties)
+    so that commits with identical timestamps come out in the same order.
+    """
+
+    def __init__(self, times: dict[int, int]):
+        self.items: list[int] = []
+        self.times = times
+
+    def __bool__(self):
+        return bool(self.items)
+
+    def _cmp(self, a: int, b: int) -> int:
+        ta = self.times[a]
+        tb = self.times[b]
+        return 1 if ta < tb else -1 if ta > tb else 0
+
+    def push(self, pos: int):
+        items = self.items
+        items.append(pos)
+        el = len(items) - 1
+        while el > 0:
+            parentEl = (el - 1) // 2
+            parent = items[parentEl]
+            if self._cmp(parent, pos) <= 0:
+                break
+            items[el] = parent
+            el = parentEl
+        items[el] = pos
+
+    def pop(self) -> int:
+        items = self.items
+        top = items[0]
+        last = items.pop()
+        if not items:
+            return top
+
+        el = 0
+        n = len(items)
+        while True:
+            kidEl = 2 * el + 1
+            if kidEl >= n:
+                break
+            kid = items[kidEl]
+            if kidEl + 1 < n and self._cmp(kid, items[kidEl + 1]) > 0:
+                kidEl += 1
+                kid = items[kidEl]
+            if self._cmp(last, kid) <= 0:
+                break
+            items[el] = kid
+            el = kidEl
+        items[el] = last
+        return top
@@ -0,0 +1,179 @@
+# -----------------------------------------------------------------------------
+# Copyright (C) 2025 Iliyas Jorio.
+# This file is part of GitFourchette, distributed under the GNU GPL v3.
+# For full terms, see the included LICENSE file.
+# -----------------------------------------------------------------------------
+
+from __future__ import annotations
+
+from array import array
+from collections.abc import Iterable, Iterator, Sequence
+
+from gitfourchette.graph.graph import Oid
+from gitfourchette.graph.graphbuilder import MockCommit
+
+OID_SIZE = 20
+
+
+class CommitSequence(Sequence):
+    """
+    Compact list of commits, in graph row order.
+
+    Only the raw commit ids and the raw ids of their parents are stored, in
+    flat byte arrays (plus an index of where each commit's parents end), so
+    memory use stays low regardless of history length. Reading a row gives
+    you a MockCommit; use repo.peel_commit to get the full commit metadata.
+
+    The sequence may be appended to on a worker thread while the UI thread
+    reads from it. The parent index is always updated last, so readers never
+    see a half-appended commit.
+    """
+
+    __slots__ = ("_ids", "_parentIds", "_parentEnds")
+
+    def __init__(self, commits: Iterable = ()):
+        self._ids = bytearray()
+        self._parentIds = bytearray()
+        self._parentEnds = array("I")
+
+        if isinstance(commits, CommitSequence):
+            # Copy the parent index first: the other buffers may only be
+            # longer than the index says (if commits are being appended).
+            ends = array("I", commits._parentEnds)
+            numParents = ends[-1] if ends else 0
+            self._ids[:] = commits._ids[:len(ends) * OID_SIZE]
+            self._parentIds[:] = commits._parentIds[:numParents * OID_SIZE]
+            self._parentEnds = ends
+        else:
+            self.extend(commits)
+
+    def __len__(self):
+        return len(self._parentEnds)
+
+    def __repr__(self):
+        return f"CommitSequence({len(self)} commits)"
+
+    def __getitem__(self, index: int | slice) -> MockCommit | CommitSequence:
+        if isinstance(index, slice):
+            return self._slice(*index.indices(len(self)))
+        return MockCommit(self.oidAt(index), self.parentIdsAt(index))
+
+    def __iter__(self) -> Iterator[MockCommit]:
+        for row in range(len(self)):
+            yield MockCommit(self.oidAt(row), self.parentIdsAt(row))
+
+    def __add__(self, other: Iterable) -> CommitSequence:
+        result = CommitSequence(self)
+        result.extend(other)
+        return result
+
+    def __radd__(self, other: Iterable) -> CommitSequence:
+        result = CommitSequence(other)
+        result.extend(self)
+        return result
+
+    def _normalizeRow(self, row: int) -> int:
+        n = len(self)
+        if row < 0:
+            row += n
+        if not 0 <= row < n:
+            raise IndexError("commit sequence index out of range")
+        return row
+
+    def _parentSpan(self, row: int) -> tuple[int, int]:
+        end = self._parentEnds[row]
+        start = self._parentEnds[row - 1] if row > 0 else 0
+        return start, end
+
+    def oidAt(self, row: int) -> Oid:
+        row = self._normalizeRow(row)
+        offset = row * OID_SIZE
+        return Oid(raw=bytes(self._ids[offset: offset + OID_SIZE]))
+
+    def parentIdsAt(self, row: int) -> list[Oid]:
+        row = self._normalizeRow(row)
+        start, end = self._parentSpan(row)
+        parentIds = self._parentIds
+        return [Oid(raw=bytes(parentIds[i * OID_SIZE: (i + 1) * OID_SIZE])) for i in range(start, end)]
+
+    def rawIdAt(self, row: int) -> bytes:
+        row = self._normalizeRow(row)
+        offset = row * OID_SIZE
+        return bytes(self._ids[offset: offset + OID_SIZE])
+
+    def rawIdsBetween(self, start: int, stop: int) -> bytes:
+        """ Return the raw ids of the commits from start to stop (exclusive), back to back. """
+        stop = min(stop, len(self))
+        start = min(max(start, 0), stop)
+        return bytes(self._ids[start * OID_SIZE: stop * OID_SIZE])
+
+    def iterRaw(self) -> Iterator[tuple[bytes, tuple[bytes, ...]]]:
+        """ Yield the raw id and the raw parent ids of each commit, without creating any Oids. """
+        ids = bytes(self._ids)
+        parentIds = bytes(self._parentIds)
+        start = 0
+        for row, end in enumerate(self._parentEnds):
+            yield (ids[row * OID_SIZE: (row + 1) * OID_SIZE],
+                   tuple(parentIds[i * OID_SIZE: (i + 1) * OID_SIZE] for i in range(start, end)))
+            start = end
+
+    def buffers(self) -> tuple[bytes, bytes, array]:
+        """
+        Return a consistent snapshot of the raw ids, the raw parent ids, and
+        the index of where each commit's parents end.
+        """
+        ends = array("I", self._parentEnds)
+        numParents = ends[-1] if ends else 0
+        return bytes(self._ids[:len(ends) * OID_SIZE]), bytes(self._parentIds[:numParents * OID_SIZE]), ends
+
+    def append(self, commit):
+        self.appendRaw(commit.id.raw, [p.raw for p in commit.parent_ids])
+
+    def appendRaw(self, raw: bytes, parentRaws: Iterable[bytes]):
+        assert len(raw) == OID_SIZE
+        numParents = self._parentEnds[-1] if self._parentEnds else 0
+        for parentRaw in parentRaws:
+            assert len(parentRaw) == OID_SIZE
+            self._parentIds += parentRaw
+            numParents += 1
+        self._ids += raw
+        self._parentEnds.append(numParents)  # last, so the row only becomes visible once it's complete
+
+    def extend(self, commits: Iterable):
+        if isinstance(commits, CommitSequence):
+            commits = commits.copy()  # consistent snapshot
+            base = self._parentEnds[-1] if self._parentEnds else 0
+            self._parentIds += commits._parentIds
+            self._ids += commits._ids
+            self._parentEnds.extend(end + base for end in commits._parentEnds)
+        else:
+            for commit in commits:
+                self.append(commit)
+
+    def clear(self):
+        self._parentEnds = array("I")
+        self._ids = bytearray()
+        self._parentIds = bytearray()
+
+    def copy(self) -> CommitSequence:
+        return CommitSequence(self)
+
+    def _slice(self, start: int, stop: int, step: int) -> CommitSequence:
+        result = CommitSequence()
+        if step != 1:
+            result.extend(self[row] for row in range(start, stop, step))
+            return result
+
+        if stop <= start:
+            return result
+
+        parentStart = self._parentSpan(start)[0]
+        parentStop = self._parentEnds[stop - 1]
+        result._ids[:] = self._ids[start * OID_SIZE: stop * OID_SIZE]
+        result._parentIds[:] = self._parentIds[parentStart * OID_SIZE: parentStop * OID_SIZE]
+        result._parentEnds = array("I", (end - parentStart for end in self._parentEnds[start:stop]))
+        return result
+
+    def memoryFootprint(self) -> int:
+        """ Approximate size of the sequence's buffers, in bytes. """
+        return len(self._ids) + len(self._parentIds) + self._parentEnds.itemsize * len(self._parentEnds)
@@ -8,6 +8,8 @@ from __future__ import annotations
 
 import bisect
 import logging
+import operator
+from collections import OrderedDict
 from dataclasses import dataclass
 from collections.abc import Iterable, Iterator, Set
 from typing import ClassVar
@@ -27,10 +29,26 @@ The bigger the interval...:
 - but slower random access to any point of the graph.
 """
 
+KF_VOLATILE_BUDGET = 16 * 1024 * 1024
+"""
+Approximate memory budget (in bytes) for the volatile keyframes that
+Graph.startPlayback saves while seeking through the graph. When the budget is
+exceeded, the least-recently used volatile keyframes are evicted.
+
+Keyframes saved at KF_INTERVAL while preparing the graph are pinned: they are
+never evicted and they don't count towards this budget.
+"""
+
 DEAD_VALUE = Oid(hex="deaddeaddeaddeaddeaddeaddeaddeaddeaddead")
 
+_batchOffsets: list[int] = []
+"""
+Global offset of each batch (shared with BatchRow.BatchManager.globalOffsets).
+Must only ever be modified in place so that both names keep pointing to the same list.
+"""
+
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class BatchRow:
     """
     For a row in the Graph, BatchRow keeps track of the row's batch number
@@ -44,6 +62,10 @@ class BatchRow:
 
     Instead, we keep track of batches of rows inserted into the graph at each
     refresh. We adjust a single offset value for each batch.
+
+    Resolving a BatchRow to a global row index goes through Python-level
+    dunders, which adds up in hot loops. In tight loops, prefer converting
+    rows with int() once, then working with plain ints.
     """
 
     b: int = -1
@@ -60,7 +82,7 @@ class BatchRow:
         the lifespan of the app.
         """
 
-        globalOffsets: ClassVar[list[int]] = []
+        globalOffsets: ClassVar[list[int]] = _batchOffsets
         freeBatchNos: ClassVar[list[int]] = []
 
         @classmethod
@@ -113,9 +135,10 @@ class BatchRow:
         """Any BatchRow is convertible to int, giving a global row index.
         Note that the int value of any given BatchRow may change over time
         as the graph gets spliced."""
-        if self.b < 0:
+        b = self.b
+        if b < 0:
             return -1
-        return BatchRow.BatchManager.globalOffsets[self.b] + self.y
+        return _batchOffsets[b] + self.y
 
     # -------------------------------------------------------------------------
     # Arithmetics
@@ -156,7 +179,44 @@ BATCHROW_UNDEF = BatchRow(-1, -1)
 "Use this special BatchRow as a placeholder for a row position that is yet to be determined."
 
 
-@dataclass
+class CommitRowIndex(dict[Oid, BatchRow]):
+    """
+    Maps commit ids to their BatchRows in the graph.
+
+    Row shifts are handled by BatchRow.BatchManager, so splicing new commits
+    at the top of the graph never has to touch the index.
+    """
+
+    __slots__ = ()
+
+    def rowOf(self, oid: Oid) -> int:
+        """
+        Resolve a commit's global row index.
+        Raise KeyError if the commit isn't in the graph.
+
+        This is equivalent to int(index[oid]) but it skips the BatchRow
+        dunders, which adds up when looking up many rows.
+        """
+        row = self[oid]
+        return _batchOffsets[row.b] + row.y
+
+    def rowsOf(self, oids: Iterable[Oid]) -> list[int]:
+        """
+        Resolve the global row indices of several commits at once.
+        Commits that aren't in the graph are skipped.
+        """
+        offsets = _batchOffsets
+        rows = []
+        for oid in oids:
+            try:
+                row = self[oid]
+            except KeyError:
+                continue
+            rows.append(offsets[row.b] + row.y)
+        return rows
+
+
+@dataclass(slots=True)
 class ChainHandle:
     """ Object shared by arcs on the same chain. """
     _t: BatchRow = BATCHROW_UNDEF
@@ -218,7 +278,7 @@ class ChainHandle:
         self._b = BATCHROW_UNDEF
 
 
-@dataclass
+@dataclass(slots=True)
 class ArcJunction:
     """ Represents the merging of an Arc into another Arc. """
 
@@ -235,7 +295,7 @@ class ArcJunction:
         return self.joinedAt < other.joinedAt
 
 
-@dataclass
+@dataclass(slots=True)
 class Arc:
     """ An arc connects two commits in the graph.
 
@@ -245,6 +305,11 @@ class Arc:
     the commit's parent in the sequence, at which point we "close" it.
 
     Other arcs may merge into an open arc via an ArcJunction.
+
+    There may be millions of arcs in a large graph, so this class uses slots
+    to keep per-arc memory overhead down. For the same reason, arcs without
+    junctions share an immutable empty tuple instead of owning an empty list
+    (use addJunction to add a junction).
     """
 
     openedAt: BatchRow
@@ -265,7 +330,7 @@ class Arc:
     closedBy: Oid
     "Hash of the closing commit (in git parlance, the parent commit)"
 
-    junctions: list[ArcJunction]
+    junctions: list[ArcJunction] | tuple[()] = ()
     "Other arcs merging into this arc"
 
     nextArc: Arc | None = None
@@ -279,6 +344,12 @@ class Arc:
         dangling = "?" if not self.closedAt.isValid() else ""
         return f"Arc({self.chain} {ob}\u2192{cb}{dangling} {oa}\u2192{ca})"
 
+    def addJunction(self, junction: ArcJunction):
+        if not self.junctions:
+            self.junctions = [junction]
+        else:
+            self.junctions.append(junction)
+
     def length(self):
         assert type(self.openedAt) is BatchRow
         assert type(self.closedAt) is BatchRow
@@ -317,7 +388,7 @@ class Arc:
         ca = int(self.closedAt)
         return (0 <= ca < row) or (0 <= ca == self.openedAt <= row)
 
-    def isVisible(self, hiddenCommits: Set[Oid], row: int, filterJunctionRows=BatchRow.__lt__) -> bool:
+    def isVisible(self, hiddenCommits: Set[Oid], row: int, filterJunctionRows=operator.lt) -> bool:
         # FAIL if closing commit is hidden.
         if self.closedBy in hiddenCommits:
             return False
@@ -332,7 +403,7 @@ class Arc:
         for j in self.junctions:
             if j.joinedBy in hiddenCommits:
                 continue
-            if filterJunctionRows(j.joinedAt, row):
+            if filterJunctionRows(int(j.joinedAt), row):
                 return True
 
         # All junctions should be hidden.
@@ -376,7 +447,7 @@ class Frame:
 
         return gen
 
-    def arcsPassingByCommit(self, hiddenCommits: Set[Oid] | None = None, filterJunctionRows=BatchRow.__lt__):
+    def arcsPassingByCommit(self, hiddenCommits: Set[Oid] | None = None, filterJunctionRows=operator.lt):
         row = int(self.row)
         gen = (arc for arc in self.openArcs if arc and arc.openedAt != row)
 
@@ -388,7 +459,7 @@ class Frame:
 
     def junctionsAtCommit(self, hiddenCommits: Set[Oid]):
         row = int(self.row)
-        for arc in self.arcsPassingByCommit(hiddenCommits, BatchRow.__eq__):
+        for arc in self.arcsPassingByCommit(hiddenCommits, operator.eq):
             # TODO: We're looking at all the junctions here, but isVisible (via getArcsPassingByCommit)
             #       just looked at the specific junction we were looking for.
             for j in arc.junctions:
@@ -427,10 +498,11 @@ class Frame:
         """
         solvedArcsCopy = self.solvedArcs.copy()
         openArcsCopy = self.openArcs.copy()
+        row = int(self.row)
 
         # Move arcs that just got closed to solved list
         for lane, arc in enumerate(openArcsCopy):
-            if arc and 0 <= arc.closedAt <= self.row:
+            if arc and 0 <= int(arc.closedAt) <= row:
                 openArcsCopy[lane] = None
 
                 # For parentless commits, prevent bogus auto-closing arcs
@@ -440,8 +512,8 @@ class Frame:
                     solvedArcsCopy[lane] = arc
 
         # Remove stale closed arcs and trim "Nones" off end of list
-        self.cleanUpArcList(openArcsCopy, self.row, alsoTrimBack=True)
-        self.cleanUpArcList(solvedArcsCopy, self.row, alsoTrimBack=True)
+        self.cleanUpArcList(openArcsCopy, row, alsoTrimBack=True)
+        self.cleanUpArcList(solvedArcsCopy, row, alsoTrimBack=True)
 
         # In debug mode, make sure none of the arcs are dangling
         if DEVDEBUG:
@@ -460,10 +532,11 @@ class Frame:
             theList.append(None)
 
     @staticmethod
-    def cleanUpArcList(theList: list[Arc | None], olderThanRow: BatchRow, alsoTrimBack: bool = True):
+    def cleanUpArcList(theList: list[Arc | None], olderThanRow: BatchRow | int, alsoTrimBack: bool = True):
         # Remove references to arcs that were closed earlier than `olderThanRow`
+        olderThanRow = int(olderThanRow)
         for j, arc in enumerate(theList):
-            if arc and 0 <= arc.closedAt < olderThanRow:
+            if arc and 0 <= int(arc.closedAt) < olderThanRow:
                 theList[j] = None
 
         # Cull None items at the end of the list
@@ -492,7 +565,7 @@ class Frame:
         def genArcsBelow():
             gen = (arc for arc in self.openArcs if arc)
             if hiddenCommits:
-                gen = (arc for arc in gen if arc.isVisible(hiddenCommits, row, BatchRow.__le__))
+                gen = (arc for arc in gen if arc.isVisible(hiddenCommits, row, operator.le))
             yield from gen
 
         # Sort arcs by Chain Birth Row
@@ -550,17 +623,21 @@ class PlaybackState(Frame):
 
         goalFound = False
         goalRow = BATCHROW_UNDEF
+        goalRowInt = -1
         goalCommit = None
+        currentRowInt = int(self.row)
 
         while self.lastArc.nextArc:
             arc: Arc = self.lastArc.nextArc
+            openedAt = int(arc.openedAt)
 
-            if not goalFound and arc.openedAt > self.row:
+            if not goalFound and openedAt > currentRowInt:
                 # The goal row is determined by the first arc opened at a row greater than the player's current row.
                 goalFound = True
                 goalRow = arc.openedAt
+                goalRowInt = openedAt
                 goalCommit = arc.openedBy
-            elif goalFound and arc.openedAt > goalRow:
+            elif goalFound and openedAt > goalRowInt:
                 # If we went past the goal row, we have seen all arcs opened at the goal row. Stop.
                 break
             else:
@@ -593,25 +670,63 @@ class PlaybackState(Frame):
         return self
 
 
+@dataclass(slots=True)
+class KeyframeStats:
+    """ Counters for tuning the keyframe store. """
+
+    hits: int = 0
+    "Calls to Graph.getFrame that landed exactly on a keyframe."
+
+    misses: int = 0
+    "Calls to Graph.getFrame that had to play back the graph from a keyframe."
+
+    replayedRows: int = 0
+    "Total number of rows played back by Graph.startPlayback to reach the requested rows."
+
+    evictions: int = 0
+    "Volatile keyframes evicted to stay within the memory budget."
+
+
 class Graph:
     keyframes: list[Frame]
     keyframeRows: list[BatchRow]
 
+    volatileKeyframes: OrderedDict[int, Frame]
+    """
+    Keyframes saved by startPlayback, keyed by id(), from least to most
+    recently used. These are evictable, unlike the keyframes saved by
+    the graph builder. Every volatile keyframe also appears in `keyframes`.
+    """
+
+    volatileKeyframeBytes: int
+    volatileKeyframeBudget: int
+    keyframeStats: KeyframeStats
+
     startArc: Arc
     """
     Start sentinel of the linked list of Arcs. Guaranteed to never be None.
     Use startArc.nextArc to get to the first actual arc.
     """
 
-    commitRows: dict[Oid, BatchRow]
+    commitRows: CommitRowIndex
     ownBatches: list[int]
 
     volatilePlayer: PlaybackState | None
 
+    generation: int
+    """
+    Bumped every time the graph is spliced, so that anything derived
+    from the graph's frames knows when to recompute.
+    """
+
     def __init__(self):
         self.keyframes = []
         self.keyframeRows = []
-        self.commitRows = {}
+        self.volatileKeyframes = OrderedDict()
+        self.volatileKeyframeBytes = 0
+        self.volatileKeyframeBudget = KF_VOLATILE_BUDGET
+        self.keyframeStats = KeyframeStats()
+        self.commitRows = CommitRowIndex()
         self.startArc = Arc(
             openedAt=BATCHROW_UNDEF,
             closedAt=BATCHROW_UNDEF,
@@ -619,10 +734,10 @@ class Graph:
             lane=-1,
             openedBy="!TOP",
             closedBy="!BOTTOM",
-            junctions=[],
             nextArc=None)
         self.ownBatches = []
         self.volatilePlayer = None
+        self.generation = 0
 
     def __del__(self):
         self.freeOwnBatches()
@@ -640,6 +755,8 @@ class Graph:
 
         self.keyframes = source.keyframes
         self.keyframeRows = source.keyframeRows
+        self.volatileKeyframes = source.volatileKeyframes
+        self.volatileKeyframeBytes = source.volatileKeyframeBytes
         self.startArc = source.startArc
         self.commitRows = source.commitRows
         self.ownBatches = source.ownBatches
@@ -652,22 +769,77 @@ class Graph:
     def isEmpty(self):
         return self.startArc.nextArc is None
 
-    def getCommitRow(self, oid: Oid):
-        return int(self.commitRows[oid])
+    def getCommitRow(self, oid: Oid) -> int:
+        return self.commitRows.rowOf(oid)
 
-    def saveKeyframe(self, frame: Frame) -> int:
+    def saveKeyframe(self, frame: Frame, volatile: bool = False) -> int:
+        """
+        Save a sealed copy of `frame` as a keyframe; return its index into the list of keyframes.
+
+        Volatile keyframes may be evicted later on to stay within volatileKeyframeBudget.
+        """
         assert len(self.keyframes) == len(self.keyframeRows)
 
-        kfID = bisect.bisect_left(self.keyframeRows, frame.row)
+        kfID = bisect.bisect_left(self.keyframeRows, int(frame.row), key=int)
         if kfID < len(self.keyframes) and self.keyframes[kfID].row == frame.row:
             logger.info(f"Not overwriting existing keyframe {kfID}")
-            assert self.keyframes[kfID] == frame.sealCopy()
+            kf = self.keyframes[kfID]
+            assert kf == frame.sealCopy()
+            if not volatile and id(kf) in self.volatileKeyframes:
+                # Pin it
+                del self.volatileKeyframes[id(kf)]
+                self.volatileKeyframeBytes -= Graph.estimateKeyframeSize(kf)
         else:
             kf = frame.sealCopy()
             self.keyframes.insert(kfID, kf)
             self.keyframeRows.insert(kfID, frame.row)
+            if volatile:
+                self.volatileKeyframes[id(kf)] = kf
+                self.volatileKeyframeBytes += Graph.estimateKeyframeSize(kf)
+                if self.volatileKeyframeBytes > self.volatileKeyframeBudget:
+                    self.evictVolatileKeyframes()
+                    kfID = self.getBestKeyframeID(int(kf.row))
         return kfID
 
+    @staticmethod
+    def estimateKeyframeSize(kf: Frame) -> int:
+        """ Rough memory footprint of a sealed keyframe (the arcs themselves are shared with the graph). """
+        return 256 + 8 * (len(kf.solvedArcs) + len(kf.openArcs))
+
+    def touchKeyframe(self, kf: Frame):
+        """ Mark a volatile keyframe as most recently used. """
+        try:
+            self.volatileKeyframes.move_to_end(id(kf))
+        except KeyError:
+            pass
+
+    def evictVolatileKeyframes(self):
+        """
+        Evict least-recently used volatile keyframes until the volatile keyframes fit in the budget.
+        The most recently used volatile keyframe is always kept.
+        """
+        volatileKeyframes = self.volatileKeyframes
+
+        while self.volatileKeyframeBytes > self.volatileKeyframeBudget and len(volatileKeyframes) > 1:
+            _dummy, kf = volatileKeyframes.popitem(last=False)
+            self.volatileKeyframeBytes -= Graph.estimateKeyframeSize(kf)
+            self.keyframeStats.evictions += 1
+
+            kfID = bisect.bisect_left(self.keyframeRows, int(kf.row), key=int)
+            assert self.keyframes[kfID] is kf
+            del self.keyframes[kfID]
+            del self.keyframeRows[kfID]
+
+    def forgetDeadVolatileKeyframes(self):
+        """ Stop tracking volatile keyframes that were removed from the list of keyframes. """
+        if not self.volatileKeyframes:
+            return
+
+        alive = {id(kf) for kf in self.keyframes}
+        self.volatileKeyframes = OrderedDict(
+            (k, kf) for k, kf in self.volatileKeyframes.items() if k in alive)
+        self.volatileKeyframeBytes = sum(Graph.estimateKeyframeSize(kf) for kf in self.volatileKeyframes.values())
+
     def getBestKeyframeID(self, row: int) -> int:
         """
         Attempts to find a keyframe closest to `row` in the frame sequence.
@@ -683,7 +855,7 @@ class Graph:
         assert row >= 0
         assert len(self.keyframes) == len(self.keyframeRows)
 
-        bestKeyframeID = bisect.bisect_right(self.keyframeRows, row) - 1
+        bestKeyframeID = bisect.bisect_right(self.keyframeRows, row, key=int) - 1
         if bestKeyframeID < 0:
             return -1
 
@@ -696,6 +868,7 @@ class Graph:
         kfID = self.getBestKeyframeID(goalRow)
         if kfID >= 0:
             kf = self.keyframes[kfID]
+            self.touchKeyframe(kf)
         else:
             kf = self.initialKeyframe()
 
@@ -705,6 +878,7 @@ class Graph:
             player = PlaybackState(kf)
 
         # Position playback context on target row
+        startRow = int(player.row)
         try:
             volatileKeyframeCounter = 1
             assert player.row <= goalRow, f"{player.row} {goalRow}"
@@ -714,7 +888,7 @@ class Graph:
                 # Save keyframes every now and then
                 if player.row - kf.row >= volatileKeyframeCounter:
                     volatileKeyframeCounter *= 2
-                    self.saveKeyframe(player)
+                    self.saveKeyframe(player, volatile=True)
 
             assert player.row == goalRow
             player.callingNextWillAdvanceFrame = False  # let us re-obtain current frame by calling next()
@@ -723,6 +897,8 @@ class Graph:
             assert player.callingNextWillAdvanceFrame
             assert player.lastArc.nextArc is None
 
+        self.keyframeStats.replayedRows += int(player.row) - startRow
+
         if oneOff:
             self.volatilePlayer = player
 
@@ -740,8 +916,11 @@ class Graph:
         if kfID >= 0 and self.keyframes[kfID].row == row:
             # Cache hit
             frame = self.keyframes[kfID]
+            self.touchKeyframe(frame)
+            self.keyframeStats.hits += 1
         else:
             # Cache miss
+            self.keyframeStats.misses += 1
             frame = self.startPlayback(row)
             if not unsafe:
                 frame = frame.sealCopy()
@@ -749,6 +928,33 @@ class Graph:
         assert frame.row == row, f"frame({int(frame.row)})/row({row}) mismatch"
         return frame
 
+    def getFrames(self, startRow: int, stopRow: int) -> Iterator[Frame]:
+        """
+        Yield sealed frames for the rows from startRow to stopRow (exclusive),
+        or until the graph is depleted.
+
+        The whole range is produced by a single playback, which is much
+        cheaper than calling getFrame on each row. A volatile keyframe is saved
+        at the last row so that the next range can pick up from there.
+        """
+        assert 0 <= startRow
+        if startRow >= stopRow:
+            return
+
+        player = self.startPlayback(startRow)
+
+        for row in range(startRow, stopRow):
+            try:
+                player.advanceToNextRow()
+            except StopIteration:
+                return
+            assert int(player.row) == row
+            yield player.sealCopy()
+
+        kfID = self.getBestKeyframeID(stopRow - 1)
+        if kfID < 0 or self.keyframes[kfID].row != stopRow - 1:
+            self.saveKeyframe(player, volatile=True)
+
     def initialKeyframe(self):
         return Frame(
             row=BATCHROW_UNDEF,
@@ -789,6 +995,7 @@ class Graph:
         self.keyframes = self.keyframes[kfID:]
         self.keyframeRows = self.keyframeRows[kfID:]
         assert len(self.keyframes) == len(self.keyframeRows)
+        self.forgetDeadVolatileKeyframes()
 
     def deleteArcsDependingOnRowsAbove(self, row: int):
         """
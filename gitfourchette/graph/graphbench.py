@@ -0,0 +1,402 @@
+# -----------------------------------------------------------------------------
+# Copyright (C) 2025 Iliyas Jorio.
+# This file is part of GitFourchette, distributed under the GNU GPL v3.
+# For full terms, see the included LICENSE file.
+# -----------------------------------------------------------------------------
+
+"""
+Benchmarks for the graph engine.
+
+These run on synthetic commit sequences so that they don't depend on any
+particular repository being available on the machine. They can also run on
+the history of a real repository to catch regressions on actual topologies.
+
+Run with: python -m gitfourchette.graph bench --help
+"""
+
+from __future__ import annotations
+
+import bisect
+import dataclasses
+import random
+import time
+import tracemalloc
+from collections.abc import Callable
+
+from gitfourchette.graph import parenttable
+from gitfourchette.graph.commitsequence import CommitSequence as CompactCommitSequence
+from gitfourchette.graph.graph import BatchRow, Graph, Oid
+from gitfourchette.graph.graphbuilder import GraphBuildLoop, GraphSpliceLoop, MockCommit
+from gitfourchette.graph.graphtrickle import GraphTrickle
+from gitfourchette.graph.parenttable import ParentTable
+from gitfourchette.graph.reachability import ReachabilityIndex
+
+CommitSequence = list[MockCommit]
+
+
+def _oid(i: int) -> Oid:
+    # Use real Oids rather than MockOids, which hash much more slowly
+    return Oid(raw=i.to_bytes(20, "big"))
+
+
+def syntheticSequence(numCommits: int, mergeEvery: int = 7, mergeSpan: int = 5
+                      ) -> tuple[CommitSequence, set[Oid]]:
+    """
+    Generate a linear history of `numCommits` commits, with a merge commit
+    every `mergeEvery` commits pulling in a commit `mergeSpan` rows below.
+    """
+    oids = [_oid(i) for i in range(numCommits)]
+    sequence = []
+    for i, oid in enumerate(oids):
+        parents = []
+        if i + 1 < numCommits:
+            parents.append(oids[i + 1])
+        if mergeEvery and i % mergeEvery == 0 and i + mergeSpan < numCommits:
+            parents.append(oids[i + mergeSpan])
+        sequence.append(MockCommit(oid, parents))
+    heads = {oids[0]} if oids else set()
+    return sequence, heads
+
+
+def linearSequence(numCommits: int) -> tuple[CommitSequence, set[Oid]]:
+    """ Generate a single straight line of commits. """
+    return syntheticSequence(numCommits, mergeEvery=0)
+
+
+def octopusSequence(numCommits: int, width: int = 8) -> tuple[CommitSequence, set[Oid]]:
+    """
+    Generate a chain of octopus merges. Each merge has `width` parents, which
+    are single-commit side branches that all fork off the next merge down.
+    """
+    sequence = []
+    i = 0
+    merge = _oid(i)
+    heads = {merge}
+    while len(sequence) < numCommits:
+        sides = [_oid(i + 1 + j) for j in range(width)]
+        nextMerge = _oid(i + 1 + width)
+        sequence.append(MockCommit(merge, sides))
+        sequence.extend(MockCommit(side, [nextMerge]) for side in sides)
+        merge = nextMerge
+        i += 1 + width
+    sequence.append(MockCommit(merge, []))
+    return sequence, heads
+
+
+def parallelSequence(numCommits: int, numBranches: int = 2000) -> tuple[CommitSequence, set[Oid]]:
+    """
+    Generate `numBranches` branches that all run alongside each other (so they
+    occupy as many lanes at once), each forking off a different trunk commit.
+    """
+    numBranches = max(1, min(numBranches, numCommits // 2))
+    branchLength = max(1, (numCommits - numBranches) // numBranches)
+
+    trunk = [_oid(i) for i in range(numBranches)]
+    branches = [[_oid(numBranches + b * branchLength + d) for d in range(branchLength)]
+                for b in range(numBranches)]
+
+    sequence = []
+    for depth in range(branchLength):
+        for b, branch in enumerate(branches):
+            parent = branch[depth + 1] if depth + 1 < branchLength else trunk[b]
+            sequence.append(MockCommit(branch[depth], [parent]))
+    for t, oid in enumerate(trunk):
+        sequence.append(MockCommit(oid, [trunk[t + 1]] if t + 1 < len(trunk) else []))
+
+    heads = {branch[0] for branch in branches}
+    return sequence, heads
+
+
+def linuxLikeSequence(numCommits: int, seed: int = 0, maxTopics: int = 40) -> tuple[CommitSequence, set[Oid]]:
+    """
+    Generate a history resembling the Linux kernel's: a mainline that keeps
+    merging topic branches of various lengths, with dozens of topics in
+    flight at any given time.
+    """
+    rng = random.Random(seed)
+    counter = iter(range(1 << 62))
+    mainline = _oid(next(counter))
+    topics: list[Oid] = []
+    heads = {mainline}
+    sequence = []
+
+    while len(sequence) < numCommits:
+        if topics and rng.random() < 0.7:
+            # Commit on a topic branch; eventually it forks off the mainline
+            t = rng.randrange(len(topics))
+            oid = topics[t]
+            if rng.random() < 0.05:
+                sequence.append(MockCommit(oid, [mainline]))
+                del topics[t]
+            else:
+                parent = topics[t] = _oid(next(counter))
+                sequence.append(MockCommit(oid, [parent]))
+        else:
+            # Commit on the mainline; often a merge of a new topic
+            oid = mainline
+            mainline = _oid(next(counter))
+            parents = [mainline]
+            if len(topics) < maxTopics and rng.random() < 0.5:
+                topic = _oid(next(counter))
+                topics.append(topic)
+                parents.append(topic)
+            sequence.append(MockCommit(oid, parents))
+
+    # Wrap up dangling branches
+    for oid in topics:
+        sequence.append(MockCommit(oid, [mainline]))
+    sequence.append(MockCommit(mainline, []))
+    return sequence, heads
+
+
+SCENARIOS: dict[str, Callable[[int], tuple[CommitSequence, set[Oid]]]] = {
+    "linear": linearSequence,
+    "merges": syntheticSequence,
+    "octopus": octopusSequence,
+    "parallel": parallelSequence,
+    "linux": linuxLikeSequence,
+}
+
+
+def repoSequence(path: str) -> tuple[CommitSequence, set[Oid]]:
+    """ Walk the history of a real repository the same way the app does. """
+    from gitfourchette.porcelain import Repo, SortMode
+
+    repo = Repo(path)
+    tips = repo.map_refs_to_ids()
+    walker = repo.walk(None, SortMode.TOPOLOGICAL)
+    for tip in tips.values():
+        walker.push(tip)
+    sequence = [MockCommit(commit.id, commit.parent_ids) for commit in walker]
+    return sequence, set(tips.values())
+
+
+def measure(func: Callable[[], object], repeat: int = 3) -> float:
+    """ Return the best wall-clock time (in seconds) out of `repeat` calls to `func`. """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmarkRowResolution(graph: Graph, numRows: int) -> dict[str, float]:
+    """
+    Compare BatchRow dunder dispatch against rows that are resolved to plain
+    ints once, in the two hottest patterns of the graph engine: bisecting the
+    keyframe rows, and filtering arcs by their closing row.
+    """
+    keyframeRows = graph.keyframeRows
+    arcs = list(graph.startArc.nextArc or [])
+    probeRows = range(0, numRows, max(1, numRows // 1000))
+
+    def bisectDunder():
+        for row in probeRows:
+            bisect.bisect_right(keyframeRows, row)
+
+    def bisectResolved():
+        for row in probeRows:
+            bisect.bisect_right(keyframeRows, row, key=int)
+
+    midRow: BatchRow = graph.getFrame(numRows // 2).row
+
+    def filterDunder():
+        return sum(1 for arc in arcs if 0 <= arc.closedAt < midRow)
+
+    def filterResolved():
+        row = int(midRow)
+        return sum(1 for arc in arcs if 0 <= int(arc.closedAt) < row)
+
+    assert filterDunder() == filterResolved()
+
+    return {
+        "bisect keyframes (BatchRow)": measure(bisectDunder),
+        "bisect keyframes (int)": measure(bisectResolved),
+        "filter arcs (BatchRow)": measure(filterDunder),
+        "filter arcs (int)": measure(filterResolved),
+    }
+
+
+def benchmarkGraph(numCommits: int, keyframeInterval: int = 500) -> dict[str, float]:
+    """ Time the main stages of building and playing back a synthetic graph. """
+    sequence, heads = syntheticSequence(numCommits)
+    results = {}
+
+    start = time.perf_counter()
+    graph = GraphBuildLoop(heads, keyframeInterval=keyframeInterval).sendAll(sequence).graph
+    results["build"] = time.perf_counter() - start
+
+    def playback():
+        for frame in graph.startPlayback(0):
+            frame.sealCopy()
+
+    def randomAccess():
+        for row in range(0, numCommits, max(1, numCommits // 1000)):
+            graph.getFrame(row)
+
+    results["playback + seal"] = measure(playback, repeat=1)
+    results["random access"] = measure(randomAccess, repeat=1)
+    results.update(benchmarkRowResolution(graph, numCommits))
+    return results
+
+
+@dataclasses.dataclass
+class StageTiming:
+    seconds: float
+    rows: int = 0
+    "Number of rows processed in this stage (0 if not applicable)."
+
+    @property
+    def rowsPerSecond(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else float("inf")
+
+
+def benchmarkSequence(sequence: CommitSequence, heads: set[Oid],
+                      keyframeInterval: int = 5000, numSamples: int = 1000,
+                      ) -> tuple[dict[str, StageTiming], int]:
+    """
+    Time the main stages of the graph engine on a commit sequence.
+    Return the timings of each stage, and the peak memory (in bytes) used to build the graph.
+    """
+    numCommits = len(sequence)
+    timings = {}
+
+    def timeStage(name: str, func: Callable[[], object], rows: int):
+        start = time.perf_counter()
+        result = func()
+        timings[name] = StageTiming(time.perf_counter() - start, rows)
+        return result
+
+    def build() -> Graph:
+        return GraphBuildLoop(heads, keyframeInterval=keyframeInterval).sendAll(sequence).graph
+
+    graph = timeStage("build", build, numCommits)
+
+    # Peak memory is measured in a separate pass since tracing slows down the build
+    tracemalloc.start()
+    try:
+        build()
+        _dummy, peakMemory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    # Splice new commits on top of the first head
+    numNewCommits = 10
+    firstHead = sequence[0].id
+    newCommits = [MockCommit(_oid((1 << 150) + i), [_oid((1 << 150) + i + 1)]) for i in range(numNewCommits)]
+    newCommits[-1] = MockCommit(newCommits[-1].id, [firstHead])
+    newHeads = (heads - {firstHead}) | {newCommits[0].id}
+    newSequence = newCommits + sequence
+    splicedGraph = build()
+    timeStage("splice", lambda: GraphSpliceLoop(splicedGraph, sequence, heads, newHeads,
+                                                keyframeInterval=keyframeInterval).sendAll(newSequence),
+              numNewCommits)
+
+    # Random access
+    rng = random.Random(0)
+    sampleRows = [rng.randrange(numCommits) for _ in range(numSamples)]
+
+    def randomAccess():
+        for row in sampleRows:
+            graph.getFrame(row)
+
+    timeStage("getFrame (random)", randomAccess, numSamples)
+    timeStage("getFrame (warm)", randomAccess, numSamples)
+
+    frames = [graph.getFrame(row) for row in sampleRows]
+    noHiddenCommits = set()
+
+    def flattenLanes():
+        for frame in frames:
+            frame.flattenLanes(noHiddenCommits)
+
+    timeStage("flattenLanes", flattenLanes, numSamples)
+
+    # Trickles: hide every other head (or the only head), and consider every other head local
+    sortedHeads = sorted(heads)
+    hideSeeds = set(sortedHeads[1::2] or sortedHeads[:1])
+    localSeeds = set(sortedHeads[1::2])
+
+    for name, trickle in [("hidden trickle", GraphTrickle.newHiddenTrickle(heads, hideSeeds)),
+                          ("foreign trickle", GraphTrickle.newForeignTrickle(heads, localSeeds))]:
+        start = time.perf_counter()
+        rows = 0
+        for commit in sequence:
+            if trickle.done:
+                break
+            trickle.newCommit(commit.id, commit.parent_ids)
+            rows += 1
+        timings[name] = StageTiming(time.perf_counter() - start, rows)
+
+    if parenttable.numpyAvailable:
+        commitSequence = CompactCommitSequence(sequence)
+        trickles = [GraphTrickle.newHiddenTrickle(heads, hideSeeds), GraphTrickle.newForeignTrickle(heads, localSeeds)]
+        timeStage("trickles (parent table)", lambda: ParentTable.trickleAll(commitSequence, trickles), numCommits)
+
+    # Reachability index: one branch per head, then fast-forward the first branch onto the new commits
+    refs = {f"refs/heads/b{i}": head for i, head in enumerate(sortedHeads)}
+    refs["refs/heads/first"] = firstHead
+    compactSequence = CompactCommitSequence(sequence)
+    index = timeStage("reachability index", lambda: ReachabilityIndex.build(compactSequence, refs), numCommits)
+    newRefs = refs | {"refs/heads/first": newCommits[0].id}
+    compactNewSequence = CompactCommitSequence(newSequence)
+    timeStage("reachability splice", lambda: index.spliced(compactNewSequence, numNewCommits, 0, newRefs),
+              numNewCommits)
+
+    return timings, peakMemory
+
+
+def printTimings(title: str, timings: dict[str, StageTiming], peakMemory: int):
+    print(f"{title}")
+    width = max(len(k) for k in timings)
+    for name, timing in timings.items():
+        rate = f"{timing.rowsPerSecond:14,.0f} rows/s" if timing.rows else ""
+        print(f"  {name:<{width}} {1000 * timing.seconds:10.2f} ms {rate}")
+    print(f"  {'peak memory':<{width}} {peakMemory / 1024 / 1024:10.2f} MB (build)")
+
+
+def printResults(results: dict[str, float]):
+    width = max(len(k) for k in results)
+    for name, seconds in results.items():
+        print(f"{name:<{width}} {1000 * seconds:10.2f} ms")
+
+
+def main(argv: list[str] | None = None):
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(prog="python -m gitfourchette.graph bench",
+                            description="GitFourchette graph engine benchmarks")
+    parser.add_argument("scenarios", nargs="*", metavar="scenario",
+                        help=f"Synthetic histories to benchmark: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("-n", "--commits", type=int, default=100_000, help="Size of the synthetic histories")
+    parser.add_argument("-r", "--repo", action="append", default=[], help="Path to a real repository to benchmark")
+    parser.add_argument("-k", "--keyframe-interval", type=int, default=5000)
+    parser.add_argument("--row-resolution", action="store_true", help="Also compare BatchRow/int row resolution")
+    args = parser.parse_args(argv)
+
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario '{name}'")
+
+    scenarios = args.scenarios or ([] if args.repo else list(SCENARIOS))
+
+    for name in scenarios:
+        sequence, heads = SCENARIOS[name](args.commits)
+        timings, peakMemory = benchmarkSequence(sequence, heads, args.keyframe_interval)
+        printTimings(f"{name} ({len(sequence):,} commits, {len(heads):,} heads)", timings, peakMemory)
+
+    for path in args.repo:
+        start = time.perf_counter()
+        sequence, heads = repoSequence(path)
+        walkTime = time.perf_counter() - start
+        timings, peakMemory = benchmarkSequence(sequence, heads, args.keyframe_interval)
+        timings = {"walk": StageTiming(walkTime, len(sequence))} | timings
+        printTimings(f"{path} ({len(sequence):,} commits, {len(heads):,} heads)", timings, peakMemory)
+
+    if args.row_resolution:
+        printResults(benchmarkGraph(args.commits, args.keyframe_interval))
+
+
+if __name__ == "__main__":
+    main()
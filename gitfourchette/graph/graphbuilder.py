@@ -18,6 +18,9 @@ from gitfourchette.toolbox import Benchmark
 
 logger = logging.getLogger(__name__)
 
+TRICKLE_BATCH_SIZE = 20000
+"Number of commits that GraphBuildLoop feeds to the trickles at once in batch mode."
+
 
 def _ensureSet(x) -> set:
     if x is None:
@@ -97,8 +100,14 @@ class GraphBuildLoop:
             hideSeeds=None,
             localSeeds=None,
             forceHide=None,
-            keyframeInterval=KF_INTERVAL
+            keyframeInterval=KF_INTERVAL,
+            batchTrickles=False
     ):
+        """
+        If batchTrickles is True, commits are fed to the trickles in large
+        batches (see flushTrickles) rather than one at a time. This requires
+        NumPy.
+        """
         heads = _ensureSet(heads)
         hideSeeds = _ensureSet(hideSeeds)
         # If localSeeds was omitted, all heads are local by default
@@ -108,6 +117,12 @@ class GraphBuildLoop:
         self.hiddenTrickle = GraphTrickle.newHiddenTrickle(heads, hideSeeds, forceHide)
         self.foreignTrickle = GraphTrickle.newForeignTrickle(heads, localSeeds)
         self.keyframeInterval = keyframeInterval
+        self.pendingKeyframes = None
+        self.pendingTrickleCommits = None
+
+        if batchTrickles:
+            from gitfourchette.graph.commitsequence import CommitSequence  # circular import
+            self.pendingTrickleCommits = CommitSequence()
 
         self.onKeyframe = GraphBuildLoop.defaultOnKeyframe
 
@@ -123,25 +138,81 @@ class GraphBuildLoop:
     def defaultOnKeyframe(i: int):
         pass
 
+    def deferKeyframes(self):
+        """
+        Hold on to new keyframes instead of saving them into the graph right
+        away. This lets another thread play back the rows that have already
+        been woven while the build is still in progress. That thread must call
+        flushKeyframes() to save the pending keyframes into the graph.
+        """
+        if self.pendingKeyframes is None:
+            self.pendingKeyframes = []
+
+    def flushKeyframes(self):
+        if not self.pendingKeyframes:
+            return
+        for keyframe in self.pendingKeyframes:
+            self.graph.saveKeyframe(keyframe)
+        self.pendingKeyframes.clear()
+
+    def flushTrickles(self):
+        """
+        Feed the commits that are waiting for the trickles in a single batch,
+        so that hiddenCommits and foreignCommits are up to date with all the
+        commits sent to the build loop so far.
+        """
+        pending = self.pendingTrickleCommits
+        if not pending:
+            return
+
+        from gitfourchette.graph.parenttable import ParentTable  # circular import
+        ParentTable.trickleAll(pending, [self.hiddenTrickle, self.foreignTrickle])
+        pending.clear()
+
+    def takeFlaggedCommits(self) -> tuple[set[Oid], set[Oid]]:
+        """
+        Hand over the commits that have been flagged as hidden and foreign so
+        far, and start collecting new flags into fresh sets. This lets another
+        thread keep its own copy of the flags, which the build loop won't
+        touch behind its back. In batch mode, call flushTrickles() first.
+        """
+        hidden = self.hiddenTrickle.flaggedSet
+        foreign = self.foreignTrickle.flaggedSet
+        self.hiddenTrickle.flaggedSet = set()
+        self.foreignTrickle.flaggedSet = set()
+        return hidden, foreign
+
     def coBuild(self):
         graph = self.graph
         weaver = self.weaver
         hiddenTrickle = self.hiddenTrickle
         foreignTrickle = self.foreignTrickle
+        pendingTrickleCommits = self.pendingTrickleCommits
         keyframeInterval = self.keyframeInterval
 
         while True:
             try:
                 commit = yield
             except GeneratorExit:
+                self.flushTrickles()
                 break
 
             oid = commit.id
             parents = commit.parent_ids
 
             weaver.newCommit(oid, parents)
-            hiddenTrickle.newCommit(oid, parents)
-            foreignTrickle.newCommit(oid, parents)
+
+            # Once a trickle is done, it won't flag any more commits
+            if pendingTrickleCommits is not None:
+                if not (hiddenTrickle.done and foreignTrickle.done):
+                    pendingTrickleCommits.append(commit)
+                    if len(pendingTrickleCommits) >= TRICKLE_BATCH_SIZE:
+                        self.flushTrickles()
+            else:
+                if not hiddenTrickle.done:
+                    hiddenTrickle.newCommit(oid, parents)
+                if not foreignTrickle.done:
+                    foreignTrickle.newCommit(oid, parents)
 
             row = weaver.row
             rowInt = int(row)
@@ -151,7 +222,10 @@ class GraphBuildLoop:
 
             # Save keyframes at regular intervals for faster random access.
             if rowInt % keyframeInterval == 0:
-                graph.saveKeyframe(weaver)
+                if self.pendingKeyframes is None:
+                    graph.saveKeyframe(weaver)
+                else:
+                    self.pendingKeyframes.append(weaver.sealCopy())
                 self.onKeyframe(rowInt)
 
         logger.debug(f"Peak arc count: {weaver.peakArcCount}")
@@ -175,7 +249,13 @@ class GraphSpliceLoop:
             hideSeeds: Set[Oid] | None = None,
             localSeeds: Set[Oid] | None = None,
             keyframeInterval=KF_INTERVAL,
+            deferSwap=False,
     ):
+        """
+        If deferSwap is True, the spliced graph front is kept aside until you
+        call swap(). This lets you run the splice loop on a worker thread
+        without disturbing readers of the graph on the UI thread.
+        """
         oldHeads = _ensureSet(oldHeads)
         newHeads = _ensureSet(newHeads)
         hideSeeds = _ensureSet(hideSeeds)
@@ -190,6 +270,7 @@ class GraphSpliceLoop:
         self.hideSeeds = hideSeeds
         self.localSeeds = localSeeds
         self.keyframeInterval = keyframeInterval
+        self.deferSwap = deferSwap
 
         self.splicer = GraphSplicer(self.graph, self.oldHeads, self.newHeads)
         self.hiddenTrickle = GraphTrickle.newHiddenTrickle(self.newHeads, self.hideSeeds)
@@ -226,8 +307,10 @@ class GraphSpliceLoop:
 
             newCommitSequence.append(commit)
             splicer.spliceNewCommit(oid, parents, self.keyframeInterval)
-            hiddenTrickle.newCommit(oid, parents)
-            foreignTrickle.newCommit(oid, parents)
+            if not hiddenTrickle.done:
+                hiddenTrickle.newCommit(oid, parents)
+            if not foreignTrickle.done:
+                foreignTrickle.newCommit(oid, parents)
 
         if splicer.foundEquilibrium:
             nRemoved = splicer.equilibriumOldRow
@@ -260,6 +343,14 @@ class GraphSpliceLoop:
         self.numRowsAdded = nAdded
         self.commitSequence = newCommitSequence
 
+        if not self.deferSwap:
+            self.swap()
+
+    def swap(self):
+        """ Patch the spliced graph front into the graph. """
+        with Benchmark("Swap graph front"):
+            self.splicer.apply()
+
     @staticmethod
     def _stabilizeTrickle(trickle: GraphTrickle, startRow: int, newCommitSequence: list[MockCommit]):
         if trickle.done:
@@ -269,8 +360,7 @@ class GraphSpliceLoop:
             commit = newCommitSequence[row]
             trickle.newCommit(commit.id, commit.parent_ids)
 
-            # See if finished (not too often - expensive)
-            if ((row & 0xFF) == 0) and trickle.done:
+            if trickle.done:
                 return row
 
     @property
@@ -0,0 +1,243 @@
+# -----------------------------------------------------------------------------
+# Copyright (C) 2025 Iliyas Jorio.
+# This file is part of GitFourchette, distributed under the GNU GPL v3.
+# For full terms, see the included LICENSE file.
+# -----------------------------------------------------------------------------
+
+"""
+Persist a woven Graph and its commit sequence to disk, so that reopening a
+large repository doesn't have to walk and weave the entire history again.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import logging
+import marshal
+import os
+from collections.abc import Sequence
+
+from gitfourchette.graph.graph import (
+    Arc,
+    ArcJunction,
+    BATCHROW_UNDEF,
+    BatchRow,
+    ChainHandle,
+    Frame,
+    Graph,
+    Oid,
+)
+from gitfourchette.graph.commitsequence import CommitSequence
+from gitfourchette.graph.graphbuilder import MockCommit
+from gitfourchette.porcelain import Commit
+from gitfourchette.toolbox import Benchmark
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class GraphCache:
+    """
+    Snapshot of a fully-woven graph, along with everything needed to tell
+    whether the snapshot is still valid for a repository.
+
+    All rows in the snapshot are flattened to plain ints. When the snapshot is
+    turned back into a Graph, all rows are placed in a single fresh batch.
+    """
+
+    FORMAT_VERSION = 1
+
+    refs: dict[str, Oid]
+    "Ref tips at the time the graph was woven (keys the cache)."
+
+    sortKey: str
+    "Commit sort order used by the walker (the graph is only valid for this order)."
+
+    sequence: Sequence[Commit | MockCommit]
+    "Commit sequence. Only ids and parent ids are saved; loading yields a CommitSequence."
+
+    graph: Graph
+
+    hideSeeds: set[Oid] = dataclasses.field(default_factory=set)
+    localSeeds: set[Oid] = dataclasses.field(default_factory=set)
+    hiddenCommits: set[Oid] = dataclasses.field(default_factory=set)
+    foreignCommits: set[Oid] = dataclasses.field(default_factory=set)
+
+    # -------------------------------------------------------------------------
+    # File I/O
+
+    def save(self, path: str):
+        with Benchmark("GraphCache/Serialize"):
+            blob = marshal.dumps(self._encode())
+
+        with Benchmark("GraphCache/Write"):
+            tempPath = path + ".tmp"
+            with open(tempPath, "wb") as f:
+                f.write(blob)
+            os.replace(tempPath, path)
+
+        logger.debug(f"Wrote graph cache: {len(self.sequence)} commits, {len(blob) // 1024:,d}K")
+
+    @staticmethod
+    def load(path: str) -> GraphCache | None:
+        """
+        Load a graph cache from disk.
+        Return None if the file doesn't exist or if it can't be decoded.
+        """
+        try:
+            with open(path, "rb") as f:
+                blob = f.read()
+        except OSError:
+            return None
+
+        try:
+            with Benchmark("GraphCache/Deserialize"):
+                return GraphCache._decode(marshal.loads(blob))
+        except (ValueError, TypeError, EOFError, KeyError, IndexError) as exc:
+            logger.warning(f"Ignoring unreadable graph cache {path}: {exc}")
+            return None
+
+    @staticmethod
+    def delete(path: str):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    # -------------------------------------------------------------------------
+    # Encoding
+
+    def _encode(self) -> tuple:
+        graph = self.graph
+
+        def raws(oids) -> tuple:
+            return tuple(oid.raw for oid in oids)
+
+        # Number the chains (resolving aliases) and the arcs
+        chainIndex: dict[int, int] = {}
+        chains = []
+        arcIndex: dict[int, int] = {id(graph.startArc): -1}
+        arcs = []
+
+        if graph.startArc.nextArc is not None:
+            for arc in graph.startArc.nextArc:
+                chain = arc.chain.resolve()
+                try:
+                    ci = chainIndex[id(chain)]
+                except KeyError:
+                    ci = len(chains)
+                    chainIndex[id(chain)] = ci
+                    chains.append((int(chain._t), int(chain._b)))
+
+                arcIndex[id(arc)] = len(arcs)
+                junctions = tuple((int(j.joinedAt), j.joinedBy.raw) for j in arc.junctions)
+                arcs.append((int(arc.openedAt), int(arc.closedAt), ci, arc.lane,
+                             arc.openedBy.raw, arc.closedBy.raw, junctions))
+
+        def arcList(theList: list[Arc | None]) -> tuple:
+            return tuple(-2 if arc is None else arcIndex[id(arc)] for arc in theList)
+
+        # The UI thread may be saving volatile keyframes as we go, so work off a copy.
+        # Volatile keyframes are an artifact of the session's seeks; only persist pinned keyframes.
+        volatileKeyframes = graph.volatileKeyframes
+        keyframes = tuple(
+            (int(kf.row), kf.commit.raw, arcList(kf.solvedArcs), arcList(kf.openArcs), arcIndex[id(kf.lastArc)])
+            for kf in graph.keyframes.copy()
+            if id(kf) not in volatileKeyframes)
+
+        if isinstance(self.sequence, CommitSequence):
+            sequence = tuple(self.sequence.iterRaw())
+        else:
+            sequence = tuple((c.id.raw, raws(c.parent_ids)) for c in self.sequence)
+
+        refs = {name: oid.raw for name, oid in self.refs.items()}
+
+        return (
+            GraphCache.FORMAT_VERSION,
+            self.sortKey,
+            refs,
+            sequence,
+            tuple(chains),
+            tuple(arcs),
+            keyframes,
+            raws(self.hideSeeds),
+            raws(self.localSeeds),
+            raws(self.hiddenCommits),
+            raws(self.foreignCommits),
+        )
+
+    @staticmethod
+    def _decode(data: tuple) -> GraphCache:
+        if type(data) is not tuple or not data or data[0] != GraphCache.FORMAT_VERSION:
+            raise ValueError("unsupported graph cache version")
+
+        (_version, sortKey, refsData, sequenceData, chainData, arcData, keyframeData,
+         hideSeedData, localSeedData, hiddenData, foreignData) = data
+
+        oids: dict[bytes, Oid] = {}
+
+        def oid(raw: bytes) -> Oid:
+            # Share Oid instances across the cache to save memory
+            try:
+                return oids[raw]
+            except KeyError:
+                o = oids[raw] = Oid(raw=raw)
+                return o
+
+        graph = Graph()
+        batchNo = BatchRow.BatchManager.reserveNewBatch()
+        graph.ownBatches.append(batchNo)
+
+        rows: list[BatchRow] = []
+
+        def row(y: int) -> BatchRow:
+            if y < 0:
+                return BATCHROW_UNDEF
+            # Share BatchRow instances across the cache to save memory
+            while len(rows) <= y:
+                rows.append(BatchRow(batchNo, len(rows)))
+            return rows[y]
+
+        sequence = CommitSequence()
+        for y, (raw, parentRaws) in enumerate(sequenceData):
+            sequence.appendRaw(raw, parentRaws)
+            graph.commitRows[oid(raw)] = row(y)
+
+        chains = [ChainHandle(row(t), row(b)) for t, b in chainData]
+
+        arcs = []
+        lastArc = graph.startArc
+        for openedAt, closedAt, ci, lane, openedBy, closedBy, junctionData in arcData:
+            arc = Arc(openedAt=row(openedAt), closedAt=row(closedAt), chain=chains[ci], lane=lane,
+                      openedBy=oid(openedBy), closedBy=oid(closedBy))
+            for j, jb in junctionData:
+                arc.addJunction(ArcJunction(joinedAt=row(j), joinedBy=oid(jb)))
+            lastArc.nextArc = arc
+            lastArc = arc
+            arcs.append(arc)
+
+        def arc(i: int) -> Arc | None:
+            if i == -2:
+                return None
+            elif i == -1:
+                return graph.startArc
+            return arcs[i]
+
+        for y, commit, solvedData, openData, lastArcIndex in keyframeData:
+            kf = Frame(row=row(y), commit=oid(commit),
+                       solvedArcs=[arc(i) for i in solvedData],
+                       openArcs=[arc(i) for i in openData],
+                       lastArc=arc(lastArcIndex))
+            graph.keyframes.append(kf)
+            graph.keyframeRows.append(kf.row)
+
+        return GraphCache(
+            refs={name: oid(raw) for name, raw in refsData.items()},
+            sortKey=sortKey,
+            sequence=sequence,
+            graph=graph,
+            hideSeeds={oid(raw) for raw in hideSeedData},
+            localSeeds={oid(raw) for raw in localSeedData},
+            hiddenCommits={oid(raw) for raw in hiddenData},
+            foreignCommits={oid(raw) for raw in foreignData},
+        )
@@ -28,6 +28,7 @@ logger = logging.getLogger(__name__)
 class GraphSplicer:
     def __init__(self, oldGraph: Graph, oldHeads: Iterable[Oid], newHeads: Iterable[Oid]):
         self.done = False
+        self.applied = False
         self.foundEquilibrium = False
         self.equilibriumNewRow = -1
         self.equilibriumOldRow = -1
@@ -120,6 +121,40 @@ class GraphSplicer:
 
         logger.debug(f"Equilibrium: commit={str(self.oldPlayer.commit):.7} new={equilibriumNewRow} old={equilibriumOldRow}")
 
+    def onGraphDepleted(self):
+        """Completion without equilibrium: no more commits in oldGraph"""
+
+        self.done = True
+
+        # If we exited the loop without reaching equilibrium, the whole graph has changed.
+        # apply() will make oldGraph steal the contents of newGraph.
+
+        self.equilibriumOldRow = int(self.oldPlayer.row)
+        self.equilibriumNewRow = int(self.weaver.row)
+        self.oldGraphRowOffset = 0
+
+    def apply(self):
+        """
+        Patch the new graph front into oldGraph.
+
+        Until this is called, oldGraph is left untouched by the splicer, so
+        the splicing work may run on a worker thread while the UI keeps
+        reading oldGraph. Call this once the splicer is done.
+        """
+
+        assert self.done
+        assert not self.applied
+        self.applied = True
+
+        if not self.foundEquilibrium:
+            self.oldGraph.shallowCopyFrom(self.newGraph)
+            self.oldGraph.generation += 1
+            return
+
+        equilibriumNewRow = self.equilibriumNewRow
+        equilibriumOldRow = self.equilibriumOldRow
+        rowShiftInOldGraph = self.oldGraphRowOffset
+
         # We can bail now if nothing changed.
         if equilibriumOldRow == 0 and equilibriumNewRow == 0:
             return
@@ -181,20 +216,7 @@ class GraphSplicer:
 
         # Invalidate volatile player, which may be referring to dead keyframes
         self.oldGraph.volatilePlayer = None
-
-    def onGraphDepleted(self):
-        """Completion without equilibrium: no more commits in oldGraph"""
-
-        self.done = True
-
-        # If we exited the loop without reaching equilibrium, the whole graph has changed.
-        # In that case, steal the contents of newGraph, and bail.
-
-        self.equilibriumOldRow = int(self.oldPlayer.row)
-        self.equilibriumNewRow = int(self.weaver.row)
-        self.oldGraphRowOffset = 0
-
-        self.oldGraph.shallowCopyFrom(self.newGraph)
+        self.oldGraph.generation += 1
 
     @staticmethod
     def isEquilibriumReached(frameA: Frame, frameB: Frame):
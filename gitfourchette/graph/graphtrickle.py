@@ -4,9 +4,9 @@
 # For full terms, see the included LICENSE file.
 # -----------------------------------------------------------------------------
 
-from collections.abc import Iterable
+from collections.abc import Iterable, Sequence, Set
 
-from gitfourchette.graph.graph import Oid
+from gitfourchette.graph.graph import Graph, Oid
 
 STOP = 0
 PIPE = 1
@@ -14,27 +14,50 @@ SOURCE = 2
 
 
 class GraphTrickle:
+    frontier: dict[Oid, int]
+    flaggedSet: set[Oid]
+
+    numLive: int
+    "Number of entries in the frontier that aren't STOP."
+
     def __init__(self):
         self.frontier = {}
         self.flaggedSet = set()
+        self.numLive = 0
 
     @property
     def done(self) -> bool:
-        return all(v == STOP for v in self.frontier.values())
+        """
+        True if no more commits can be flagged. Past this point,
+        feeding more commits to the trickle is pointless.
+        """
+        return self.numLive == 0
+
+    def setState(self, commit: Oid, state: int):
+        """ Set the state of a commit in the frontier, keeping track of live entries. """
+        frontier = self.frontier
+        self.numLive += (state != STOP) - (frontier.get(commit, STOP) != STOP)
+        frontier[commit] = state
 
     def newCommit(self, commit: Oid, parents: Iterable[Oid]):
         frontier = self.frontier
         flagged = frontier.pop(commit, STOP)
 
         if flagged != STOP:
+            self.numLive -= 1
             # Trickle through parents that are not explicitly flagged
             for p in parents:
-                frontier.setdefault(p, PIPE)
+                if p not in frontier:
+                    frontier[p] = PIPE
+                    self.numLive += 1
             self.flaggedSet.add(commit)
         else:
             # Block trickling to parents (that aren't sources themselves)
             for p in parents:
-                if frontier.get(p, STOP) != SOURCE:
+                state = frontier.get(p, STOP)
+                if state != SOURCE:
+                    if state == PIPE:
+                        self.numLive -= 1
                     frontier[p] = STOP
 
     @staticmethod
@@ -47,21 +70,125 @@ class GraphTrickle:
 
         # Explicitly show all refs by default (block foreign trickle)
         for head in allHeads:
-            trickle.frontier[head] = STOP
+            trickle.setState(head, STOP)
 
         # Explicitly hide tips (allow foreign trickle)
         for head in hideSeeds:
-            trickle.frontier[head] = PIPE
+            trickle.setState(head, PIPE)
 
         # Explicitly hide stash junk parents (beyond parent #0)
         # NOTE: Dropped this from the actual app but kept around in unit tests.
         if forceHide:
             for head in forceHide:
-                trickle.frontier[head] = SOURCE
+                trickle.setState(head, SOURCE)
 
         assert trickle.testFrontierInputs()
         return trickle
 
+    @staticmethod
+    def resumeHiddenTrickle(
+            graph: Graph,
+            row: int,
+            allHeads: Set[Oid],
+            hideSeeds: Set[Oid],
+            hiddenCommits: Set[Oid],
+    ):
+        """
+        Recreate the state that a trickle made by newHiddenTrickle would be in
+        right before processing `row`, without replaying the rows above it.
+
+        The frontier is rebuilt from the arcs that are open at row-1 in the
+        graph, given the hidden commits above `row` (which must be accurate).
+        """
+        getCommitRow = graph.getCommitRow
+
+        def isAtOrBelow(oid: Oid):
+            try:
+                return getCommitRow(oid) >= row
+            except KeyError:
+                # Not in the graph yet (e.g. beyond truncated history): still part of the frontier
+                return True
+
+        trickle = GraphTrickle.newHiddenTrickle(
+            {h for h in allHeads if isAtOrBelow(h)},
+            {h for h in hideSeeds if isAtOrBelow(h)})
+
+        if row <= 0:
+            return trickle
+
+        # Each child->parent edge that crosses row-1 is either the opening commit of an open arc,
+        # or a junction made on that arc above `row`.
+        frontier = trickle.frontier
+        for arc in graph.getFrame(row - 1).openArcs:
+            if arc is None:
+                continue
+            parent = arc.closedBy
+            children = [arc.openedBy]
+            children.extend(j.joinedBy for j in arc.junctions if int(j.joinedAt) < row)
+            for child in children:
+                if child not in hiddenCommits:
+                    trickle.setState(parent, STOP)
+                elif parent not in frontier:
+                    trickle.setState(parent, PIPE)
+
+        return trickle
+
+    @staticmethod
+    def hiddenDelta(
+            graph: Graph,
+            sequence: Sequence,
+            allHeads: Set[Oid],
+            oldHideSeeds: Set[Oid],
+            newHideSeeds: Set[Oid],
+            oldHiddenCommits: Set[Oid],
+    ) -> tuple[set[Oid], set[Oid]]:
+        """
+        Find out which commits become hidden or visible when the hide seeds change.
+        Returns a tuple (newly hidden commits, newly visible commits).
+
+        Rather than trickling through the entire sequence, this starts at the
+        topmost tip whose status changed, runs the trickles for the old and new
+        seeds side by side, and stops as soon as both frontiers are identical
+        past the last tip whose status changed.
+        """
+        # Tips that aren't in the graph don't affect any visible rows
+        changedRows = graph.commitRows.rowsOf(oldHideSeeds ^ newHideSeeds)
+
+        if not changedRows:
+            return set(), set()
+
+        startRow = min(changedRows)
+        lastRow = max(changedRows)
+
+        oldTrickle = GraphTrickle.resumeHiddenTrickle(graph, startRow, allHeads, oldHideSeeds, oldHiddenCommits)
+        newTrickle = GraphTrickle.resumeHiddenTrickle(graph, startRow, allHeads, newHideSeeds, oldHiddenCommits)
+        oldFrontier = oldTrickle.frontier
+        newFrontier = newTrickle.frontier
+
+        # Keep track of frontier entries that differ between the two trickles
+        diverged = {k for k in oldFrontier.keys() | newFrontier.keys() if oldFrontier.get(k) != newFrontier.get(k)}
+
+        for row in range(startRow, len(sequence)):
+            commit = sequence[row]
+            oid = commit.id
+            parents = commit.parent_ids
+
+            oldTrickle.newCommit(oid, parents)
+            newTrickle.newCommit(oid, parents)
+
+            for k in (oid, *parents):
+                if oldFrontier.get(k) != newFrontier.get(k):
+                    diverged.add(k)
+                else:
+                    diverged.discard(k)
+
+            if not diverged and row >= lastRow:
+                break
+
+        oldFlagged = oldTrickle.flaggedSet
+        newFlagged = newTrickle.flaggedSet
+        return newFlagged - oldFlagged, oldFlagged - newFlagged
+
     @staticmethod
     def newForeignTrickle(
             allHeads: set[Oid],
@@ -71,11 +198,11 @@ class GraphTrickle:
 
         # Start with all foreign heads
         for head in allHeads:
-            trickle.frontier[head] = PIPE
+            trickle.setState(head, PIPE)
 
         # Local heads block propagation of foreign trickle
         for head in localSeeds:
-            trickle.frontier[head] = STOP
+            trickle.setState(head, STOP)
 
         assert trickle.testFrontierInputs()
         return trickle
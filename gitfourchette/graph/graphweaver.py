@@ -92,7 +92,7 @@ class GraphWeaver(Frame):
                     arc = min(arcsOfParent, key=lambda a: a.lane)
                     assert arc.closedBy == parent
                     assert arc.closedAt == BATCHROW_UNDEF
-                    arc.junctions.append(ArcJunction(joinedAt=row, joinedBy=me))
+                    arc.addJunction(ArcJunction(joinedAt=row, joinedBy=me))
                     continue
 
             # We didn't make a junction, so open up a new arc on a free lane.
@@ -121,7 +121,7 @@ class GraphWeaver(Frame):
             # Make arc from this commit to its parent
             newArc = Arc(lane=freeLane, chain=parentChain,
                          openedAt=row, closedAt=BATCHROW_UNDEF,
-                         openedBy=me, closedBy=parent, junctions=[])
+                         openedBy=me, closedBy=parent)
             self.openArcs[freeLane] = newArc
             self.parentLookup[parent].append(newArc)
             self.lastArc.nextArc = newArc
@@ -149,7 +149,7 @@ class GraphWeaver(Frame):
 
             newArc = Arc(lane=myHomeLane, chain=myHomeChain,
                          openedAt=row, closedAt=row,
-                         openedBy=me, closedBy=me, junctions=[])
+                         openedBy=me, closedBy=me)
             self.lastArc.nextArc = newArc
             self.lastArc = newArc
             assert newArc.isParentlessCommitBogusArc()
@@ -0,0 +1,242 @@
+# -----------------------------------------------------------------------------
+# Copyright (C) 2025 Iliyas Jorio.
+# This file is part of GitFourchette, distributed under the GNU GPL v3.
+# For full terms, see the included LICENSE file.
+# -----------------------------------------------------------------------------
+
+"""
+Vectorized trickles over a table of parent rows.
+
+This is an optional fast path for GraphTrickle that needs NumPy. Feeding a
+trickle one commit at a time costs a few dictionary operations per commit,
+which adds up over long histories. Instead, ParentTable resolves the parents
+of an entire chunk of the commit sequence to row numbers in one go, then
+propagates the flags over whole runs of commits at once.
+"""
+
+from __future__ import annotations
+
+from gitfourchette.graph.commitsequence import OID_SIZE, CommitSequence
+from gitfourchette.graph.graph import Oid
+from gitfourchette.graph.graphtrickle import GraphTrickle, PIPE, SOURCE, STOP
+
+try:
+    import numpy
+    numpyAvailable = True
+except ImportError:  # pragma: no cover
+    numpy = None
+    numpyAvailable = False
+
+ABSENT = -1
+"Trickle state of a commit that isn't in the frontier."
+
+
+class _RowLookup:
+    """ Find the rows of raw commit ids in a chunk of the sequence. """
+
+    def __init__(self, ids: bytes, numRows: int):
+        self.keys = self.fullKeys(ids, numRows)
+
+        # Sorting on the first 8 bytes of each id is much faster than sorting entire ids.
+        # Fall back to entire ids in the unlikely event that two commits share a prefix.
+        self.sortKeys = self.prefixes
+        self.order, self.sortedKeys = self.sort(self.prefixes(ids, numRows))
+        if numpy.any(self.sortedKeys[1:] == self.sortedKeys[:-1]):
+            self.sortKeys = self.fullKeys
+            self.order, self.sortedKeys = self.sort(self.keys)
+
+    @staticmethod
+    def sort(keys):
+        order = numpy.argsort(keys, kind="stable")
+        return order, keys[order]
+
+    @staticmethod
+    def prefixes(buf: bytes, count: int):
+        records = numpy.frombuffer(buf, dtype=[("prefix", "<u8"), ("rest", f"V{OID_SIZE - 8}")], count=count)
+        return records["prefix"]
+
+    @staticmethod
+    def fullKeys(buf: bytes, count: int):
+        return numpy.frombuffer(buf, dtype=f"S{OID_SIZE}", count=count)
+
+    def find(self, buf: bytes, count: int):
+        """ Return the row of each raw id in `buf`, or -1 if it isn't in the chunk. """
+        if count == 0 or len(self.order) == 0:
+            return numpy.full(count, -1, dtype=numpy.int64)
+        positions = numpy.searchsorted(self.sortedKeys, self.sortKeys(buf, count))
+        positions = numpy.minimum(positions, len(self.order) - 1)
+        rows = self.order[positions]
+        found = self.keys[rows] == self.fullKeys(buf, count)
+        return numpy.where(found, rows, -1)
+
+
+class ParentTable:
+    """
+    Parents of a chunk of the commit sequence, in compressed sparse row form:
+    the parents of row i are parentRows[indptr[i]:indptr[i+1]].
+
+    The table is built once per chunk and can then run any number of trickles
+    over the chunk. Feeding a chunk to a trickle with trickle() leaves the
+    trickle in the same state as calling GraphTrickle.newCommit on each row in
+    order, so that regular trickling may resume past the chunk.
+
+    A commit that has a single child inherits the flag of that child, unless
+    the commit is a STOP or a SOURCE in the frontier. So, the commits are
+    grouped into trees that hang from a root commit that has either no
+    children or several children. Flags are propagated from root to root,
+    and the other commits pick up the flag of their root in one go.
+    """
+
+    def __init__(self, sequence: CommitSequence):
+        assert numpyAvailable, "ParentTable requires NumPy"
+
+        ids, parentIds, parentEnds = sequence.buffers()
+        n = len(parentEnds)
+        self.numRows = n
+        self.ids = ids
+        self.parentIds = parentIds
+
+        indptr = numpy.zeros(n + 1, dtype=numpy.int64)
+        indptr[1:] = numpy.frombuffer(parentEnds, dtype=numpy.uint32, count=n)
+        self.indptr = indptr
+        self.childRows = numpy.repeat(numpy.arange(n), numpy.diff(indptr))
+
+        self.lookup = _RowLookup(ids, n)
+        self.parentRows = self.lookup.find(parentIds, int(indptr[-1]))
+
+        # Edges to parents further down in the chunk are trickled through here.
+        # The rest are handed over to the trickle's frontier.
+        self.internal = self.parentRows > self.childRows
+        edgeChildren = self.childRows[self.internal]
+        edgeParents = self.parentRows[self.internal]
+        self.numChildren = numpy.bincount(edgeParents, minlength=n)
+
+        # Link each commit that has a single child to that child
+        linked = self.numChildren[edgeParents] == 1
+        childRow = numpy.full(n, -1, dtype=numpy.int64)
+        childRow[edgeParents[linked]] = edgeChildren[linked]
+        self.linkedChild = childRow
+
+        # Find the root of each tree (pointer jumping)
+        root = numpy.where(childRow >= 0, childRow, numpy.arange(n))
+        while True:
+            nextRoot = root[root]
+            if numpy.array_equal(nextRoot, root):
+                break
+            root = nextRoot
+        self.root = root
+        self.roots = numpy.flatnonzero(childRow < 0)
+
+        # The remaining edges lead to roots. Group them by the root of the child.
+        byRoot = numpy.argsort(root[edgeChildren[~linked]], kind="stable")
+        self.rootEdgeChildren = edgeChildren[~linked][byRoot]
+        self.rootEdgeParents = edgeParents[~linked][byRoot]
+        self.rootEdgeStart = numpy.searchsorted(root[self.rootEdgeChildren], numpy.arange(n + 1))
+
+    @staticmethod
+    def trickleAll(sequence: CommitSequence, trickles: list[GraphTrickle]):
+        """ Feed an entire sequence to the trickles that aren't done yet. """
+        trickles = [t for t in trickles if not t.done]
+        if not trickles or not sequence:
+            return
+        table = ParentTable(sequence)
+        for trickle in trickles:
+            table.trickle(trickle)
+
+    def _nearestOverrides(self, overrides):
+        """
+        For each row, find the closest row on the way up to its root (including
+        itself, but excluding the root) that overrides the flag; or -1 if none.
+        """
+        nearest = numpy.where(overrides, numpy.arange(self.numRows), -1)
+        jump = self.linkedChild.copy()
+        pending = numpy.flatnonzero((nearest < 0) & (jump >= 0))
+        while len(pending):
+            nextRows = jump[pending]
+            nearest[pending] = nearest[nextRows]
+            jump[pending] = jump[nextRows]
+            pending = pending[(nearest[pending] < 0) & (jump[pending] >= 0)]
+        return nearest
+
+    def flags(self, initialStates):
+        """
+        Return an array telling whether each row is flagged, given the state
+        of each row in the frontier before the chunk starts (ABSENT, STOP,
+        PIPE or SOURCE).
+        """
+        numChildren = self.numChildren
+        isSource = initialStates == SOURCE
+
+        # Below the root of a tree, a STOP or a SOURCE overrides the flag of the root
+        nearest = self._nearestOverrides((self.linkedChild >= 0) & (initialStates != ABSENT) & (initialStates != PIPE))
+        isOverridden = nearest >= 0
+        overrideFlag = isSource[nearest] & isOverridden
+
+        # A root is flagged if it's a source, or if it has no STOP and all its children are flagged
+        canPipe = (initialStates == PIPE) | ((initialStates == ABSENT) & (numChildren > 0))
+        rootFlag = isSource | ((initialStates == PIPE) & (numChildren == 0))
+
+        # Edges leaving overridden rows don't depend on the flag of the root.
+        # Count the flagged ones right away.
+        remaining = numChildren.copy()
+        edgeOverridden = isOverridden[self.rootEdgeChildren]
+        numpy.subtract.at(remaining, self.rootEdgeParents[edgeOverridden & overrideFlag[self.rootEdgeChildren]], 1)
+
+        # Start with the roots that are flagged from the get-go, and those whose children were all overridden
+        roots = self.roots
+        complete = roots[(remaining[roots] == 0) & canPipe[roots] & ~rootFlag[roots]]
+        rootFlag[complete] = True
+        ready = roots[rootFlag[roots]].tolist()
+
+        # There are far fewer roots than commits, but each root may have to wait for the one before it,
+        # so this part isn't worth vectorizing.
+        edgeStart = self.rootEdgeStart.tolist()
+        edgeParents = self.rootEdgeParents.tolist()
+        edgeOverridden = edgeOverridden.tolist()
+        remaining = remaining.tolist()
+        canPipe = canPipe.tolist()
+        newlyFlagged = []
+        while ready:
+            root = ready.pop()
+            for edge in range(edgeStart[root], edgeStart[root + 1]):
+                if edgeOverridden[edge]:
+                    continue
+                parent = edgeParents[edge]
+                remaining[parent] -= 1
+                if remaining[parent] == 0 and canPipe[parent]:
+                    newlyFlagged.append(parent)
+                    ready.append(parent)
+        rootFlag[newlyFlagged] = True
+
+        return numpy.where(isOverridden, overrideFlag, rootFlag[self.root])
+
+    def trickle(self, trickle: GraphTrickle):
+        """ Feed every row in the chunk to the trickle. """
+        frontier = trickle.frontier
+
+        # Pick up the frontier entries for the rows in the chunk
+        keys = list(frontier)
+        keyRows = self.lookup.find(b"".join(k.raw for k in keys), len(keys))
+        initialStates = numpy.full(self.numRows, ABSENT, dtype=numpy.int8)
+        for key, row in zip(keys, keyRows.tolist(), strict=True):
+            if row >= 0:
+                initialStates[row] = frontier.pop(key)
+
+        flags = self.flags(initialStates)
+
+        ids = self.ids
+        offsets = (numpy.flatnonzero(flags) * OID_SIZE).tolist()
+        trickle.flaggedSet.update([Oid(raw=ids[i: i + OID_SIZE]) for i in offsets])
+
+        # Hand the edges that leave the chunk over to the frontier
+        parentIds = self.parentIds
+        external = numpy.flatnonzero(~self.internal)
+        for edge, child in zip(external.tolist(), self.childRows[external].tolist(), strict=True):
+            parent = Oid(raw=parentIds[edge * OID_SIZE: (edge + 1) * OID_SIZE])
+            if flags[child]:
+                if parent not in frontier:
+                    frontier[parent] = PIPE
+            elif frontier.get(parent, STOP) != SOURCE:
+                frontier[parent] = STOP
+
+        trickle.numLive = sum(state != STOP for state in frontier.values())
@@ -0,0 +1,259 @@
+# -----------------------------------------------------------------------------
+# Copyright (C) 2025 Iliyas Jorio.
+# This file is part of GitFourchette, distributed under the GNU GPL v3.
+# For full terms, see the included LICENSE file.
+# -----------------------------------------------------------------------------
+
+"""
+Index of the refs that contain each commit ("which branches is this commit on?").
+"""
+
+from __future__ import annotations
+
+from array import array
+from collections.abc import Collection
+
+from gitfourchette.graph.commitsequence import OID_SIZE, CommitSequence
+from gitfourchette.graph.graph import Oid
+
+_Buffers = tuple[bytes, bytes, array]
+
+
+class ReachabilityIndex:
+    """
+    Tells which refs contain each commit in a commit sequence, i.e. which
+    branches and tags a commit is reachable from.
+
+    Each ref is assigned a bit. masks[row] holds the bits of all the refs that
+    contain the commit at that row. The commit sequence is in topological
+    order, so the children of a commit are always above it: a single pass
+    from top to bottom builds all the masks. Row numbers stand in for
+    generation numbers here.
+
+    Commits along a straight line of history share the same int object, so
+    memory use grows with the number of forks and tips rather than with the
+    length of the history.
+    """
+
+    masks: list[int]
+    "Bits of the refs that contain the commit at each row of the sequence."
+
+    refNames: list[str]
+    "Ref name of each bit. Empty string if the bit is free."
+
+    refBits: dict[str, int]
+    "Bit number of each indexed ref."
+
+    refTips: dict[str, bytes]
+    "Raw commit id at the tip of each indexed ref, as of the last update."
+
+    def __init__(self):
+        self.masks = []
+        self.refNames = []
+        self.refBits = {}
+        self.refTips = {}
+
+    def __len__(self):
+        return len(self.masks)
+
+    @staticmethod
+    def isIndexedRef(refName: str) -> bool:
+        # Leave out HEAD and other fake refs - they're always in refs/heads/ or elsewhere anyway
+        return refName.startswith("refs/")
+
+    @classmethod
+    def build(cls, sequence: CommitSequence, refs: dict[str, Oid]) -> ReachabilityIndex:
+        """ Index an entire commit sequence for the given refs. """
+        index = cls()
+        buffers = sequence.buffers()
+        index.masks = [0] * len(buffers[2])
+        for name, oid in refs.items():
+            if cls.isIndexedRef(name):
+                index._assignBit(name)
+                index.refTips[name] = oid.raw
+        cls._propagate(index.masks, buffers, 0, len(index.masks), {}, index._tipBits(index.refTips))
+        return index
+
+    def refsContaining(self, row: int) -> list[str]:
+        """ Names of the refs that contain the commit at the given row, in bit order. """
+        mask = self.masks[row]
+        names = []
+        while mask:
+            lowest = mask & -mask
+            names.append(self.refNames[lowest.bit_length() - 1])
+            mask ^= lowest
+        return names
+
+    def contains(self, row: int, refName: str) -> bool:
+        try:
+            bit = self.refBits[refName]
+        except KeyError:
+            return False
+        return bool(self.masks[row] >> bit & 1)
+
+    def spliced(self, sequence: CommitSequence, numRowsAdded: int, numRowsRemoved: int,
+                refs: dict[str, Oid]) -> ReachabilityIndex:
+        """
+        Return an index for a sequence whose top numRowsRemoved rows were
+        replaced with numRowsAdded new rows (see GraphSpliceLoop), given the
+        refs as they are now. This index is left untouched, so it remains
+        usable until the new sequence is swapped in.
+
+        The new rows are indexed from scratch. Below them, the masks are
+        reused: the bits of the refs that moved or appeared trickle down from
+        their new tips until they reach commits that already have them. Only
+        the bits of deleted refs and of refs that didn't fast-forward need a
+        pass over the rest of the history to be cleared.
+        """
+        if numRowsRemoved < 0:
+            # No equilibrium - the entire sequence is new
+            return ReachabilityIndex.build(sequence, refs)
+
+        index = ReachabilityIndex()
+        index.refNames = list(self.refNames)
+        index.refBits = dict(self.refBits)
+        index.masks = [0] * numRowsAdded + self.masks[numRowsRemoved:]
+
+        buffers = sequence.buffers()
+        numRows = len(buffers[2])
+        assert len(index.masks) == numRows
+
+        oldTips = self.refTips
+        newTips = {name: oid.raw for name, oid in refs.items() if self.isIndexedRef(name)}
+        index.refTips = newTips
+
+        removed = [name for name in oldTips if name not in newTips]
+        moved = [name for name, raw in newTips.items() if oldTips.get(name, raw) != raw]
+        for name in newTips:
+            if name not in oldTips:
+                index._assignBit(name)
+
+        changedBits = 0
+        for name in newTips:
+            if oldTips.get(name) != newTips[name]:
+                changedBits |= 1 << index.refBits[name]
+
+        # Index the new rows from scratch
+        tips = index._tipBits(newTips)
+        pending = {}
+        watch = {oldTips[name] for name in moved}
+        reached = self._propagate(index.masks, buffers, 0, numRowsAdded, pending, tips, watch)
+        topPending = dict(pending)
+
+        # Trickle the bits of the refs that changed into the old rows
+        tips = {raw: bits & changedBits for raw, bits in tips.items() if bits & changedBits}
+        pending = {raw: bits & changedBits for raw, bits in pending.items() if bits & changedBits}
+        bottomTips = dict(tips)
+        reached.update(self._propagate(index.masks, buffers, numRowsAdded, numRows, pending, tips, watch))
+
+        # If a ref didn't fast-forward, some commits may not be in it anymore
+        clearBits = 0
+        for name in removed:
+            clearBits |= 1 << index.refBits[name]
+        for name in moved:
+            bit = 1 << index.refBits[name]
+            if not reached.get(oldTips[name], 0) & bit:
+                clearBits |= bit
+
+        if clearBits:
+            self._clear(index.masks, numRowsAdded, clearBits)
+            tips = {raw: bits & clearBits for raw, bits in bottomTips.items() if bits & clearBits}
+            pending = {raw: bits & clearBits for raw, bits in topPending.items() if bits & clearBits}
+            self._propagate(index.masks, buffers, numRowsAdded, numRows, pending, tips)
+
+        for name in removed:
+            index.refNames[index.refBits.pop(name)] = ""
+
+        return index
+
+    def _assignBit(self, name: str):
+        names = self.refNames
+        try:
+            bit = names.index("")
+            names[bit] = name
+        except ValueError:
+            bit = len(names)
+            names.append(name)
+        self.refBits[name] = bit
+
+    def _tipBits(self, refTips: dict[str, bytes]) -> dict[bytes, int]:
+        tips = {}
+        for name, raw in refTips.items():
+            tips[raw] = tips.get(raw, 0) | (1 << self.refBits[name])
+        return tips
+
+    @staticmethod
+    def _propagate(masks: list[int], buffers: _Buffers, start: int, stop: int,
+                   pending: dict[bytes, int], tips: dict[bytes, int], watch: Collection[bytes] = ()
+                   ) -> dict[bytes, int]:
+        """
+        Add bits to the masks of rows start to stop. `tips` maps raw commit
+        ids to bits that start at those commits; `pending` maps raw commit ids
+        to bits inherited from children above `start`. A bit stops trickling
+        down once it reaches a commit that already has it.
+
+        Both dicts are consumed as the rows are visited: whatever is left in
+        `pending` afterwards is bound for commits below `stop`.
+
+        Return the incoming bits of the commits in `watch` that were visited.
+        """
+        ids, parentIds, parentEnds = buffers
+        reached = {}
+        memo = {}
+
+        row = start
+        while row < stop and (pending or tips):
+            raw = ids[row * OID_SIZE: (row + 1) * OID_SIZE]
+            bits = pending.pop(raw, 0)
+            tipBits = tips.pop(raw, 0)
+            if tipBits:
+                bits |= tipBits
+            if not bits:
+                row += 1
+                continue
+
+            if raw in watch:
+                reached[raw] = bits
+
+            mask = masks[row]
+            if not mask:
+                masks[row] = bits
+                newBits = bits
+            else:
+                newBits = bits & ~mask
+                if not newBits:
+                    row += 1
+                    continue
+                if newBits == bits:
+                    newBits = bits  # share the int with the child
+                key = (mask, newBits)
+                try:
+                    masks[row] = memo[key]
+                except KeyError:
+                    masks[row] = memo[key] = mask | newBits
+
+            for i in range(parentEnds[row - 1] if row else 0, parentEnds[row]):
+                parent = parentIds[i * OID_SIZE: (i + 1) * OID_SIZE]
+                old = pending.get(parent)
+                if old is None:
+                    pending[parent] = newBits
+                else:
+                    merged = old | newBits
+                    if merged != old:
+                        pending[parent] = merged
+
+            row += 1
+
+        return reached
+
+    @staticmethod
+    def _clear(masks: list[int], start: int, bits: int):
+        keep = ~bits
+        memo = {}
+        for row in range(start, len(masks)):
+            mask = masks[row]
+            if mask & bits:
+                try:
+                    masks[row] = memo[mask]
+                except KeyError:
+                    masks[row] = memo[mask] = mask & keep
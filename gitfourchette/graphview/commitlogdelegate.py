@@ -8,11 +8,14 @@ import math
 import traceback
 from contextlib import suppress
 from dataclasses import dataclass
+from typing import NamedTuple
 
 from gitfourchette import settings
 from gitfourchette.forms.searchbar import SearchBar
 from gitfourchette.graphview.commitlogmodel import CommitLogModel, SpecialRow, CommitToolTipZone
-from gitfourchette.graphview.graphpaint import paintGraphFrame
+from gitfourchette.graphview.graphpaint import RowLayoutCache, paintGraphFrame
+from gitfourchette.graphview.rowpixmapcache import RowPixmap, RowPixmapCache
+from gitfourchette.graphview.rowtextcache import ELISION, ELISION_LENGTH, RowTextCache, RowTextStyle
 from gitfourchette.localization import *
 from gitfourchette.porcelain import *
 from gitfourchette.qt import *
@@ -44,8 +47,47 @@ REFBOXES = [
 ]
 
 
-ELISION = " […]"
-ELISION_LENGTH = len(ELISION)
+class RefboxLayout(NamedTuple):
+    """ A refbox, measured and ready to paint. """
+    refName: str
+    text: str
+    font: QFont
+    fittedFont: QFont
+    textWidth: int | None
+    color: QColor
+    bgColor: QColor
+    icon: QIcon | None
+    clipLeft: bool
+    clipRight: bool
+
+
+class RefboxLayoutCache:
+    """
+    Caches the refboxes of each list of refs found on a commit, so that
+    commits with many refs don't have their refboxes measured and elided over
+    and over.
+
+    The cache is flushed when RepoModel.refsAt or the state of the repo that
+    affects the refboxes (upstreams, remotes, HEAD) changes. Clear it
+    manually when the hidden refs or the fonts change.
+    """
+
+    layouts: dict[tuple, list[RefboxLayout]]
+
+    def __init__(self):
+        self.layouts = {}
+        self.stamp = ()
+
+    def clear(self):
+        self.layouts.clear()
+
+    def validate(self, repoModel: RepoModel):
+        """ Flush the cache if anything that the layouts depend on has changed since the last call. """
+        stamp = (repoModel.refsAt, repoModel.upstreams, repoModel.remotes,
+                 repoModel.homeBranch, repoModel.headIsDetached)
+        if stamp != self.stamp:
+            self.layouts.clear()
+            self.stamp = stamp
 
 
 MAX_AUTHOR_CHARS = {
@@ -74,6 +116,10 @@ class CommitLogDelegate(QStyledItemDelegate):
         self.uncommittedFont = QFont()
         self.refboxFont = QFont()
         self.homeRefboxFont = QFont()
+        self.rowLayoutCache = RowLayoutCache()
+        self.rowTextCache = RowTextCache()
+        self.rowPixmapCache = RowPixmapCache()
+        self.refboxLayoutCache = RefboxLayoutCache()
 
     def invalidateMetrics(self):
         self.mustRefreshMetrics = True
@@ -97,6 +143,9 @@ class CommitLogDelegate(QStyledItemDelegate):
         self.homeRefboxFont = QFont(self.refboxFont)
         self.homeRefboxFont.setWeight(QFont.Weight.Bold)
 
+        # The refboxes must be measured again with the new fonts
+        self.refboxLayoutCache.clear()
+
         wideDate = QDateTime.fromString("2999-12-25T23:59:59.999", Qt.DateFormat.ISODate)
         dateText = option.locale.toString(wideDate, settings.prefs.shortTimeFormat)
         if settings.prefs.authorDiffAsterisk:
@@ -109,17 +158,82 @@ class CommitLogDelegate(QStyledItemDelegate):
         return self.repoWidget.repoModel
 
     def paint(self, painter: QPainter, option: QStyleOptionViewItem, index: QModelIndex):
+        key = self._rowPixmapKey(painter, option, index)
+        row = self.rowPixmapCache.lookup(key) if key is not None else None
+
+        if row is not None:
+            painter.drawPixmap(option.rect.topLeft(), row.pixmap)
+            toolTipMetrics = row.authorColumnX, row.toolTips
+        elif key is not None:
+            pixmap, toolTipMetrics = self._renderRowPixmap(painter, option, index)
+            painter.drawPixmap(option.rect.topLeft(), pixmap)
+            if toolTipMetrics is not None:  # don't keep errors around
+                self.rowPixmapCache.put(key, RowPixmap(pixmap, *toolTipMetrics))
+        else:
+            toolTipMetrics = self._paintSafely(painter, option, index)
+
+        if toolTipMetrics is not None:
+            authorColumnX, toolTips = toolTipMetrics
+            model = index.model()
+            model.setData(index, authorColumnX, CommitLogModel.Role.AuthorColumnX)
+            model.setData(index, toolTips, CommitLogModel.Role.ToolTipZones)
+
+    def _paintSafely(self, painter: QPainter, option: QStyleOptionViewItem, index: QModelIndex
+                     ) -> tuple[int, list[CommitToolTipZone]] | None:
+        """ Paint the row, or an error message if that fails (in which case, return None). """
+        toolTipMetrics = None
         painter.save()
         painter.setRenderHint(QPainter.RenderHint.Antialiasing)
         try:
-            self._paint(painter, option, index)
+            toolTipMetrics = self._paint(painter, option, index)
         except Exception as exc:  # pragma: no cover
             painter.restore()
             painter.save()
             self._paintError(painter, option, index, exc)
         painter.restore()
+        return toolTipMetrics
+
+    def _rowPixmapKey(self, painter: QPainter, option: QStyleOptionViewItem, index: QModelIndex) -> tuple | None:
+        """ Key of the row in rowPixmapCache, or None if the row mustn't be cached. """
+        if not settings.prefs.graphPixmapCache:
+            return None
+
+        # Special rows change with the state of the workdir, etc. They're cheap to paint anyway.
+        oid = index.data(CommitLogModel.Role.Oid)
+        if oid is None or oid == UC_FAKEID or self.repoModel.graph is None:
+            return None
+
+        self.rowTextCache.validate(RowTextStyle.current(option.locale))
+        self.rowPixmapCache.validate(self.repoModel, self.rowTextCache.style)
+
+        searchBar: SearchBar = self.parent().searchBar
+        search = (searchBar.searchTerm, searchBar.searchTermLooksLikeHash) if searchBar.isVisible() else None
+
+        rect = option.rect
+        return (oid, rect.width(), rect.height(), option.state, option.features, painter.device().devicePixelRatioF(),
+                search, option.palette.cacheKey(), option.font.key())
 
-    def _paint(self, painter: QPainter, option: QStyleOptionViewItem, index: QModelIndex):
+    def _renderRowPixmap(self, painter: QPainter, option: QStyleOptionViewItem, index: QModelIndex
+                         ) -> tuple[QPixmap, tuple[int, list[CommitToolTipZone]] | None]:
+        dpr = painter.device().devicePixelRatioF()
+        rect = option.rect
+
+        pixmap = QPixmap(rect.size() * dpr)
+        pixmap.setDevicePixelRatio(dpr)
+        pixmap.fill(option.palette.color(QPalette.ColorRole.Base))
+
+        # Paint with the same coordinates as in the viewport so that the tooltip zones line up
+        pixmapPainter = QPainter(pixmap)
+        pixmapPainter.setFont(painter.font())
+        pixmapPainter.setPen(painter.pen())
+        pixmapPainter.translate(-rect.left(), -rect.top())
+        toolTipMetrics = self._paintSafely(pixmapPainter, option, index)
+        pixmapPainter.end()
+
+        return pixmap, toolTipMetrics
+
+    def _paint(self, painter: QPainter, option: QStyleOptionViewItem, index: QModelIndex
+               ) -> tuple[int, list[CommitToolTipZone]]:
         toolTips: list[CommitToolTipZone] = []
 
         hasFocus = option.state & QStyle.StateFlag.State_HasFocus
@@ -160,26 +274,21 @@ class CommitLogDelegate(QStyledItemDelegate):
         rightBound = rect.right()
 
         # Get the info we need about the commit
-        commit: Commit | None = index.data(CommitLogModel.Role.Commit)
-        if commit and commit.id != UC_FAKEID:
-            oid = commit.id
-            author = commit.author
-            committer = commit.committer
-
-            summaryText, contd = messageSummary(commit.message, ELISION)
-            hashText = shortHash(commit.id)
-            authorText = abbreviatePerson(author, settings.prefs.authorDisplayStyle)
-
-            qdt = QDateTime.fromSecsSinceEpoch(author.time)
-            dateText = option.locale.toString(qdt, settings.prefs.shortTimeFormat)
-
-            if settings.prefs.authorDiffAsterisk:
-                if author.email != committer.email:
-                    authorText += "*"
-                if author.time != committer.time:
-                    dateText += "*"
-
-            if self.repoModel.headCommitId == commit.id:
+        oid: Oid | None = index.data(CommitLogModel.Role.Oid)
+        rowText = None
+        if oid is not None and oid != UC_FAKEID:
+            self.rowTextCache.validate(RowTextStyle.current(option.locale))
+            # Don't look up the full commit if its text is ready to paint
+            rowText = self.rowTextCache.lookup(oid)
+            if rowText is None:
+                commit: Commit | None = index.data(CommitLogModel.Role.Commit)
+                if commit is not None:
+                    rowText = self.rowTextCache.get(commit)
+
+        if rowText is not None:
+            summaryText, hashText, authorText, dateText = rowText
+
+            if self.repoModel.headCommitId == oid:
                 painter.setFont(self.activeCommitFont)
 
             searchBar: SearchBar = self.parent().searchBar
@@ -189,7 +298,6 @@ class CommitLogDelegate(QStyledItemDelegate):
             if not searchBar.isVisible():
                 searchTerm = ""
         else:
-            commit = None
             oid = None
             hashText = "·" * settings.prefs.shortHashChars
             authorText = ""
@@ -250,7 +358,7 @@ class CommitLogDelegate(QStyledItemDelegate):
         painter.restore()
 
         # ------ Highlight searched hash
-        if searchTerm and searchTermLooksLikeHash and commit and str(commit).startswith(searchTerm):
+        if searchTerm and searchTermLooksLikeHash and rowText and str(oid).startswith(searchTerm):
             x1 = 0
             x2 = min(len(hashText), len(searchTerm)) * hcw
             SearchBar.highlightNeedle(painter, rect, hashText, 0, len(searchTerm), x1, x2)
@@ -258,7 +366,7 @@ class CommitLogDelegate(QStyledItemDelegate):
         # ------ Graph
         rect.setLeft(leftBoundSummary)
         if oid is not None:
-            paintGraphFrame(self.repoModel, oid, painter, rect, outlineColor)
+            paintGraphFrame(self.repoModel, oid, painter, rect, outlineColor, self.rowLayoutCache)
             rect.setLeft(rect.right())
 
         # ------ Set refbox/message area rect
@@ -277,7 +385,7 @@ class CommitLogDelegate(QStyledItemDelegate):
 
         # ------ Message
         # use muted color for foreign commit messages if not selected
-        if not isSelected and commit and commit.id in self.repoModel.foreignCommits:
+        if not isSelected and rowText and oid in self.repoModel.foreignCommits:
             painter.setPen(Qt.GlobalColor.gray)
 
         elidedSummaryText = elide(summaryText)
@@ -287,7 +395,7 @@ class CommitLogDelegate(QStyledItemDelegate):
             toolTips.append(CommitToolTipZone(rect.left(), rect.right(), "message"))
 
         # ------ Highlight search term
-        if searchTerm and commit and searchTerm in commit.message.lower():
+        if searchTerm and rowText and self._messageContains(index, summaryText, searchTerm):
             needlePos = summaryText.lower().find(searchTerm)
             if needlePos < 0:
                 needlePos = len(summaryText) - ELISION_LENGTH
@@ -303,7 +411,7 @@ class CommitLogDelegate(QStyledItemDelegate):
             FittedText.draw(painter, rect, Qt.AlignmentFlag.AlignVCenter, authorText, minStretch=QFont.Stretch.ExtraCondensed)
 
         # ------ Highlight searched author
-        if searchTerm and commit:
+        if searchTerm and rowText:
             needlePos = authorText.lower().find(searchTerm)
             if needlePos >= 0:
                 highlight(authorText, needlePos, len(searchTerm))
@@ -320,14 +428,38 @@ class CommitLogDelegate(QStyledItemDelegate):
         # ----------------
 
         # Tooltip metrics
-        model = index.model()
-        model.setData(index, leftBoundName if authorWidth != 0 else -1, CommitLogModel.Role.AuthorColumnX)
-        model.setData(index, toolTips, CommitLogModel.Role.ToolTipZones)
+        return (leftBoundName if authorWidth != 0 else -1), toolTips
+
+    @staticmethod
+    def _messageContains(index: QModelIndex, summaryText: str, searchTerm: str) -> bool:
+        """ Look for a lowercase term in a row's commit message, without looking up the commit if possible. """
+        if searchTerm in summaryText.lower():
+            return True
+        # The commit may be missing (e.g. shallow clone), even if its text is cached
+        commit: Commit | None = index.data(CommitLogModel.Role.Commit)
+        return commit is not None and searchTerm in commit.message.lower()
 
     def _paintRefboxes(self, painter: QPainter, rect: QRect, refs: list[str], toolTips: list[CommitToolTipZone]):
+        xMax = painter.clipBoundingRect().right()
+        dark = painter.pen().color().lightnessF() > .5
+
+        self.refboxLayoutCache.validate(self.repoModel)
+        key = (tuple(refs), dark)
+        try:
+            boxes = self.refboxLayoutCache.layouts[key]
+        except KeyError:
+            boxes = self._layOutRefboxes(refs, dark)
+            self.refboxLayoutCache.layouts[key] = boxes
+
+        for box in boxes:
+            self._paintRefbox(painter, rect, toolTips, box)
+            if rect.left() >= xMax:
+                return
+
+    def _layOutRefboxes(self, refs: list[str], dark: bool) -> list[RefboxLayout]:
         repoModel = self.repoModel
         homeBranch = RefPrefix.HEADS + repoModel.homeBranch
-        xMax = painter.clipBoundingRect().right()
+        boxes = []
 
         # Group refs in clusters (branches with same upstream)
         clusters = {}
@@ -367,7 +499,7 @@ class CommitLogDelegate(QStyledItemDelegate):
             nonLooseRefs.add(upstreamRef)
             nonLooseRefs.add(refName)
 
-        # Draw clusters first
+        # Lay out clusters first
         for upstreamRef, localRefList in clusters.items():
             # See if we can omit the name of the remote branch
             if repoModel.singleRemote and len(localRefList) == 1:
@@ -379,18 +511,15 @@ class CommitLogDelegate(QStyledItemDelegate):
             else:
                 omitRemoteName = False
 
-            # Draw local branches
+            # Local branches
             for i, localRef in enumerate(localRefList):
-                self._paintRefbox(painter, rect, toolTips, localRef,
-                                  clipLeft=i != 0, clipRight=True, isHome=localRef == homeBranch)
-
-            # Draw upstream at end of cluster
-            self._paintRefbox(painter, rect, toolTips, upstreamRef, clipLeft=True, forceOmitName=omitRemoteName)
+                boxes.append(self._layOutRefbox(localRef, dark, clipLeft=i != 0, clipRight=True,
+                                                isHome=localRef == homeBranch))
 
-            if rect.left() >= xMax:
-                return
+            # Upstream at end of cluster
+            boxes.append(self._layOutRefbox(upstreamRef, dark, clipLeft=True, forceOmitName=omitRemoteName))
 
-        # Draw loose refs
+        # Lay out loose refs
         for refName in refs:
             # Skip refboxes for hidden refs (except tags and special refs)
             if (refName in repoModel.hiddenRefs
@@ -398,29 +527,27 @@ class CommitLogDelegate(QStyledItemDelegate):
                     and not refName.startswith(RefPrefix.TAGS)):
                 continue
 
-            # Skip clustered refs we've drawn above
+            # Skip clustered refs we've laid out above
             if refName in nonLooseRefs:
                 continue
 
-            self._paintRefbox(painter, rect, toolTips, refName, isHome=refName == homeBranch)
+            # No refbox for HEAD unless it's detached
+            if refName == 'HEAD' and not repoModel.headIsDetached:
+                continue
 
-            if rect.left() >= xMax:
-                return
+            boxes.append(self._layOutRefbox(refName, dark, isHome=refName == homeBranch))
+
+        return boxes
 
-    def _paintRefbox(
+    def _layOutRefbox(
             self,
-            painter: QPainter,
-            rect: QRect,
-            toolTips: list[CommitToolTipZone],
             refName: str,
+            dark: bool,
             isHome: bool = False,
             clipLeft: bool = False,
             clipRight: bool = False,
             forceOmitName: bool = False,
-    ):
-        if refName == 'HEAD' and not self.repoModel.headIsDetached:
-            return
-
+    ) -> RefboxLayout:
         refboxDef = next(d for d in REFBOXES if refName.startswith(d.prefix))
 
         if forceOmitName:
@@ -439,7 +566,6 @@ class CommitLogDelegate(QStyledItemDelegate):
         if refboxDef.prefix == RefPrefix.REMOTES and self.repoModel.singleRemote:
             text = text.split('/', 1)[-1]
 
-        dark = painter.pen().color().lightnessF() > .5
         if dark:
             color = color.lighter(300)
             bgColor.setAlphaF(.5)
@@ -455,31 +581,42 @@ class CommitLogDelegate(QStyledItemDelegate):
         else:
             font = self.refboxFont
 
-        painter.setFont(font)
-        painter.setPen(color)
+        maxWidth = settings.prefs.refBoxMaxWidth
+        if text and maxWidth != 0:
+            text, fittedFont, textWidth = FittedText.fit(
+                font, maxWidth, text, Qt.TextElideMode.ElideMiddle, limit=QFont.Stretch.Condensed)
+        else:
+            fittedFont = font
+            textWidth = None
+
+        icon = stockIcon(iconName, f"gray={color.name()}") if iconName else None
+
+        return RefboxLayout(refName, text, font, fittedFont, textWidth, color, bgColor, icon, clipLeft, clipRight)
+
+    def _paintRefbox(self, painter: QPainter, rect: QRect, toolTips: list[CommitToolTipZone], box: RefboxLayout):
+        painter.setFont(box.font)
+        painter.setPen(box.color)
 
         rrRadius = 4  # Rounded Rectangle radius
         lPadding = 3  # Left padding
         rPadding = 4  # Right padding
         vMargin = max(0, math.ceil((rect.height() - 16) / 4))  # Vertical margin
 
-        maxWidth = settings.prefs.refBoxMaxWidth
-        if text and maxWidth != 0:
-            text, fittedFont, textWidth = FittedText.fit(
-                font, maxWidth, text, Qt.TextElideMode.ElideMiddle, limit=QFont.Stretch.Condensed)
+        if box.textWidth is not None:
+            textWidth = box.textWidth
         else:
             textWidth = -rPadding  # Negate rPadding
 
         lClip = 0
         rClip = 0
-        if clipLeft:
+        if box.clipLeft:
             lPadding = 2 * lPadding
             lClip = rrRadius
-        if clipRight:
+        if box.clipRight:
             rPadding = 2 * rPadding + 2
             rClip = rrRadius
 
-        if iconName:
+        if box.icon is not None:
             iconRect = QRect(rect)
             iconRect.adjust(lPadding, vMargin, 0, -vMargin)
             iconSize = min(16, iconRect.height())
@@ -506,18 +643,17 @@ class CommitLogDelegate(QStyledItemDelegate):
                                  rrRadius, rrRadius)
 
         painter.drawPath(framePath)
-        painter.fillPath(framePath, bgColor)
+        painter.fillPath(framePath, box.bgColor)
 
-        if iconName:
-            icon = stockIcon(iconName, f"gray={color.name()}")
-            icon.paint(painter, iconRect, Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter)
+        if box.icon is not None:
+            box.icon.paint(painter, iconRect, Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter)
 
-        if text and textWidth > 0:
+        if box.text and textWidth > 0:
             textRect = QRect(boxRect)
             textRect.adjust(0, 0, -rPadding, 0)
-            painter.setFont(fittedFont)
-            painter.drawText(textRect, Qt.AlignmentFlag.AlignVCenter | Qt.AlignmentFlag.AlignRight, text)
-            painter.setFont(font)
+            painter.setFont(box.fittedFont)
+            painter.drawText(textRect, Qt.AlignmentFlag.AlignVCenter | Qt.AlignmentFlag.AlignRight, box.text)
+            painter.setFont(box.font)
 
         # Reset clip rect
         if lClip or rClip:
@@ -538,7 +674,7 @@ class CommitLogDelegate(QStyledItemDelegate):
                                    QLineF(x-2, ym+1, x+2, ym+1)])
 
         # Append tooltip
-        refToolTip = CommitToolTipZone(rect.left(), boxRect.right(), "ref", refName)
+        refToolTip = CommitToolTipZone(rect.left(), boxRect.right(), "ref", box.refName)
         toolTips.append(refToolTip)
 
         # Advance caller rectangle
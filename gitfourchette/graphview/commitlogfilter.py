@@ -4,43 +4,358 @@
 # For full terms, see the included LICENSE file.
 # -----------------------------------------------------------------------------
 
+from array import array
+from bisect import bisect_left
+from collections.abc import Iterable
+from itertools import compress
+
+from gitfourchette.graph.commitsequence import OID_SIZE
 from gitfourchette.graphview.commitlogmodel import CommitLogModel
+from gitfourchette.graphview.commitsearch import FilterVerdict
 from gitfourchette.porcelain import *
 from gitfourchette.qt import *
-from gitfourchette.repomodel import UC_FAKEID
 from gitfourchette.toolbox import *
 
+# Turns a filter mask into a visibility mask (pending rows stay hidden until they've been evaluated)
+_ACCEPTED_VERDICTS = bytes(int(v == FilterVerdict.Accept) for v in range(256))
+
+
+class CommitLogFilter(QAbstractProxyModel):
+    """
+    Hides the commits of hidden branches from the commit log, as well as the
+    commits rejected by the filter mode (see CommitFilterQuery).
+
+    Instead of evaluating each source row one by one as QSortFilterProxyModel
+    would, this proxy keeps a couple of per-row byte masks and derives a sorted
+    array of the visible source rows from them in bulk. Indices are mapped with
+    a bisection. The array is stored relative to an offset so that rows
+    inserted or removed at the top of the log (see mendCommitSequence) don't
+    require renumbering the rest of the array.
+
+    The UI thread is the only one that touches the masks.
+    """
 
-class CommitLogFilter(QSortFilterProxyModel):
     hiddenIds: set[Oid]
+    "Commits that belong to hidden branches."
+
+    filterMask: bytearray | None
+    "FilterVerdict of each source row, or None if the filter mode is off."
+
+    _hiddenRaws: set[bytes]
+    "Raw ids of hiddenIds."
+
+    _refMask: bytearray
+    "1 if the source row isn't part of a hidden branch, 0 otherwise."
+
+    _visibleRows: array
+    "Sorted visible source rows, minus _rowOffset."
+
+    _rowOffset: int
+    "Add this to the items of _visibleRows to get actual source rows."
 
     def __init__(self, parent):
         super().__init__(parent)
         self.hiddenIds = set()
-        self.setDynamicSortFilter(True)
+        self.filterMask = None
+        self._hiddenRaws = set()
+        self._refMask = bytearray()
+        self._visibleRows = array("i")
+        self._rowOffset = 0
 
     @property
     def clModel(self) -> CommitLogModel:
         return self.sourceModel()
 
+    def setSourceModel(self, sourceModel: CommitLogModel):
+        super().setSourceModel(sourceModel)
+        sourceModel.modelAboutToBeReset.connect(self.beginResetModel)
+        sourceModel.modelReset.connect(self.onSourceModelReset)
+        sourceModel.rowsInserted.connect(self.onSourceRowsInserted)
+        sourceModel.rowsRemoved.connect(self.onSourceRowsRemoved)
+        sourceModel.dataChanged.connect(self.onSourceDataChanged)
+        self.beginResetModel()
+        self.onSourceModelReset()
+
+    # -------------------------------------------------------------------------
+    # Hidden commits & filter mask
+
     @benchmark
     def setHiddenCommits(self, hiddenIds: set[Oid]):
-        # Invalidating the filter can be costly, so avoid if possible
+        # Refiltering can be costly, so avoid if possible
         if self.hiddenIds == hiddenIds:
             return
         # Duplicate the set so we don't prematurely bail from above
         # if hidden commits change in the same set object
         self.hiddenIds = set(hiddenIds)
-        self.invalidateFilter()
-
-    def filterAcceptsRow(self, sourceRow: int, sourceParent: QModelIndex) -> bool:
-        try:
-            commit = self.clModel._commitSequence[sourceRow]
-        except IndexError:
-            # Probably an extra special row
-            return True
-        if not commit:
-            return True
-        if commit.id == UC_FAKEID:
-            return True
-        return commit.id not in self.hiddenIds
+        self._hiddenRaws = {oid.raw for oid in hiddenIds}
+        self._refMask = self._makeRefMask(0, self.clModel.rowCount())
+        self._refilter()
+
+    @benchmark
+    def patchHiddenCommits(self, newlyHidden: set[Oid], newlyShown: set[Oid], changedRows: Iterable[int]):
+        """
+        Hide and show some commits, given the source rows of all of them,
+        instead of scanning the entire log. The rows that disappear or appear
+        are removed from or inserted into the view in runs.
+        """
+        self.hiddenIds.difference_update(newlyShown)
+        self.hiddenIds.update(newlyHidden)
+        hiddenRaws = self._hiddenRaws
+        hiddenRaws.difference_update(oid.raw for oid in newlyShown)
+        hiddenRaws.update(oid.raw for oid in newlyHidden)
+
+        sequence = self.clModel._commitSequence
+        numCommits = len(sequence)
+        refMask = self._refMask
+        filterMask = self.filterMask
+        removedRows = []
+        insertedRows = []
+
+        for row in sorted(changedRows):
+            if not 1 <= row < numCommits:
+                continue
+            shown = sequence.rawIdAt(row) not in hiddenRaws
+            if refMask[row] == shown:
+                continue
+            refMask[row] = shown
+            if filterMask is not None and filterMask[row] != FilterVerdict.Accept:
+                continue  # still hidden by the filter mode
+            (insertedRows if shown else removedRows).append(row)
+
+        self._removeVisibleRows(removedRows)
+        self._insertVisibleRows(insertedRows)
+
+    def extendHiddenCommits(self, hiddenIds: set[Oid]):
+        """
+        Hide more commits without refiltering. Only use this if the
+        newly-hidden commits haven't been added to the source model yet.
+        """
+        self.hiddenIds.update(hiddenIds)
+        self._hiddenRaws.update(oid.raw for oid in hiddenIds)
+
+    @benchmark
+    def setFilterMask(self, mask: bytearray | None):
+        """
+        Show only the rows whose verdict is FilterVerdict.Accept in the mask.
+        The mask must have one verdict per source row. Pass None to turn off
+        the filter mode.
+        """
+        assert mask is None or len(mask) == self.clModel.rowCount()
+        self.filterMask = mask
+        self._refilter()
+
+    def makePendingFilterMask(self) -> bytearray:
+        """ A filter mask in which all commits are pending evaluation. """
+        return self._makeFilterMask(0, self.clModel.rowCount(), FilterVerdict.Pending)
+
+    def hasPendingFilterRows(self) -> bool:
+        return self.filterMask is not None and FilterVerdict.Pending in self.filterMask
+
+    def numVisibleCommits(self) -> int:
+        """ Number of commits shown in the log, not counting special rows. """
+        numCommits = len(self.clModel._commitSequence)
+        return self._proxyPosition(numCommits) - self._proxyPosition(1)
+
+    def _makeRefMask(self, first: int, stop: int) -> bytearray:
+        mask = bytearray(b"\1") * (stop - first)
+        hiddenRaws = self._hiddenRaws
+        if not hiddenRaws:
+            return mask
+
+        # Only copy the raw ids of the rows we're interested in
+        start = max(first, 1)
+        rawIds = self.clModel._commitSequence.rawIdsBetween(start, stop)
+        for offset in range(0, len(rawIds), OID_SIZE):
+            if rawIds[offset: offset + OID_SIZE] in hiddenRaws:
+                mask[start - first + offset // OID_SIZE] = 0
+        return mask
+
+    def _makeFilterMask(self, first: int, stop: int, verdict: FilterVerdict) -> bytearray:
+        mask = bytearray([verdict]) * (stop - first)
+        # The uncommitted changes and the extra special row are always shown
+        numCommits = len(self.clModel._commitSequence)
+        if first == 0 and stop > 0:
+            mask[0] = FilterVerdict.Accept
+        if stop > numCommits:
+            mask[max(0, numCommits - first):] = bytes([FilterVerdict.Accept]) * (stop - max(first, numCommits))
+        return mask
+
+    def _visibilityMask(self, first: int, stop: int) -> bytes:
+        refMask = self._refMask[first: stop]
+        if self.filterMask is None:
+            return refMask
+        filterMask = self.filterMask[first: stop].translate(_ACCEPTED_VERDICTS)
+        # AND both masks together in one go
+        both = int.from_bytes(refMask, "little") & int.from_bytes(filterMask, "little")
+        return both.to_bytes(stop - first, "little")
+
+    def _removeVisibleRows(self, sourceRows: list[int]):
+        """ Remove some visible source rows (in ascending order) from the view. """
+        visibleRows = self._visibleRows
+        positions = [self._proxyRow(row) for row in sourceRows]
+
+        # Remove runs of adjacent proxy rows, bottom-up so that the positions above stay valid
+        end = len(positions)
+        while end > 0:
+            start = end - 1
+            while start > 0 and positions[start - 1] == positions[start] - 1:
+                start -= 1
+            first, last = positions[start], positions[end - 1]
+            self.beginRemoveRows(QModelIndex(), first, last)
+            del visibleRows[first: last + 1]
+            self.endRemoveRows()
+            end = start
+
+    def _insertVisibleRows(self, sourceRows: list[int]):
+        """ Insert some hidden source rows (in ascending order) into the view. """
+        visibleRows = self._visibleRows
+        offset = self._rowOffset
+        positions = [self._proxyPosition(row) for row in sourceRows]
+
+        # Insert runs of rows that land in the same spot, bottom-up so that the positions above stay valid
+        end = len(positions)
+        while end > 0:
+            start = end - 1
+            while start > 0 and positions[start - 1] == positions[start]:
+                start -= 1
+            position = positions[start]
+            self.beginInsertRows(QModelIndex(), position, position + end - start - 1)
+            visibleRows[position: position] = array("i", (row - offset for row in sourceRows[start: end]))
+            self.endInsertRows()
+            end = start
+
+    def _refilter(self):
+        """ Rebuild the visible rows from scratch and let the view know about it. """
+        self.layoutAboutToBeChanged.emit()
+
+        oldIndexes = self.persistentIndexList()
+        sourceRows = [self._sourceRow(index.row()) for index in oldIndexes]
+
+        numRows = len(self._refMask)
+        self._visibleRows = array("i", compress(range(numRows), self._visibilityMask(0, numRows)))
+        self._rowOffset = 0
+
+        newIndexes = []
+        for row in sourceRows:
+            position = self._proxyRow(row)
+            newIndexes.append(self.createIndex(position, 0) if position >= 0 else QModelIndex())
+        self.changePersistentIndexList(oldIndexes, newIndexes)
+
+        self.layoutChanged.emit()
+
+    # -------------------------------------------------------------------------
+    # Source model changes
+
+    def onSourceModelReset(self):
+        numRows = self.clModel.rowCount()
+        self._refMask = self._makeRefMask(0, numRows)
+        if self.filterMask is not None:
+            self.filterMask = self._makeFilterMask(0, numRows, FilterVerdict.Pending)
+        self._visibleRows = array("i", compress(range(numRows), self._visibilityMask(0, numRows)))
+        self._rowOffset = 0
+        self.endResetModel()
+
+    def onSourceRowsInserted(self, parent: QModelIndex, first: int, last: int):
+        numInserted = last - first + 1
+        stop = last + 1
+
+        # New rows are pending evaluation by the filter
+        self._refMask[first: first] = self._makeRefMask(first, stop)
+        if self.filterMask is not None:
+            self.filterMask[first: first] = self._makeFilterMask(first, stop, FilterVerdict.Pending)
+
+        newRows = array("i", compress(range(first, stop), self._visibilityMask(first, stop)))
+        position = self._proxyPosition(first)
+        visibleRows = self._visibleRows
+
+        if newRows:
+            self.beginInsertRows(QModelIndex(), position, position + len(newRows) - 1)
+
+        if first == 0:
+            # Rows inserted at the top: shift the existing rows down for free
+            self._rowOffset += numInserted
+        elif position < len(visibleRows):
+            # Insertion in the middle of the log (unusual)
+            visibleRows[position:] = array("i", (row + numInserted for row in visibleRows[position:]))
+
+        offset = self._rowOffset
+        visibleRows[position: position] = array("i", (row - offset for row in newRows))
+
+        if newRows:
+            self.endInsertRows()
+
+    def onSourceRowsRemoved(self, parent: QModelIndex, first: int, last: int):
+        numRemoved = last - first + 1
+
+        del self._refMask[first: last + 1]
+        if self.filterMask is not None:
+            del self.filterMask[first: last + 1]
+
+        start = self._proxyPosition(first)
+        stop = self._proxyPosition(last + 1)
+        visibleRows = self._visibleRows
+
+        if start < stop:
+            self.beginRemoveRows(QModelIndex(), start, stop - 1)
+        del visibleRows[start: stop]
+
+        if first == 0:
+            # Rows removed from the top: shift the remaining rows up for free
+            self._rowOffset -= numRemoved
+        elif start < len(visibleRows):
+            visibleRows[start:] = array("i", (row - numRemoved for row in visibleRows[start:]))
+
+        if start < stop:
+            self.endRemoveRows()
+
+    def onSourceDataChanged(self, topLeft: QModelIndex, bottomRight: QModelIndex, roles=()):
+        start = self._proxyPosition(topLeft.row())
+        stop = self._proxyPosition(bottomRight.row() + 1)
+        if start < stop:
+            self.dataChanged.emit(self.index(start, 0), self.index(stop - 1, 0), roles)
+
+    # -------------------------------------------------------------------------
+    # Mapping
+
+    def _proxyPosition(self, sourceRow: int) -> int:
+        """ Proxy row of the first visible source row at or below sourceRow. """
+        return bisect_left(self._visibleRows, sourceRow - self._rowOffset)
+
+    def _proxyRow(self, sourceRow: int) -> int:
+        """ Proxy row of a source row, or -1 if the source row is hidden. """
+        position = self._proxyPosition(sourceRow)
+        visibleRows = self._visibleRows
+        if position < len(visibleRows) and visibleRows[position] + self._rowOffset == sourceRow:
+            return position
+        return -1
+
+    def _sourceRow(self, proxyRow: int) -> int:
+        return self._visibleRows[proxyRow] + self._rowOffset
+
+    def mapFromSource(self, sourceIndex: QModelIndex) -> QModelIndex:
+        if not sourceIndex.isValid():
+            return QModelIndex()
+        row = self._proxyRow(sourceIndex.row())
+        if row < 0:
+            return QModelIndex()
+        return self.createIndex(row, 0)
+
+    def mapToSource(self, proxyIndex: QModelIndex) -> QModelIndex:
+        if not proxyIndex.isValid():
+            return QModelIndex()
+        return self.clModel.index(self._sourceRow(proxyIndex.row()), 0)
+
+    def index(self, row: int, column: int = 0, parent: QModelIndex = QModelIndex_default) -> QModelIndex:
+        if parent.isValid() or column != 0 or not (0 <= row < len(self._visibleRows)):
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index: QModelIndex) -> QModelIndex:
+        # It's not a tree model so there's no parent
+        return QModelIndex()
+
+    def rowCount(self, parent: QModelIndex = QModelIndex_default) -> int:
+        return 0 if parent.isValid() else len(self._visibleRows)
+
+    def columnCount(self, parent: QModelIndex = QModelIndex_default) -> int:
+        return 1
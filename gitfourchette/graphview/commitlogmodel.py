@@ -7,6 +7,7 @@
 from dataclasses import dataclass
 from typing import Literal
 
+from gitfourchette.graph import CommitSequence, MockCommit
 from gitfourchette.localization import *
 from gitfourchette.porcelain import *
 from gitfourchette.qt import *
@@ -34,6 +35,9 @@ class CommitLogModel(QAbstractListModel):
     ToolTipCacheSize = 150
     """ Number of rows to keep track of for ToolTipZones """
 
+    CommitCacheSize = 500
+    """ Number of full commits to keep around for the rows that are being displayed """
+
     class Role:
         Commit          = Qt.ItemDataRole.UserRole + 0
         Oid             = Qt.ItemDataRole.UserRole + 1
@@ -42,16 +46,23 @@ class CommitLogModel(QAbstractListModel):
         SpecialRow      = Qt.ItemDataRole.UserRole + 4
 
     # Reference to RepoState.commitSequence
-    _commitSequence: list[Commit]
+    _commitSequence: CommitSequence
     _extraRow: SpecialRow
 
+    repo: Repo | None
+    "Repository in which to look up the full commits (the sequence only has their ids)."
+
+    _commitCache: dict[Oid, Commit]
+
     _authorColumnX: int
     _toolTipZones: dict[int, list[CommitToolTipZone]]
 
     def __init__(self, parent):
         super().__init__(parent)
-        self._commitSequence = []
+        self._commitSequence = CommitSequence()
         self._extraRow = SpecialRow.Invalid
+        self.repo = None
+        self._commitCache = {}
         self._authorColumnX = -1
         self._toolTipZones = {}
 
@@ -60,16 +71,46 @@ class CommitLogModel(QAbstractListModel):
         return self._commitSequence is not None
 
     def clear(self):
-        self.setCommitSequence([])
+        self.setCommitSequence(CommitSequence())
+        self._commitCache.clear()
         self._toolTipZones.clear()
         self._extraRow = SpecialRow.Invalid
 
-    def setCommitSequence(self, newCommitSequence: list[Commit]):
+    def setCommitSequence(self, newCommitSequence: CommitSequence):
         self.beginResetModel()
         self._commitSequence = newCommitSequence
         self.endResetModel()
 
-    def mendCommitSequence(self, nRemovedRows: int, nAddedRows: int, newCommitSequence: list[Commit]):
+    def extendCommitSequence(self, newCommitSequence: CommitSequence, extraRow: SpecialRow = SpecialRow.Invalid):
+        """
+        Append rows at the bottom of the log without resetting the model.
+        The new sequence must begin with the commits that are already in the
+        model (this lets us show a large history while it's still loading,
+        or load more commits below a truncated history).
+        """
+        assert len(newCommitSequence) >= len(self._commitSequence)
+
+        numOldCommits = len(self._commitSequence)
+        replaceExtraRow = len(newCommitSequence) > numOldCommits or extraRow != self._extraRow
+        if self._extraRow != SpecialRow.Invalid and replaceExtraRow:
+            # Get the extra row out of the way before appending commits below it
+            self.beginRemoveRows(QModelIndex(), numOldCommits, numOldCommits)
+            self._extraRow = SpecialRow.Invalid
+            self.endRemoveRows()
+
+        oldRowCount = self.rowCount()
+        newRowCount = len(newCommitSequence) + (extraRow != SpecialRow.Invalid)
+
+        if newRowCount == oldRowCount:
+            self._commitSequence = newCommitSequence
+            return
+
+        self.beginInsertRows(QModelIndex(), oldRowCount, newRowCount - 1)
+        self._commitSequence = newCommitSequence
+        self._extraRow = extraRow
+        self.endInsertRows()
+
+    def mendCommitSequence(self, nRemovedRows: int, nAddedRows: int, newCommitSequence: CommitSequence):
         parent = QModelIndex()  # it's not a tree model so there's no parent
 
         self._commitSequence = newCommitSequence
@@ -84,6 +125,27 @@ class CommitLogModel(QAbstractListModel):
             self.beginInsertRows(parent, 0, nAddedRows)
             self.endInsertRows()
 
+    def commitAt(self, row: int) -> Commit | MockCommit | None:
+        commit = self._commitSequence[row]
+        oid = commit.id
+
+        if oid == UC_FAKEID or self.repo is None:
+            return commit
+
+        # Bump commit to end of keys so it survives trimming
+        # (dicts keep key insertion order in Python 3.7+)
+        try:
+            fullCommit = self._commitCache.pop(oid)
+        except KeyError:
+            try:
+                fullCommit = self.repo.peel_commit(oid)
+            except KeyError:
+                return None
+
+        self._commitCache[oid] = fullCommit
+        trimCacheDict(self._commitCache, CommitLogModel.CommitCacheSize)
+        return fullCommit
+
     def rowCount(self, *args, **kwargs) -> int:
         if not self.isValid:
             return 0
@@ -104,7 +166,7 @@ class CommitLogModel(QAbstractListModel):
 
         elif role == CommitLogModel.Role.Commit:
             try:
-                return self._commitSequence[row]
+                return self.commitAt(row)
             except IndexError:
                 pass
 
@@ -128,7 +190,7 @@ class CommitLogModel(QAbstractListModel):
             tip = ""
 
             try:
-                commit = self._commitSequence[row]
+                commit = self.commitAt(row)
                 zones = self._toolTipZones[row]
             except (IndexError, KeyError):
                 return tip
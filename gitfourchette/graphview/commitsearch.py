@@ -0,0 +1,294 @@
+# -----------------------------------------------------------------------------
+# Copyright (C) 2025 Iliyas Jorio.
+# This file is part of GitFourchette, distributed under the GNU GPL v3.
+# For full terms, see the included LICENSE file.
+# -----------------------------------------------------------------------------
+
+from __future__ import annotations
+
+import datetime
+import enum
+import re
+from bisect import bisect_left, bisect_right
+from collections.abc import Iterator
+from dataclasses import dataclass
+
+from gitfourchette.graph import CommitSequence
+from gitfourchette.graph.commitsequence import OID_SIZE
+from gitfourchette.localization import *
+from gitfourchette.porcelain import Oid, Repo, Tree
+from gitfourchette.toolbox import AuthorDisplayStyle, abbreviatePerson
+
+HEX_PATTERN = re.compile(r"[0-9a-f]{1,40}")
+
+FILTER_KEY_PATTERN = re.compile(r'(?<!\S)(author|path|since|after|until|before):(?:"([^"]*)"|(\S+))', re.IGNORECASE)
+
+
+class FilterVerdict(enum.IntEnum):
+    """ Outcome of CommitFilterQuery for a row in the commit log (stored in a bytearray mask). """
+    Reject = 0
+    Accept = 1
+    Pending = 2
+
+
+@dataclass(frozen=True)
+class CommitFilterQuery:
+    """
+    Criteria for the commit log's filter mode, e.g.:
+    `author:jane path:src/ since:2024-01-01 until:2024-06-30 fix(es)?`
+
+    Anything that isn't a `key:value` pair is a regular expression that the
+    message must match (case-insensitive). All criteria must be met.
+    """
+
+    author: str = ""
+    "Lowercase substring of the author's name or email."
+
+    path: str = ""
+    "The commit must modify this file or directory."
+
+    since: int | None = None
+    "Earliest author timestamp (inclusive)."
+
+    until: int | None = None
+    "Latest author timestamp (exclusive)."
+
+    message: re.Pattern | None = None
+    "Case-insensitive pattern to look for in the message."
+
+    @staticmethod
+    def parse(text: str) -> CommitFilterQuery:
+        """ Raise ValueError with a user-facing message if the query is malformed. """
+        criteria = {}
+
+        def parseDate(value: str, nextDay: bool) -> int:
+            try:
+                date = datetime.date.fromisoformat(value)
+            except ValueError as exc:
+                raise ValueError(_("Invalid date: {0}. Use the YYYY-MM-DD format.", value)) from exc
+            if nextDay:
+                date += datetime.timedelta(days=1)
+            return int(datetime.datetime.combine(date, datetime.time()).timestamp())
+
+        def takeKey(match: re.Match) -> str:
+            key = match.group(1).lower()
+            value = match.group(2) if match.group(2) is not None else match.group(3)
+            if key == "author":
+                criteria["author"] = value.lower()
+            elif key == "path":
+                path = value.strip("/")
+                if not path:
+                    raise ValueError(_("Invalid path: {0}", value))
+                criteria["path"] = path
+            elif key in ("since", "after"):
+                criteria["since"] = parseDate(value, nextDay=False)
+            else:
+                criteria["until"] = parseDate(value, nextDay=True)
+            return ""
+
+        # Whatever's left between the key:value pairs makes up the message pattern
+        rest = " ".join(FILTER_KEY_PATTERN.sub(takeKey, text).split())
+
+        if rest:
+            try:
+                criteria["message"] = re.compile(rest, re.IGNORECASE)
+            except re.error as exc:
+                raise ValueError(_("Invalid regular expression: {0}", str(exc))) from exc
+
+        return CommitFilterQuery(**criteria)
+
+
+class CommitSearchIndex:
+    """
+    Lowercased text of the commits in the log, for the commit search bar.
+
+    Looking up a commit and lowercasing its message is by far the slowest part
+    of a search, so the text of each commit is kept around once it's been
+    indexed. Entries are keyed by raw commit id: commits are immutable, so the
+    entries remain valid across refreshes, wherever the commits end up in the
+    log. The commit ids themselves are searched straight from the raw ids in
+    the commit sequence.
+
+    The index is filled in as needed by the SearchCommits task, on the worker
+    thread, so it only grows when the user is actually searching.
+    """
+
+    authorStyle: AuthorDisplayStyle
+    "Author display style that the author names were abbreviated with."
+
+    texts: dict[bytes, str]
+    "Lowercased message and abbreviated author of each indexed commit, separated by a NUL character."
+
+    people: dict[bytes, str]
+    "Lowercased full name and email of the author of each indexed commit (for the filter mode)."
+
+    times: dict[bytes, int]
+    "Author timestamp of each indexed commit (for the filter mode)."
+
+    _uniquePeople: dict[str, str]
+    "Lets commits by the same author share a single string in `people`."
+
+    def __init__(self, authorStyle: AuthorDisplayStyle):
+        self.authorStyle = authorStyle
+        self.texts = {}
+        self.people = {}
+        self.times = {}
+        self._uniquePeople = {}
+
+    def __len__(self):
+        return len(self.texts)
+
+    def indexCommits(self, repo: Repo, rawIds: bytes, start: int, stop: int):
+        """ Index the commits in rows start to stop that aren't in the index yet. """
+        texts = self.texts
+
+        for offset in range(start * OID_SIZE, stop * OID_SIZE, OID_SIZE):
+            raw = rawIds[offset: offset + OID_SIZE]
+            if raw not in texts:
+                self._indexCommit(repo, raw)
+
+    def _indexCommit(self, repo: Repo, raw: bytes) -> str:
+        try:
+            commit = repo.peel_commit(Oid(raw=raw))
+        except KeyError:
+            self.texts[raw] = ""
+            return ""
+
+        author = commit.author
+        abbreviated = abbreviatePerson(author, self.authorStyle)
+        text = f"{commit.message.lower()}\0{abbreviated.lower()}"
+        person = f"{author.name}\0{author.email}".lower()
+
+        self.texts[raw] = text
+        self.people[raw] = self._uniquePeople.setdefault(person, person)
+        self.times[raw] = author.time
+        return text
+
+    def search(self, rawIds: bytes, start: int, stop: int, term: str, likelyHash: bool) -> list[int]:
+        """
+        Return the rows between start and stop (in ascending order) whose
+        commits contain the search term in their message or author, or whose
+        hash starts with the search term if likelyHash is set.
+
+        The term must be lowercase. Commits that aren't indexed yet don't match
+        (except by hash).
+        """
+        assert term == term.lower(), "search term should have been sanitized"
+        texts = self.texts
+        rows = []
+
+        if likelyHash and HEX_PATTERN.fullmatch(term):
+            # Compare the whole bytes of the prefix, then the odd nibble (if any)
+            prefix = bytes.fromhex(term[:len(term) & ~1])
+            nibble = int(term[-1], 16) if len(term) & 1 else -1
+            prefixEnd = len(prefix)
+        else:
+            prefix = None
+            nibble = prefixEnd = -1
+
+        for row in range(start, stop):
+            raw = rawIds[row * OID_SIZE: (row + 1) * OID_SIZE]
+            if prefix is not None and raw.startswith(prefix) and (nibble < 0 or raw[prefixEnd] >> 4 == nibble):
+                rows.append(row)
+            elif term in texts.get(raw, ""):  # the term can't straddle the NUL between message and author
+                rows.append(row)
+
+        return rows
+
+    def filterCommits(self, repo: Repo, rawIds: bytes, mask: bytearray, start: int, stop: int,
+                      query: CommitFilterQuery):
+        """
+        Evaluate the query for the rows between start and stop whose verdict
+        is pending in the mask, indexing the commits as needed.
+
+        The criteria are checked from cheapest to costliest: the path is only
+        looked up in the trees of the commits that meet all other criteria.
+        """
+        texts = self.texts
+        people = self.people
+        times = self.times
+        author, path, since, until, message = query.author, query.path, query.since, query.until, query.message
+        checkTime = since is not None or until is not None
+        since = since if since is not None else -(1 << 63)
+        until = until if until is not None else 1 << 63
+
+        row = mask.find(FilterVerdict.Pending, start, stop)
+        while row >= 0:
+            raw = rawIds[row * OID_SIZE: (row + 1) * OID_SIZE]
+
+            text = texts.get(raw)
+            if text is None:
+                text = self._indexCommit(repo, raw)
+
+            accept = (
+                bool(text)
+                and (not author or author in people[raw])
+                and (not checkTime or since <= times[raw] < until)
+                and (message is None or message.search(text, 0, text.find("\0")) is not None)
+                and (not path or self.touchesPath(repo, raw, path))
+            )
+            mask[row] = FilterVerdict.Accept if accept else FilterVerdict.Reject
+
+            row = mask.find(FilterVerdict.Pending, row + 1, stop)
+
+    @staticmethod
+    def touchesPath(repo: Repo, raw: bytes, path: str) -> bool:
+        """
+        Return True if the commit modifies a file or directory, i.e. if the
+        path is different in all of the commit's parents (like `git log -- path`).
+        """
+        def entryId(tree: Tree):
+            try:
+                return tree[path].id
+            except KeyError:
+                return None
+
+        try:
+            commit = repo.peel_commit(Oid(raw=raw))
+            ours = entryId(commit.tree)
+            parents = commit.parents
+        except KeyError:  # missing objects (e.g. shallow clone)
+            return False
+
+        if not parents:
+            return ours is not None
+        return all(entryId(parent.tree) != ours for parent in parents)
+
+
+@dataclass
+class CommitSearchResults:
+    """
+    Sorted rows of the commits that match a search term in a commit sequence.
+
+    The sequence is searched from the top down. While the search is running,
+    the results only cover the rows above `stop`.
+    """
+
+    term: str
+    likelyHash: bool
+    sequence: CommitSequence
+    rows: list[int]
+    stop: int
+
+    def isValidFor(self, term: str, likelyHash: bool, sequence: CommitSequence) -> bool:
+        return self.term == term and self.likelyHash == likelyHash and self.sequence is sequence
+
+    def isComplete(self) -> bool:
+        return self.stop >= len(self.sequence)
+
+    def rowsBetween(self, start: int, last: int) -> Iterator[int]:
+        """
+        Yield the matching rows from start to last (inclusive), in that order:
+        if last is above start, the rows are yielded from the bottom up.
+        """
+        rows = self.rows
+        if start <= last:
+            i = bisect_left(rows, start)
+            while i < len(rows) and rows[i] <= last:
+                yield rows[i]
+                i += 1
+        else:
+            i = bisect_right(rows, start) - 1
+            while i >= 0 and rows[i] >= last:
+                yield rows[i]
+                i -= 1
@@ -6,11 +6,13 @@
 
 import logging
 from collections.abc import Set
+from dataclasses import dataclass
 
 from gitfourchette import colors
 from gitfourchette import settings
-from gitfourchette.graph import Frame
+from gitfourchette.graph import Arc, Frame
 from gitfourchette.graph.graph import Oid
+from gitfourchette.graphview.commitlogmodel import trimCacheDict
 from gitfourchette.qt import *
 from gitfourchette.repomodel import RepoModel, UC_FAKEID
 
@@ -74,15 +76,196 @@ def getCommitBulletColumn(
     return myLanePosition, columnCount
 
 
+@dataclass(slots=True)
+class RowLayout:
+    """
+    Everything paintGraphFrame needs to draw a commit's row, in columns
+    (horizontal positions) rather than lanes, so that repainting a row
+    doesn't require any work on the graph.
+    """
+
+    laneColumns: list[tuple[int, int]]
+    "Table of lanes to columns above and below the commit."
+
+    numColumns: int
+    bulletColumn: int
+    bulletColor: QColor
+
+    passingArcs: list[tuple[int, int, QColor, bool]]
+    "Arcs passing by the commit: (column above, column below, color, stipple)."
+
+    closedArcs: list[tuple[int, QColor, bool]]
+    "Arcs closed by the commit, in drawing order: (column above, color, stipple)."
+
+    openedArcs: list[tuple[int, QColor, bool]]
+    "Arcs opened by the commit, in drawing order: (column below, color, stipple)."
+
+    junctions: list[tuple[int, QColor]]
+    "Junctions at the commit: (column below, color)."
+
+
+def computeRowLayout(repoModel: RepoModel, oid: Oid, myRow: int, frame: Frame | None = None) -> RowLayout:
+    hiddenCommits = repoModel.hiddenCommits
+
+    # Get graph frame for this row (unless the caller has it already)
+    if frame is None:
+        frame = repoModel.graph.getFrame(myRow)
+    assert frame.commit == oid
+    assert frame.row == myRow
+
+    # Get the commit's lane ID
+    commitLane = frame.homeLane()
+
+    # Flatten the lanes so there are no horizontal gaps in-between the lanes (optional).
+    # laneColumnsAB is a table of lanes to columns (horizontal positions).
+    laneColumnsAB, numFlattenedColumns = flattenLanes(frame, hiddenCommits)
+
+    # Get column (horizontal position) of commit bullet point.
+    myColumn, numFlattenedColumns = getCommitBulletColumn(commitLane, numFlattenedColumns, laneColumnsAB)
+
+    if frame.commit in hiddenCommits:
+        arcsPassingByCommit = _dummyEmptyList
+        arcsOpenedByCommit = _dummyEmptyList
+        arcsClosedByCommit = _dummyEmptyList
+        junctionsAtCommit = _dummyEmptyList
+    else:
+        arcsPassingByCommit = frame.arcsPassingByCommit(hiddenCommits)
+        arcsOpenedByCommit = list(frame.arcsOpenedByCommit(hiddenCommits))
+        arcsClosedByCommit = list(frame.arcsClosedByCommit(hiddenCommits))
+        junctionsAtCommit = frame.junctionsAtCommit(hiddenCommits)
+
+    def arcColor(arc: Arc, stipple: bool) -> QColor:
+        return UC_COLOR if stipple else getColor(arc.lane)
+
+    passingArcs = []
+    for arc in arcsPassingByCommit:
+        columnA, columnB = laneColumnsAB[arc.lane]  # column above, column below
+        stipple = arc.openedBy == UC_FAKEID
+        passingArcs.append((columnA, columnB, arcColor(arc, stipple), stipple))
+
+    closedArcs = []
+    for arc in reversed(arcsClosedByCommit):
+        columnA, _dummy = laneColumnsAB[arc.lane]
+        stipple = arc.openedBy == UC_FAKEID
+        closedArcs.append((columnA, arcColor(arc, stipple), stipple))
+
+    openedArcs = []
+    for arc in reversed(arcsOpenedByCommit):
+        _dummy, columnB = laneColumnsAB[arc.lane]
+        stipple = arc.openedBy == UC_FAKEID
+        openedArcs.append((columnB, arcColor(arc, stipple), stipple))
+
+    junctions = []
+    for arc, _junction in junctionsAtCommit:
+        _dummy, columnB = laneColumnsAB[arc.lane]
+        junctions.append((columnB, getColor(arc.lane)))
+
+    return RowLayout(
+        laneColumns=laneColumnsAB,
+        numColumns=numFlattenedColumns,
+        bulletColumn=myColumn,
+        bulletColor=getColor(commitLane) if oid != UC_FAKEID else UC_COLOR,
+        passingArcs=passingArcs,
+        closedArcs=closedArcs,
+        openedArcs=openedArcs,
+        junctions=junctions)
+
+
+class RowLayoutCache:
+    """
+    Caches the RowLayout of recently-painted commits, and of the commits that
+    GraphView expects to paint soon (see prefetch).
+
+    The cache is flushed whenever the layouts may have become stale: when the
+    graph is replaced or spliced, when the set of hidden commits changes, or
+    when the flattenLanes pref is toggled.
+    """
+
+    CacheSize = 1000
+    """ Number of rows to keep layouts for (the cache may hold up to twice as many) """
+
+    layouts: dict[Oid, RowLayout]
+
+    def __init__(self):
+        self.layouts = {}
+        self.graph = None
+        self.generation = -1
+        self.hiddenCommits = None
+        self.hiddenCommitsGeneration = -1
+        self.flattenLanes = settings.prefs.flattenLanes
+
+    def clear(self):
+        self.layouts.clear()
+
+    def validate(self, repoModel: RepoModel):
+        """ Flush the cache if anything that the layouts depend on has changed since the last call. """
+        graph = repoModel.graph
+        hiddenCommits = repoModel.hiddenCommits
+        flatten = settings.prefs.flattenLanes
+
+        if (graph is self.graph
+                and graph.generation == self.generation
+                and hiddenCommits is self.hiddenCommits
+                and repoModel.hiddenCommitsGeneration == self.hiddenCommitsGeneration  # the set may be patched in place
+                and flatten == self.flattenLanes):
+            return
+
+        self.layouts.clear()
+        self.graph = graph
+        self.generation = graph.generation
+        self.hiddenCommits = hiddenCommits
+        self.hiddenCommitsGeneration = repoModel.hiddenCommitsGeneration
+        self.flattenLanes = flatten
+
+    def get(self, repoModel: RepoModel, oid: Oid, row: int) -> RowLayout:
+        self.validate(repoModel)
+
+        # Bump layout to end of keys so it survives trimming
+        try:
+            layout = self.layouts.pop(oid)
+        except KeyError:
+            pass
+        else:
+            self.layouts[oid] = layout
+            return layout
+
+        layout = computeRowLayout(repoModel, oid, row)
+        self.layouts[oid] = layout
+        trimCacheDict(self.layouts, RowLayoutCache.CacheSize)
+        return layout
+
+    def prefetch(self, repoModel: RepoModel, startRow: int, stopRow: int) -> int:
+        """
+        Compute the layouts of the graph rows from startRow to stopRow
+        (exclusive) ahead of time, so that painting them doesn't have to seek
+        through the graph. Return the number of rows that were laid out.
+
+        All rows are obtained from a single playback of the graph.
+        """
+        self.validate(repoModel)
+        layouts = self.layouts
+        numComputed = 0
+
+        for frame in repoModel.graph.getFrames(startRow, stopRow):
+            oid = frame.commit
+            if oid in layouts:
+                continue
+            layouts[oid] = computeRowLayout(repoModel, oid, int(frame.row), frame)
+            numComputed += 1
+
+        trimCacheDict(layouts, RowLayoutCache.CacheSize)
+        return numComputed
+
+
 def paintGraphFrame(
         repoModel: RepoModel,
         oid: Oid,
         painter: QPainter,
         rect: QRect,
-        outlineColor: QColor
+        outlineColor: QColor,
+        layoutCache: RowLayoutCache | None = None,
 ):
     graph = repoModel.graph
-    hiddenCommits = repoModel.hiddenCommits
     assert graph is not None
 
     try:
@@ -92,6 +275,11 @@ def paintGraphFrame(
         logger.warning(f"Skipping unregistered commit: {oid}")
         return
 
+    if layoutCache is not None:
+        layout = layoutCache.get(repoModel, oid, myRow)
+    else:
+        layout = computeRowLayout(repoModel, oid, myRow)
+
     painter.save()
 
     # Lines are drawn with SquareCap to fill in gaps at fractional display scaling factors.
@@ -104,23 +292,8 @@ def paintGraphFrame(
     bottom = int(rect.y() + rect.height())  # Don't use rect.bottom(), which for historical reasons doesn't return what we want (see Qt docs)
     middle = (top + bottom) // 2
 
-    # Get graph frame for this row
-    frame = graph.getFrame(myRow)
-    assert frame.commit == oid
-    assert frame.row == myRow
-
-    # Get the commit's lane ID
-    commitLane = frame.homeLane()
-
-    # Flatten the lanes so there are no horizontal gaps in-between the lanes (optional).
-    # laneColumnsAB is a table of lanes to columns (horizontal positions).
-    laneColumnsAB, numFlattenedColumns = flattenLanes(frame, hiddenCommits)
-
-    # Get column (horizontal position) of commit bullet point.
-    myColumn, numFlattenedColumns = getCommitBulletColumn(commitLane, numFlattenedColumns, laneColumnsAB)
-
-    rect.setRight(x + (numFlattenedColumns - 1) * LANE_WIDTH)
-    mx = x + myColumn * LANE_WIDTH  # the screen X of this commit's bullet point
+    rect.setRight(x + (layout.numColumns - 1) * LANE_WIDTH)
+    mx = x + layout.bulletColumn * LANE_WIDTH  # the screen X of this commit's bullet point
 
     # draw bullet point _outline_ for this commit, beneath everything else
     painter.setPen(QPen(outlineColor, 2, Qt.PenStyle.SolidLine))
@@ -129,13 +302,12 @@ def paintGraphFrame(
 
     path = QPainterPath()
 
-    def submitPath(path: QPainterPath, column, stipple=False, dashOffset = 0):
+    def submitPath(path: QPainterPath, color: QColor, stipple=False, dashOffset = 0):
         assert not path.isEmpty()
         # white outline
         painter.setPen(QPen(outlineColor, LANE_THICKNESS + 2, Qt.PenStyle.SolidLine, Qt.PenCapStyle.SquareCap, Qt.PenJoinStyle.BevelJoin))
         painter.drawPath(path)
         # actual color
-        color = UC_COLOR if stipple else getColor(column)
         cap = Qt.PenCapStyle.FlatCap if stipple else Qt.PenCapStyle.SquareCap
         pen = QPen(color, LANE_THICKNESS, Qt.PenStyle.SolidLine, cap, Qt.PenJoinStyle.BevelJoin)
         if stipple:
@@ -147,69 +319,53 @@ def paintGraphFrame(
         # clear path for next iteration
         path.clear()
 
-    if frame.commit in hiddenCommits:
-        arcsPassingByCommit = _dummyEmptyList
-        arcsOpenedByCommit = _dummyEmptyList
-        arcsClosedByCommit = _dummyEmptyList
-        junctionsAtCommit = _dummyEmptyList
-    else:
-        arcsPassingByCommit = frame.arcsPassingByCommit(hiddenCommits)
-        arcsOpenedByCommit = list(frame.arcsOpenedByCommit(hiddenCommits))
-        arcsClosedByCommit = list(frame.arcsClosedByCommit(hiddenCommits))
-        junctionsAtCommit = frame.junctionsAtCommit(hiddenCommits)
-
     # draw arcs PASSING BY commit
     cy1 = middle
     cy2 = middle
-    if not arcsOpenedByCommit:
+    if not layout.openedArcs:
         # Compress the curvature of arcs passing by a root commit    |  |  |
         # to the bottom half of the row to prevent these arcs from   O  |  |
         # looking like they are joined to the root commit in a         /  /
         # flattened graph.                                            |  |
         cy1 = bottom + 4
         cy2 = middle
-    elif not arcsClosedByCommit:
+    elif not layout.closedArcs:
         # Same, but compress above
         cy1 = middle - 4
         cy2 = top
-    for arc in arcsPassingByCommit:
-        columnA, columnB = laneColumnsAB[arc.lane]  # column above, column below
+    for columnA, columnB, color, stipple in layout.passingArcs:
         ax = x + columnA * LANE_WIDTH
         bx = x + columnB * LANE_WIDTH
         path.moveTo(ax, top)
         path.cubicTo(ax, cy1, bx, cy2, bx, bottom)
-        submitPath(path, arc.lane, arc.openedBy == UC_FAKEID)
+        submitPath(path, color, stipple)
 
     # draw arcs CLOSED BY commit (from above)
-    for arc in reversed(arcsClosedByCommit):
-        columnA, _dummy = laneColumnsAB[arc.lane]  # column above, column below
+    for columnA, color, stipple in layout.closedArcs:
         ax = x + columnA * LANE_WIDTH
         # Path from above does elbow shape to merge into commit bullet point
         path.moveTo(ax, top)
         path.quadTo(ax, middle, mx, middle)
-        submitPath(path, arc.lane, arc.openedBy == UC_FAKEID)
+        submitPath(path, color, stipple)
 
     # draw arcs OPENED BY commit (downwards)
-    for arc in reversed(arcsOpenedByCommit):
-        _dummy, columnB = laneColumnsAB[arc.lane]  # column above, column below
+    for columnB, color, stipple in layout.openedArcs:
         bx = x + columnB * LANE_WIDTH
         # Path forks downward from commit bullet point
         path.moveTo(mx, middle)
         path.quadTo(bx, middle, bx, bottom)
-        submitPath(path, arc.lane, arc.openedBy == UC_FAKEID, dashOffset=1)
+        submitPath(path, color, stipple, dashOffset=1)
 
     # draw arc junctions
-    for arc, _junction in junctionsAtCommit:
-        columnA, columnB = laneColumnsAB[arc.lane]
-        ax = x + columnA * LANE_WIDTH
+    for columnB, color in layout.junctions:
         bx = x + columnB * LANE_WIDTH
         path.moveTo(mx, middle)
         path.quadTo(bx, middle, bx, bottom)
-        submitPath(path, arc.lane)
+        submitPath(path, color)
 
     # draw bullet point for this commit
     painter.setPen(Qt.PenStyle.NoPen)
-    painter.setBrush(getColor(commitLane) if oid != UC_FAKEID else UC_COLOR)
+    painter.setBrush(layout.bulletColor)
     painter.drawEllipse(QPoint(mx, middle), DOT_RADIUS, DOT_RADIUS)
 
     # we're done, clean up
@@ -217,4 +373,3 @@ def paintGraphFrame(
 
     # add some padding to the right
     rect.setRight(rect.right() + LANE_WIDTH)
-
@@ -4,16 +4,21 @@
 # For full terms, see the included LICENSE file.
 # -----------------------------------------------------------------------------
 
+import time
+from collections import deque
+from collections.abc import Callable
 from contextlib import suppress
 
-from gitfourchette import settings
+from gitfourchette import colors, settings
 from gitfourchette.application import GFApplication
 from gitfourchette.exttools.usercommand import UserCommand
 from gitfourchette.forms.searchbar import SearchBar
-from gitfourchette.graph import MockCommit
+from gitfourchette.graph import CommitSequence
 from gitfourchette.graphview.commitlogdelegate import CommitLogDelegate
 from gitfourchette.graphview.commitlogfilter import CommitLogFilter
 from gitfourchette.graphview.commitlogmodel import CommitLogModel, SpecialRow
+from gitfourchette.graphview.commitsearch import CommitFilterQuery, CommitSearchIndex, CommitSearchResults
+from gitfourchette.graphview.rowtextcache import RowText, RowTextStyle
 from gitfourchette.localization import *
 from gitfourchette.nav import NavLocator, NavContext
 from gitfourchette.porcelain import *
@@ -27,9 +32,52 @@ class GraphView(QListView):
     linkActivated = Signal(str)
     statusMessage = Signal(str)
 
+    PrefetchRows = 200
+    """ Number of rows above and below the viewport whose text is formatted ahead of time """
+
+    FrameLookahead = 100
+    """ Minimum number of rows past the viewport whose graph is laid out ahead of time """
+
+    FrameLookaheadMax = 600
+    """ Maximum number of rows past the viewport whose graph is laid out ahead of time """
+
+    FrameLookaheadSeconds = 0.5
+    """ Lay out the graph for the rows expected to scroll into view within this time """
+
+    FramePrefetchChunk = 50
+    """ Number of rows whose graph is laid out in a single slice of idle time """
+
     clModel: CommitLogModel
     clFilter: CommitLogFilter
 
+    searchIndex: CommitSearchIndex | None
+    "Text of the commits that have been searched so far."
+
+    searchResults: CommitSearchResults | None
+    "Matching rows for the latest search term (possibly partial while SearchCommits is running)."
+
+    searchProbe: bool
+    "True while looking for a match among partial search results (see SearchPending)."
+
+    filterQuery: CommitFilterQuery | None
+    "Query that narrows down the commit log in filter mode. None if the filter mode is off."
+
+    filterMaskQuery: CommitFilterQuery | None
+    "Query whose verdicts are in clFilter's mask (lags behind filterQuery until the first results come in)."
+
+    filterError: str
+    "Why the query in the search bar couldn't be parsed, in filter mode."
+
+    scrollVelocity: float
+    "Smoothed scrolling speed, in rows per second (negative when scrolling up)."
+
+    framePrefetchQueue: deque[range]
+    "Chunks of rows whose graph remains to be laid out ahead of time, in order."
+
+    class SearchPending(Exception):
+        """ Raised by searchRange if the partial search results can't tell
+        whether the range contains a match yet. """
+
     class SelectCommitError(KeyError):
         def __init__(self, oid: Oid, foundButHidden: bool, likelyTruncated: bool = False):
             super().__init__()
@@ -56,6 +104,13 @@ class GraphView(QListView):
         self.clFilter = CommitLogFilter(self)
         self.clFilter.setSourceModel(self.clModel)
 
+        self.searchIndex = None
+        self.searchResults = None
+        self.searchProbe = False
+        self.filterQuery = None
+        self.filterMaskQuery = None
+        self.filterError = ""
+
         self.setModel(self.clFilter)
 
         # Massive perf boost when displaying/updating huge commit logs
@@ -74,6 +129,54 @@ class GraphView(QListView):
         self.searchBar.setUpItemViewBuddy()
         self.searchBar.hide()
         self.clFilter.rowsAboutToBeInserted.connect(self.searchBar.invalidateBadStem)
+        self.clFilter.layoutAboutToBeChanged.connect(self.searchBar.invalidateBadStem)
+
+        # Filter mode: narrow down the commit log to the commits that match the search bar's query
+        self.filterCountLabel = QLabel(self.searchBar)
+        self.filterCountLabel.hide()
+        tweakWidgetFont(self.filterCountLabel, 85)
+        self.filterButton = QToolButton(self.searchBar)
+        self.filterButton.setText(_("Filter"))
+        self.filterButton.setCheckable(True)
+        self.filterButton.setToolTip("<p>" + _(
+            "Only show the commits that match the query. "
+            "You can narrow down the commits with {author}, {path}, {since} and {until}. "
+            "The rest of the query is a regular expression to look for in the messages.",
+            author="<code>author:name</code>", path="<code>path:dir/file</code>",
+            since="<code>since:YYYY-MM-DD</code>", until="<code>until:YYYY-MM-DD</code>"))
+        self.filterButton.toggled.connect(self.setFilterMode)
+        self.searchBar.ui.horizontalLayout.insertWidget(1, self.filterCountLabel)
+        self.searchBar.ui.horizontalLayout.insertWidget(2, self.filterButton)
+        self.searchBar.searchPulse.connect(self.applyFilter)
+        self.searchBar.searchTermChanged.connect(lambda term: term or self.applyFilter())
+        self.searchBar.visibilityChanged.connect(self.onSearchBarVisibilityChanged)
+        self.clFilter.layoutChanged.connect(self.updateFilterStatus)
+        self.clFilter.rowsInserted.connect(self.updateFilterStatus)
+        self.clFilter.rowsRemoved.connect(self.updateFilterStatus)
+
+        # Format the text of the rows around the viewport once scrolling settles down
+        self.prefetchTimer = QTimer(self)
+        self.prefetchTimer.setSingleShot(True)
+        self.prefetchTimer.setInterval(50)
+        self.prefetchTimer.timeout.connect(self.prefetchRowTexts)
+        self.verticalScrollBar().valueChanged.connect(self.prefetchTimer.start)
+        self.clFilter.modelReset.connect(self.prefetchTimer.start)
+        self.clFilter.layoutChanged.connect(self.prefetchTimer.start)
+        self.clFilter.rowsInserted.connect(self.prefetchTimer.start)
+
+        # Lay out the graph for the rows about to scroll into view in idle time,
+        # so that painting them doesn't have to seek through the graph
+        self.scrollVelocity = 0.0
+        self.lastScrollTop = -1
+        self.lastScrollTime = 0.0
+        self.framePrefetchQueue = deque()
+        self.framePrefetchTimer = QTimer(self)
+        self.framePrefetchTimer.setSingleShot(True)
+        self.framePrefetchTimer.timeout.connect(self.prefetchFrames)
+        self.verticalScrollBar().valueChanged.connect(self.onScrolled)
+        self.clFilter.modelReset.connect(self.scheduleFramePrefetch)
+        self.clFilter.layoutChanged.connect(self.scheduleFramePrefetch)
+        self.clFilter.rowsInserted.connect(self.scheduleFramePrefetch)
 
         self.refreshPrefs(invalidateMetrics=False)
 
@@ -159,6 +262,7 @@ class GraphView(QListView):
                 ActionDef(_("Copy Commit &Hash"), self.copyCommitHashToClipboard, shortcuts=self.copyHashShortcut.key()),
                 ActionDef(_("Copy Commit M&essage"), self.copyCommitMessageToClipboard, shortcuts=self.copyMessageShortcut.key()),
                 ActionDef(_("Get &Info…"), self.getInfoOnCurrentCommit, "SP_MessageBoxInformation", shortcuts=self.getInfoShortcut.key()),
+                ActionDef(_("Contained &In"), submenu=self.containedInActions(oid)),
                 *mainWindow.contextualUserCommands(UserCommand.Token.Commit),
             ]
 
@@ -167,6 +271,30 @@ class GraphView(QListView):
 
         return menu
 
+    def containedInActions(self, oid: Oid) -> list[ActionDef]:
+        """ Actions that jump to each ref containing the given commit. """
+        repoModel = self.repoModel
+
+        if repoModel.reachability is None:
+            # Indexing the graph may take a while in large repos. Get Info does it on a worker thread.
+            return [ActionDef(_("Show in Commit Info…"), self.getInfoOnCurrentCommit)]
+
+        try:
+            refs = repoModel.refsContaining(oid)
+        except KeyError:
+            refs = []
+
+        if not refs:
+            return [ActionDef(_("No Branches or Tags"), enabled=False)]
+
+        maxRefs = GetCommitInfo.MaxContainingRefs
+        actions = [ActionDef(escamp(RefPrefix.split(ref)[1]), lambda r=ref: Jump.invoke(self, NavLocator.inRef(r)))
+                   for ref in refs[:maxRefs]]
+        if len(refs) > maxRefs:
+            actions.append(ActionDef(_n("and {n} more…", "and {n} more…", len(refs) - maxRefs),
+                                     self.getInfoOnCurrentCommit))
+        return actions
+
     def onContextMenuRequested(self, point: QPoint):
         menu = self.makeContextMenu()
         if menu is not None:
@@ -176,6 +304,18 @@ class GraphView(QListView):
 
     def clear(self):
         self.clModel.clear()
+        self.itemDelegate().rowLayoutCache.clear()
+        self.itemDelegate().rowTextCache.clear()
+        self.itemDelegate().rowPixmapCache.clear()
+        self.itemDelegate().refboxLayoutCache.clear()
+        self.prefetchTimer.stop()
+        self.framePrefetchTimer.stop()
+        self.framePrefetchQueue.clear()
+        self.scrollVelocity = 0.0
+        self.lastScrollTop = -1
+        self.searchIndex = None
+        self.searchResults = None
+        self.filterButton.setChecked(False)
 
     def mouseDoubleClickEvent(self, event: QMouseEvent):
         currentIndex = self.currentIndex()
@@ -314,10 +454,17 @@ class GraphView(QListView):
             self.scrollTo(filterIndex, scrollHint)
 
     def repaintCommit(self, oid: Oid):
+        self.itemDelegate().rowPixmapCache.discard(oid)
         with suppress(GraphView.SelectCommitError):
             filterIndex = self.getFilterIndexForCommit(oid)
             self.update(filterIndex)
 
+    def repaintAllCommits(self):
+        """ Redraw all rows from scratch (e.g. after the refs have changed). """
+        self.itemDelegate().rowPixmapCache.clear()
+        self.itemDelegate().refboxLayoutCache.clear()
+        self.viewport().update()
+
     def refreshPrefs(self, invalidateMetrics=True):
         self.setVerticalScrollMode(settings.prefs.listViewScrollMode)
         self.setAlternatingRowColors(settings.prefs.alternatingRowColors)
@@ -325,29 +472,358 @@ class GraphView(QListView):
         # Force redraw to reflect changes in row height, flattening, date format, etc.
         if invalidateMetrics:
             self.itemDelegate().invalidateMetrics()
+            self.itemDelegate().rowPixmapCache.clear()
             self.model().layoutChanged.emit()
 
+    # -------------------------------------------------------------------------
+    # Row text prefetching
+
+    def prefetchRowTexts(self):
+        """
+        Format the text of the rows around the viewport on the worker thread,
+        so that the delegate finds them ready to paint.
+        """
+        if self.repoModel is None or not self.isVisible():
+            return
+        if self.repoWidget.repoTaskRunner.isBusy():
+            # Don't hold up the task runner with speculative work
+            return
+
+        model = self.model()
+        numRows = model.rowCount()
+        if numRows == 0:
+            return
+
+        top, bottom = self.visibleRowSpan()
+
+        rowTextCache = self.itemDelegate().rowTextCache
+        style = RowTextStyle.current(self.locale())
+        rowTextCache.validate(style)
+
+        oids = []
+        for row in range(max(0, top - self.PrefetchRows), min(numRows, bottom + 1 + self.PrefetchRows)):
+            oid = model.index(row, 0).data(CommitLogModel.Role.Oid)
+            if oid is not None and oid != UC_FAKEID and oid not in rowTextCache.texts:
+                oids.append(oid)
+
+        if oids:
+            PrefetchCommitTexts.invoke(self, style, oids, self.onPrefetchedRowTexts)
+
+    def onPrefetchedRowTexts(self, style: RowTextStyle, texts: dict[Oid, RowText]):
+        self.itemDelegate().rowTextCache.update(style, texts)
+
+    def visibleRowSpan(self) -> tuple[int, int]:
+        """ First and last rows in the viewport. Only call this if the model isn't empty. """
+        top = self.indexAt(self.viewport().rect().topLeft()).row()
+        bottom = self.indexAt(self.viewport().rect().bottomLeft()).row()
+        top = max(top, 0)
+        bottom = bottom if bottom >= 0 else self.model().rowCount() - 1
+        return top, bottom
+
+    # -------------------------------------------------------------------------
+    # Graph frame prefetching
+
+    def onScrolled(self):
+        """ Keep track of the scrolling speed, and lay out the graph in the direction of travel. """
+        if self.model().rowCount() == 0:
+            return
+
+        now = time.perf_counter()
+        top, bottom = self.visibleRowSpan()
+        elapsed = now - self.lastScrollTime
+        distance = top - self.lastScrollTop
+        tracking = self.lastScrollTop >= 0
+
+        if tracking and 0 < elapsed < 1:
+            self.scrollVelocity = (self.scrollVelocity + distance / elapsed) / 2
+        else:
+            self.scrollVelocity = 0.0
+
+        self.lastScrollTop = top
+        self.lastScrollTime = now
+
+        # After jumping far (dragging the scrollbar, selecting a distant commit),
+        # the rows in the viewport come first in the queue, so they're laid out
+        # in the next slice of idle time (unless the worker thread is busy).
+        self.scheduleFramePrefetch()
+
+    def scheduleFramePrefetch(self):
+        """
+        Queue up the rows in the viewport and past its edge, in the direction
+        of travel, for prefetchFrames. The faster the scrolling, the further ahead.
+        """
+        self.framePrefetchQueue.clear()
+
+        numRows = self.model().rowCount()
+        if numRows == 0 or self.repoModel is None:
+            return
+
+        top, bottom = self.visibleRowSpan()
+        velocity = self.scrollVelocity
+        lookahead = int(abs(velocity) * self.FrameLookaheadSeconds)
+        lookahead = min(max(lookahead, self.FrameLookahead), self.FrameLookaheadMax)
+        chunk = self.FramePrefetchChunk
+        queue = self.framePrefetchQueue
+
+        queue.extend(range(r, min(r + chunk, bottom + 1)) for r in range(top, bottom + 1, chunk))
+
+        if velocity >= 0:
+            stop = min(numRows, bottom + 1 + lookahead)
+            queue.extend(range(r, min(r + chunk, stop)) for r in range(bottom + 1, stop, chunk))
+        else:
+            # Nearest rows first
+            start = max(0, top - lookahead)
+            queue.extend(range(max(start, r - chunk), r) for r in range(top, start, -chunk))
+
+        self.framePrefetchTimer.start(0)
+
+    def prefetchFrames(self):
+        """ Lay out the graph for the next chunk of queued rows, then yield to the event loop. """
+        queue = self.framePrefetchQueue
+        if not queue:
+            return
+
+        if self.repoModel is None or not self.isVisible():
+            queue.clear()
+            return
+
+        if self.repoWidget.repoTaskRunner.isBusy():
+            # The worker thread may be reading the graph (e.g. to splice new commits into it).
+            # Try again once it's done.
+            self.framePrefetchTimer.start(self.prefetchTimer.interval())
+            return
+
+        self.prefetchFramesInRows(queue.popleft())
+
+        if queue:
+            self.framePrefetchTimer.start(0)
+
+    def prefetchFramesInRows(self, rows: range):
+        """ Lay out the graph for some rows of the view, with as few seeks through the graph as possible. """
+        repoModel = self.repoModel
+        graph = repoModel.graph if repoModel is not None else None
+        if graph is None:
+            return
+
+        rowLayoutCache = self.itemDelegate().rowLayoutCache
+        rowLayoutCache.validate(repoModel)
+        layouts = rowLayoutCache.layouts
+        model = self.model()
+
+        graphRows = []
+        for row in rows:
+            oid = model.index(row, 0).data(CommitLogModel.Role.Oid)
+            if oid is None or oid in layouts:
+                continue
+            with suppress(LookupError):
+                graphRows.append((graph.getCommitRow(oid), oid))
+
+        if not graphRows:
+            return
+
+        first = graphRows[0][0]
+        last = graphRows[-1][0]
+        if 0 <= last - first < 2 * len(graphRows):
+            # Mostly contiguous rows: lay them out in a single playback
+            rowLayoutCache.prefetch(repoModel, first, last + 1)
+        else:
+            # Sparse rows (e.g. in filter mode)
+            for graphRow, oid in graphRows:
+                rowLayoutCache.get(repoModel, oid, graphRow)
+
     # -------------------------------------------------------------------------
     # Find text in commit message or hash
 
-    def searchRange(self, searchRange: range) -> QModelIndex | None:
-        model = self.model()  # to filter out hidden rows, don't use self.clModel directly
+    def getSearchIndex(self) -> CommitSearchIndex:
+        authorStyle = settings.prefs.authorDisplayStyle
+        if self.searchIndex is None or self.searchIndex.authorStyle != authorStyle:
+            self.searchIndex = CommitSearchIndex(authorStyle)
+            self.searchResults = None
+        return self.searchIndex
+
+    def prepareSearch(self, retry: Callable[[], object]) -> bool:
+        """ Callback for SearchBar.prepareBuddy. Start looking for the matching
+        commits in the background if we don't have them yet. """
+        if self.filterButton.isChecked():
+            # The search bar's text is a filter query, don't jump between matches
+            return False
 
         term = self.searchBar.searchTerm
         likelyHash = self.searchBar.searchTermLooksLikeHash
-        assert term
-        assert term == term.lower(), "search term should have been sanitized"
+        sequence = self.clModel._commitSequence
+        searchIndex = self.getSearchIndex()
+
+        partialResults = self.searchResults
+        if partialResults is None or not partialResults.isValidFor(term, likelyHash, sequence):
+            partialResults = None
+        elif partialResults.isComplete() or self.searchProbe:
+            return True
+
+        def onResults(results: CommitSearchResults):
+            nonlocal retry
+            self.searchResults = results
+            if retry is None:
+                return
+
+            if results.isComplete():
+                retry()
+                return
+
+            # Jump to a match as soon as one turns up in the search direction
+            self.searchProbe = True
+            try:
+                retry()
+            except GraphView.SearchPending:
+                return
+            finally:
+                self.searchProbe = False
+
+            # Keep indexing in the background for the next searches. If the search
+            # has caused a jump, this waits until the jump is complete.
+            retry = None
+            SearchCommits.invoke(self, searchIndex, sequence, term, likelyHash, onResults, results)
+
+        SearchCommits.invoke(self, searchIndex, sequence, term, likelyHash, onResults, partialResults)
+        return False
 
-        for i in searchRange:
-            index = model.index(i, 0)
-            commit = model.data(index, CommitLogModel.Role.Commit)
-            if commit is None or type(commit) is MockCommit:
-                continue
-            if likelyHash and str(commit.id).startswith(term):
-                return index
-            if term in commit.message.lower():
-                return index
-            if term in abbreviatePerson(commit.author, settings.prefs.authorDisplayStyle).lower():
+    def searchRange(self, searchRange: range) -> QModelIndex | None:
+        model = self.model()  # to filter out hidden rows, don't use self.clModel directly
+
+        results = self.searchResults
+        assert results is not None, "call prepareSearch first"
+        assert results.term == self.searchBar.searchTerm, "stale search results"
+
+        # The results are sorted rows in the source model
+        sourceStart = model.mapToSource(model.index(searchRange.start, 0)).row()
+        sourceLast = model.mapToSource(model.index(searchRange[-1], 0)).row()
+
+        # Partial results only cover the top of the log: when searching upwards from
+        # a row that hasn't been searched yet, there may be a closer match further down.
+        if sourceStart > sourceLast and sourceStart >= results.stop:
+            raise GraphView.SearchPending()
+
+        for row in results.rowsBetween(sourceStart, sourceLast):
+            index = model.mapFromSource(self.clModel.index(row, 0))
+            if index.isValid():  # not a hidden commit
                 return index
 
+        if max(sourceStart, sourceLast) >= results.stop:
+            raise GraphView.SearchPending()
+
         return None
+
+    # -------------------------------------------------------------------------
+    # Filter mode
+
+    def setFilterMode(self, on: bool):
+        self.filterButton.setChecked(on)
+        self.searchBar.turnRed(False)
+
+        if on:
+            self.searchBar.popUp()
+            self.applyFilter()
+        else:
+            self.filterQuery = None
+            self.filterMaskQuery = None
+            self.filterError = ""
+            self.clFilter.setFilterMask(None)
+            self.scrollToCurrent()
+
+    def onSearchBarVisibilityChanged(self, visible: bool):
+        # Turn off the filter mode when the user closes the search bar
+        # (but not when the entire RepoWidget is hidden)
+        if not visible and self.searchBar.isHidden():
+            self.setFilterMode(False)
+
+    def applyFilter(self):
+        """ Start filtering the commit log with the query in the search bar. """
+        if not self.filterButton.isChecked():
+            return
+
+        text = self.searchBar.rawSearchTerm.strip()
+        if not text:
+            self.filterQuery = None
+            self.filterMaskQuery = None
+            self.filterError = ""
+            self.clFilter.setFilterMask(None)
+            return
+
+        try:
+            query = CommitFilterQuery.parse(text)
+        except ValueError as exc:
+            # Keep the previous results around while the user is fixing the query
+            self.filterError = str(exc)
+            self.updateFilterStatus()
+            return
+
+        self.filterQuery = query
+        self.filterError = ""
+        self.startFilter()
+
+    def resumeFilter(self):
+        """
+        Evaluate the filter for the commits that are still pending: the commits
+        that have appeared in the log since the filter was applied (e.g. after
+        a refresh), or the rest of the log if a jump or a refresh interrupted
+        the filter. The pending commits are hidden until then.
+        """
+        if self.filterQuery is None:
+            return
+        if self.filterMaskQuery == self.filterQuery and not self.clFilter.hasPendingFilterRows():
+            return
+        if self.repoWidget.repoTaskRunner.isBusy():
+            # We'll get another chance once the task runner is free (see RepoWidget.refreshPostTask)
+            return
+        self.startFilter()
+
+    def startFilter(self):
+        if self.filterMaskQuery == self.filterQuery:
+            # Pick up where we left off
+            mask = bytearray(self.clFilter.filterMask)
+        else:
+            mask = self.clFilter.makePendingFilterMask()
+        FilterCommits.invoke(self, self.getSearchIndex(), self.clModel._commitSequence, self.filterQuery, mask,
+                             self.onFilterResults)
+
+    def onFilterResults(self, query: CommitFilterQuery, sequence: CommitSequence, mask: bytearray):
+        if query != self.filterQuery:
+            # Stale query
+            return
+
+        if sequence is not self.clModel._commitSequence or len(mask) != self.clModel.rowCount():
+            # The log has changed while the task was waiting for its turn (e.g. behind RefreshRepo)
+            self.startFilter()
+            return
+
+        self.filterMaskQuery = query
+        self.clFilter.setFilterMask(mask)
+
+        if not self.currentIndex().isValid():
+            # The selected commit may have been hidden while its verdict was pending
+            with QSignalBlockerContext(self), suppress(GraphView.SelectCommitError, ValueError):
+                self.selectRowForLocator(self.repoWidget.navLocator)
+
+        if not self.clFilter.hasPendingFilterRows():
+            self.scrollToCurrent()
+
+    def updateFilterStatus(self):
+        """ Show the number of commits that match the filter, or why the query is invalid. """
+        label = self.filterCountLabel
+
+        if self.filterError:
+            text = self.filterError
+            label.setText(f"<span style='color: {colors.red.name()};'>{escape(text)}</span>")
+        elif self.clFilter.filterMask is not None:
+            text = _n("{n} commit", "{n} commits", self.clFilter.numVisibleCommits())
+            label.setText(escape(text))
+        else:
+            label.hide()
+            return
+
+        label.setToolTip(text)
+        label.show()
+
+    def scrollToCurrent(self):
+        currentIndex = self.currentIndex()
+        if currentIndex.isValid():
+            self.scrollTo(currentIndex, QAbstractItemView.ScrollHint.EnsureVisible)
@@ -0,0 +1,116 @@
+# -----------------------------------------------------------------------------
+# Copyright (C) 2025 Iliyas Jorio.
+# This file is part of GitFourchette, distributed under the GNU GPL v3.
+# For full terms, see the included LICENSE file.
+# -----------------------------------------------------------------------------
+
+from __future__ import annotations
+
+from typing import Any, NamedTuple
+
+from gitfourchette import settings
+from gitfourchette.graphview.commitlogmodel import CommitToolTipZone
+from gitfourchette.porcelain import Oid
+from gitfourchette.qt import *
+from gitfourchette.repomodel import RepoModel
+
+
+class RowPixmap(NamedTuple):
+    """ A commit log row, rendered once and for all. """
+
+    pixmap: QPixmap
+    authorColumnX: int
+    toolTips: list[CommitToolTipZone]
+
+
+class RowPixmapCache:
+    """
+    Caches the rendered commit log rows, so that repainting a row (e.g. while
+    scrolling back and forth) boils down to blitting a pixmap.
+
+    A row is keyed by commit id along with everything about its appearance
+    that may vary from one paint to the next: size, selection/hover state,
+    device pixel ratio, search term, palette, font.
+
+    The cache is flushed whenever the state of the repo that the rows depend
+    on has changed (graph, hidden commits, refs, HEAD...). Call clear()
+    for anything else (e.g. when the prefs change), or discard() to redraw
+    a single commit.
+
+    Least-recently-used rows are evicted once the pixmaps take up more than
+    MaxBytes.
+    """
+
+    MaxBytes = 32 * 1024 * 1024
+    """ Memory budget for the pixmaps """
+
+    rows: dict[tuple, RowPixmap]
+    numBytes: int
+    stamp: tuple
+
+    def __init__(self):
+        self.rows = {}
+        self.numBytes = 0
+        self.stamp = ()
+
+    def clear(self):
+        self.rows.clear()
+        self.numBytes = 0
+
+    def validate(self, repoModel: RepoModel, *extraState: Any):
+        """
+        Flush the cache if anything that the rows depend on has changed since
+        the last call. Pass any additional state that affects all rows in
+        extraState.
+        """
+        # Tuple comparison checks identity before equality, so this is cheap unless something has changed
+        stamp = (
+            repoModel.graph,
+            repoModel.graph.generation,
+            repoModel.hiddenCommits,
+            repoModel.hiddenCommitsGeneration,  # the set may be patched in place
+            repoModel.foreignCommits,
+            repoModel.refsAt,
+            repoModel.headCommitId,
+            repoModel.headIsDetached,
+            repoModel.homeBranch,
+            repoModel.upstreams,
+            repoModel.remotes,
+            settings.prefs.flattenLanes,
+            *extraState)
+
+        if stamp != self.stamp:
+            self.clear()
+            self.stamp = stamp
+
+    def lookup(self, key: tuple) -> RowPixmap | None:
+        # Bump row to end of keys so it survives eviction
+        try:
+            row = self.rows.pop(key)
+        except KeyError:
+            return None
+        self.rows[key] = row
+        return row
+
+    def put(self, key: tuple, row: RowPixmap):
+        old = self.rows.pop(key, None)
+        if old is not None:
+            self.numBytes -= self._sizeOf(old)
+
+        self.rows[key] = row
+        self.numBytes += self._sizeOf(row)
+
+        # Evict least-recently-used rows
+        while self.numBytes > RowPixmapCache.MaxBytes and len(self.rows) > 1:
+            oldKey = next(iter(self.rows))
+            self.numBytes -= self._sizeOf(self.rows.pop(oldKey))
+
+    def discard(self, oid: Oid):
+        """ Forget all renditions of a commit. """
+        for key in [k for k in self.rows if k[0] == oid]:
+            self.numBytes -= self._sizeOf(self.rows.pop(key))
+
+    @staticmethod
+    def _sizeOf(row: RowPixmap) -> int:
+        pixmap = row.pixmap
+        return pixmap.width() * pixmap.height() * 4
@@ -0,0 +1,130 @@
+# -----------------------------------------------------------------------------
+# Copyright (C) 2025 Iliyas Jorio.
+# This file is part of GitFourchette, distributed under the GNU GPL v3.
+# For full terms, see the included LICENSE file.
+# -----------------------------------------------------------------------------
+
+from __future__ import annotations
+
+from typing import NamedTuple
+
+from gitfourchette import settings
+from gitfourchette.graphview.commitlogmodel import trimCacheDict
+from gitfourchette.porcelain import Commit, Oid
+from gitfourchette.qt import *
+from gitfourchette.toolbox import AuthorDisplayStyle, abbreviatePerson, messageSummary
+
+ELISION = " […]"
+ELISION_LENGTH = len(ELISION)
+
+
+class RowTextStyle(NamedTuple):
+    """ Everything that the display text of a row depends on, besides the commit itself. """
+
+    authorStyle: AuthorDisplayStyle
+    timeFormat: str
+    hashChars: int
+    diffAsterisk: bool
+    localeName: str
+
+    @staticmethod
+    def current(locale: QLocale) -> RowTextStyle:
+        prefs = settings.prefs
+        return RowTextStyle(prefs.authorDisplayStyle, prefs.shortTimeFormat, prefs.shortHashChars,
+                            prefs.authorDiffAsterisk, locale.name())
+
+
+class RowText(NamedTuple):
+    """ Ready-to-paint text of a commit in the log. """
+
+    summary: str
+    "First line of the message (with an elision mark if the message goes on)."
+
+    hash: str
+    author: str
+    date: str
+
+
+class RowTextCache:
+    """
+    Caches the display text of the commits in the log (summary, short hash,
+    author, date), so that painting a row doesn't have to format the same
+    commit over and over while scrolling.
+
+    The texts are keyed by commit id, so they remain valid across refreshes.
+    The cache is flushed when any of the prefs that the texts depend on
+    change (see RowTextStyle).
+
+    The rows around the viewport are formatted ahead of time on the worker
+    thread (see PrefetchCommitTexts); the delegate formats any remaining
+    rows on the fly.
+    """
+
+    CacheSize = 5000
+    """ Number of commits to keep texts for (the cache may hold up to twice as many) """
+
+    texts: dict[Oid, RowText]
+    style: RowTextStyle | None
+
+    def __init__(self):
+        self.texts = {}
+        self.style = None
+
+    def clear(self):
+        self.texts.clear()
+
+    def validate(self, style: RowTextStyle):
+        """ Flush the cache if the style has changed since the last call. """
+        if style != self.style:
+            self.texts.clear()
+            self.style = style
+
+    def lookup(self, oid: Oid) -> RowText | None:
+        """ Return the text of a commit if it's in the cache. Call validate() first. """
+        # Bump text to end of keys so it survives trimming
+        try:
+            text = self.texts.pop(oid)
+        except KeyError:
+            return None
+        self.texts[oid] = text
+        return text
+
+    def get(self, commit: Commit) -> RowText:
+        """ Return the text of a commit, formatting it if needed. Call validate() first. """
+        oid = commit.id
+        text = self.lookup(oid)
+        if text is not None:
+            return text
+
+        text = RowTextCache.formatCommit(commit, self.style)
+        self.texts[oid] = text
+        trimCacheDict(self.texts, RowTextCache.CacheSize)
+        return text
+
+    def update(self, style: RowTextStyle, texts: dict[Oid, RowText]):
+        """ Store texts formatted ahead of time, unless they're in a stale style. """
+        if style != self.style:
+            return
+        self.texts.update(texts)
+        trimCacheDict(self.texts, RowTextCache.CacheSize)
+
+    @staticmethod
+    def formatCommit(commit: Commit, style: RowTextStyle) -> RowText:
+        """ Format the text of a commit. Safe to call from the worker thread. """
+        author = commit.author
+        committer = commit.committer
+
+        summaryText, _contd = messageSummary(commit.message, ELISION)
+        hashText = str(commit.id)[:style.hashChars]
+        authorText = abbreviatePerson(author, style.authorStyle)
+
+        qdt = QDateTime.fromSecsSinceEpoch(author.time)
+        dateText = QLocale(style.localeName).toString(qdt, style.timeFormat)
+
+        if style.diffAsterisk:
+            if author.email != committer.email:
+                authorText += "*"
+            if author.time != committer.time:
+                dateText += "*"
+
+        return RowText(summaryText, hashText, authorText, dateText)
@@ -4,11 +4,16 @@
 # For full terms, see the included LICENSE file.
 # -----------------------------------------------------------------------------
 
+import dataclasses
 import logging
-from collections.abc import Generator, Iterable
+import os
+from collections.abc import Generator, Iterable, Iterator
 
 from gitfourchette import settings
-from gitfourchette.graph import Graph, GraphSpliceLoop, MockCommit
+from gitfourchette.appconsts import APP_SYSTEM_NAME
+from gitfourchette.graph import (CommitSequence, Graph, GraphBuildLoop, GraphCache, GraphSpliceLoop, GraphTrickle,
+                                 MockCommit, ParentTable, ReachabilityIndex, countAheadBehind, parenttable)
+from gitfourchette.graph.commitgraphfile import CommitGraph, CommitGraphError
 from gitfourchette.porcelain import *
 from gitfourchette.repoprefs import RepoPrefs
 from gitfourchette.toolbox import *
@@ -24,6 +29,17 @@ UC_FAKEREF = "UC_FAKEREF"
 # so this name should never collide with user refs.
 
 
+@dataclasses.dataclass
+class ResumableBuild:
+    """ Graph build that stopped at the truncation threshold. """
+
+    buildLoop: GraphBuildLoop
+    "Builder whose weaver and trickles are positioned past the last loaded commit."
+
+    walker: Iterator
+    "Walker that yields the commits below the last loaded commit."
+
+
 def toggleSetElement(s: set, element):
     assert isinstance(s, set)
     try:
@@ -41,13 +57,28 @@ class RepoModel:
     """Walker used to generate the graph. Call initializeWalker before use.
     Keep it around to speed up ulterior refreshes."""
 
-    commitSequence: list[Commit]
-    "Ordered list of commits."
+    commitSequence: CommitSequence
+    "Ordered list of commit ids (and parent ids). Use repo.peel_commit to get the actual commits."
 
     truncatedHistory: bool
 
+    resumableBuild: ResumableBuild | None
+    """If the history is truncated, this lets us load more commits without
+    rebuilding the graph from scratch. None if the graph has changed since."""
+
     graph: Graph
 
+    reachability: ReachabilityIndex | None
+    """Which refs contain each commit in commitSequence. None until someone
+    needs it (see buildReachabilityIndex), or if the sequence has been
+    extended since."""
+
+    splicedReachability: ReachabilityIndex | None
+    "Reachability index prepared by spliceTopOfGraph, waiting for swapTopOfGraph."
+
+    graphCacheStale: bool
+    "Flag indicating that the on-disk graph cache doesn't reflect the current graph."
+
     refs: dict[str, Oid]
     "Get target commit ID by reference name."
 
@@ -70,6 +101,13 @@ class RepoModel:
     upstreams: dict[str, str]
     "Table of local branch names to upstream shorthand names."
 
+    aheadBehind: dict[str, tuple[int, int]]
+    """Number of commits that each local branch is ahead of/behind its upstream.
+    Branches without an upstream, or whose counts are unknown, are left out."""
+
+    aheadBehindCache: dict[tuple[Oid, Oid], tuple[int, int] | None]
+    "Ahead/behind counts by (local tip, upstream tip). None if unknown (e.g. truncated history)."
+
     superproject: str
     "Path of the superproject. Empty string if this isn't a submodule."
 
@@ -86,6 +124,9 @@ class RepoModel:
     hiddenCommits: set[Oid]
     "All cached commit oids that are hidden."
 
+    hiddenCommitsGeneration: int
+    "Bumped whenever hiddenCommits is patched in place, so that caches can tell it has changed."
+
     workdirStale: bool
     "Flag indicating that the workdir should be refreshed before use."
 
@@ -106,11 +147,15 @@ class RepoModel:
     def __init__(self, repo: Repo):
         assert isinstance(repo, Repo)
 
-        self.commitSequence = []
+        self.commitSequence = CommitSequence()
         self.truncatedHistory = True
+        self.resumableBuild = None
 
         self.walker = None
         self.graph = Graph()
+        self.graphCacheStale = True
+        self.reachability = None
+        self.splicedReachability = None
 
         self.headIsDetached = False
         self.homeBranch = ""
@@ -128,9 +173,13 @@ class RepoModel:
         self.initializedSubmodules = set()
         self.remotes = []
         self.upstreams = {}
+        self.aheadBehind = {}
+        self.aheadBehindCache = {}
 
         self.hiddenRefs = set()
         self.hiddenCommits = set()
+        self.hiddenCommitsGeneration = 0
+        self.foreignCommits = set()
         self.hideSeeds = set()
         self.localSeeds = set()
 
@@ -272,6 +321,39 @@ class RepoModel:
             return True
         return False
 
+    @benchmark
+    def syncAheadBehind(self, retryUnknown=False) -> bool:
+        """
+        Count how far each local branch is ahead of/behind its upstream.
+        All the counts that aren't cached yet are computed in a single walk
+        over the graph. Safe to call on a worker thread.
+
+        Return True if any counts changed.
+        """
+        pairs = {}
+        for branchName, upstream in self.upstreams.items():
+            try:
+                pairs[branchName] = (self.refs[RefPrefix.HEADS + branchName], self.refs[RefPrefix.REMOTES + upstream])
+            except KeyError:
+                continue
+
+        # Only keep the counts that are still relevant
+        wanted = set(pairs.values())
+        cache = {pair: counts for pair, counts in self.aheadBehindCache.items()
+                 if pair in wanted and (counts is not None or not retryUnknown)}
+
+        missing = [pair for pair in wanted if pair not in cache]
+        if missing:
+            cache.update(zip(missing, countAheadBehind(self.commitSequence, missing, self.graph.getCommitRow), strict=True))
+
+        aheadBehind = {name: cache[pair] for name, pair in pairs.items() if cache[pair] is not None}
+        self.aheadBehindCache = cache
+
+        if aheadBehind == self.aheadBehind:
+            return False
+        self.aheadBehind = aheadBehind
+        return True
+
     @property
     def shortName(self) -> str:
         prefix = ""
@@ -281,9 +363,8 @@ class RepoModel:
 
         return prefix + settings.history.getRepoNickname(self.repo.workdir)
 
-    @benchmark
-    def primeWalker(self) -> Walker:
-        tipIds = self.refs.values()
+    @staticmethod
+    def walkerSortMode() -> SortMode:
         sorting = SortMode.TOPOLOGICAL
 
         if settings.prefs.chronologicalOrder:
@@ -293,6 +374,13 @@ class RepoModel:
             # ordering, keep TOPOLOGICAL in addition to TIME.
             sorting |= SortMode.TIME
 
+        return sorting
+
+    @benchmark
+    def primeWalker(self) -> Walker:
+        tipIds = self.refs.values()
+        sorting = self.walkerSortMode()
+
         if self.walker is None:
             self.walker = self.repo.walk(None, sorting)
         else:
@@ -310,6 +398,62 @@ class RepoModel:
 
         return self.walker
 
+    @property
+    def objectsDir(self) -> str:
+        gitDir = self.repo.path
+        try:
+            # Linked worktrees share the objects of the main repo
+            with open(os.path.join(gitDir, "commondir"), encoding="utf-8") as f:
+                gitDir = os.path.join(gitDir, f.read().strip())
+        except OSError:
+            pass
+        return os.path.normpath(os.path.join(gitDir, "objects"))
+
+    @benchmark
+    def walkCommitGraph(self) -> Iterator[MockCommit] | None:
+        """
+        Walk the history straight from Git's commit-graph file, without
+        inflating any commit objects. The commits come out in the same order
+        as with primeWalker, but they only carry their ids and parent ids.
+
+        Return None if there's no commit-graph file or if it's stale,
+        in which case the caller must fall back to primeWalker.
+        """
+        repo = self.repo
+
+        # The commit-graph doesn't know about grafts
+        if repo.is_shallow or os.path.exists(os.path.join(repo.path, "info", "grafts")):
+            return None
+
+        try:
+            commitGraph = CommitGraph.open(self.objectsDir)
+        except (OSError, CommitGraphError) as exc:
+            logger.warning(f"Ignoring unusable commit-graph: {exc}")
+            return None
+
+        if commitGraph is None:
+            return None
+
+        tipIds = [tip for tip in self.refs.values() if tip != UC_FAKEID]
+        sortTime = bool(self.walkerSortMode() & SortMode.TIME)
+
+        try:
+            commits = commitGraph.walk(tipIds, sortTime)
+        except KeyError:
+            logger.info("Commit-graph is stale, falling back to walker")
+            commitGraph.close()
+            return None
+        except CommitGraphError as exc:
+            logger.warning(f"Ignoring unusable commit-graph: {exc}")
+            commitGraph.close()
+            return None
+
+        def closeWhenDone():
+            with commitGraph:
+                yield from commits
+
+        return closeWhenDone()
+
     def uncommittedChangesMockCommit(self):
         try:
             head = self.refs["HEAD"]
@@ -353,14 +497,22 @@ class RepoModel:
 
         return arcs[0].openedBy == UC_FAKEID
 
-    @benchmark
     def syncTopOfGraph(self, oldRefs: dict[str, Oid]) -> GraphSpliceLoop:
-        # DO NOT call processEvents() here. While splicing a large amount of
-        # commits, GraphView may try to repaint an incomplete graph.
-        # GraphView somehow ignores setUpdatesEnabled(False) here!
+        gsl = self.spliceTopOfGraph(oldRefs)
+        self.swapTopOfGraph(gsl)
+        return gsl
+
+    @benchmark
+    def spliceTopOfGraph(self, oldRefs: dict[str, Oid]) -> GraphSpliceLoop:
+        """
+        Walk the commits from the refs that moved since oldRefs, and weave a
+        new graph front for them. Safe to call on a worker thread: neither the
+        graph nor this RepoModel are modified until swapTopOfGraph().
+        """
         gsl = GraphSpliceLoop(self.graph, self.commitSequence,
                               oldHeads=oldRefs.values(), newHeads=self.refs.values(),
-                              hideSeeds=self.getHiddenTips(), localSeeds=self.getLocalTips())
+                              hideSeeds=self.getHiddenTips(), localSeeds=self.getLocalTips(),
+                              deferSwap=True)
         coSplice = gsl.coSplice()
         coSplice.send(None)  # prime the generator
 
@@ -378,15 +530,202 @@ class RepoModel:
                     break
         coSplice.close()  # flush it
 
+        commitSequence = gsl.commitSequence
+        if not isinstance(commitSequence, CommitSequence):  # e.g. no equilibrium found, got a list from the walker
+            gsl.commitSequence = CommitSequence(commitSequence)
+
+        # Bring the reachability index up to date while we're still on the worker thread
+        if self.reachability is not None:
+            self.splicedReachability = self.reachability.spliced(
+                gsl.commitSequence, gsl.numRowsAdded, gsl.numRowsRemoved, self.refs)
+
+        return gsl
+
+    @benchmark
+    def swapTopOfGraph(self, gsl: GraphSpliceLoop):
+        """
+        Patch a graph front prepared by spliceTopOfGraph() into the graph.
+
+        If the graph is shown in the UI, call this on the UI thread, so that
+        GraphView never sees a half-spliced graph.
+        """
+        gsl.swap()
+        # The walker has been reset, and the graph may have been rewoven:
+        # we can't pick up a truncated build from where it stopped anymore.
+        self.resumableBuild = None
         self.commitSequence = gsl.commitSequence
+        self.reachability = self.splicedReachability
+        self.splicedReachability = None
         self.hideSeeds = gsl.hideSeeds
         self.localSeeds = gsl.localSeeds
         self.hiddenCommits = gsl.hiddenCommits
         self.foreignCommits = gsl.foreignCommits
-        return gsl
 
     @benchmark
-    def toggleHideRefPattern(self, refPattern: str, allButThis: bool = False):
+    def buildReachabilityIndex(self) -> ReachabilityIndex:
+        """ Index which refs contain each commit. Safe to call on a worker thread. """
+        index = ReachabilityIndex.build(self.commitSequence, self.refs)
+        self.reachability = index
+        return index
+
+    def refsContaining(self, oid: Oid) -> list[str]:
+        """
+        Names of the refs whose history contains the given commit, in the
+        same order as self.refs. The reachability index must be built.
+        """
+        assert self.reachability is not None, "reachability index not built"
+        row = self.graph.getCommitRow(oid)
+        names = set(self.reachability.refsContaining(row))
+        return [name for name in self.refs if name in names]
+
+    def takeResumableBuild(self) -> ResumableBuild | None:
+        """
+        Take over the graph build that stopped at the truncation threshold,
+        so that we can keep walking from where it stopped.
+        Return None if the build can't be resumed.
+        """
+        build = self.resumableBuild
+        self.resumableBuild = None
+
+        if build is None:
+            return None
+
+        # Branches may have been hidden or shown since the build stopped (the set
+        # of hidden commits is patched in place, so there's no telling by identity).
+        # Recreate the hidden trickle at the bottom of the graph with the current seeds.
+        # Its flags are handed over to us by takeBuildFlags().
+        buildLoop = build.buildLoop
+        buildLoop.hiddenTrickle = GraphTrickle.resumeHiddenTrickle(
+            self.graph, len(self.commitSequence), set(self.getKnownTips()), self.hideSeeds, self.hiddenCommits)
+
+        return build
+
+    def takeBuildFlags(self, buildLoop: GraphBuildLoop):
+        """
+        Move the commits that a graph build has flagged as hidden or foreign
+        since the last call into our own sets.
+
+        The build loop never writes to our sets, so the UI may keep reading
+        them while the build goes on in a worker thread. If the graph is shown
+        in the UI, call this on the UI thread (after flushTrickles() in batch
+        mode), so that the sets only ever change along with the rows shown.
+        """
+        hidden, foreign = buildLoop.takeFlaggedCommits()
+        self.foreignCommits.update(foreign)
+        if hidden:
+            self.hiddenCommits.update(hidden)
+            self.hiddenCommitsGeneration += 1
+
+    @property
+    def graphCachePath(self) -> str:
+        return os.path.join(self.repo.path, f"{APP_SYSTEM_NAME}-graph.cache")
+
+    @benchmark
+    def restoreGraphCache(self, maxCommits: int) -> bool:
+        """
+        Restore the graph and the commit sequence from the on-disk cache
+        instead of walking and weaving the entire history. If any refs have
+        moved since the cache was written, splice them into the graph.
+
+        Return False if the cache is missing or unusable, in which case the
+        caller must build the graph from scratch.
+        """
+
+        cache = GraphCache.load(self.graphCachePath)
+
+        if cache is None:
+            return False
+
+        if cache.sortKey != str(int(self.walkerSortMode())):
+            logger.info("Graph cache was woven in another sort order")
+            return False
+
+        if not cache.sequence or cache.sequence[0].id != UC_FAKEID:
+            logger.warning("Graph cache doesn't start with uncommitted changes")
+            return False
+
+        if len(cache.sequence) - 1 > maxCommits:
+            # Let the caller truncate the history
+            return False
+
+        self.graph = cache.graph
+        self.commitSequence = cache.sequence
+        self.truncatedHistory = False
+        self.graphCacheStale = False
+
+        if (cache.refs != self.refs or
+                cache.sequence[0].parent_ids != self.uncommittedChangesMockCommit().parent_ids):
+            # Load commits from the refs that moved since we wrote the cache.
+            # This also recomputes hidden/foreign commits.
+            self.syncTopOfGraph(cache.refs)
+            self.graphCacheStale = True
+            return True
+
+        hideSeeds = self.getHiddenTips()
+        localSeeds = self.getLocalTips()
+
+        if hideSeeds == cache.hideSeeds and localSeeds == cache.localSeeds:
+            hiddenCommits = cache.hiddenCommits
+            foreignCommits = cache.foreignCommits
+        else:
+            heads = set(self.getKnownTips())
+            hiddenTrickle = GraphTrickle.newHiddenTrickle(heads, hideSeeds)
+            foreignTrickle = GraphTrickle.newForeignTrickle(heads, localSeeds)
+            if parenttable.numpyAvailable:
+                ParentTable.trickleAll(cache.sequence, [hiddenTrickle, foreignTrickle])
+            else:  # pragma: no cover
+                for commit in cache.sequence:
+                    if hiddenTrickle.done and foreignTrickle.done:
+                        break
+                    hiddenTrickle.newCommit(commit.id, commit.parent_ids)
+                    foreignTrickle.newCommit(commit.id, commit.parent_ids)
+            hiddenCommits = hiddenTrickle.flaggedSet
+            foreignCommits = foreignTrickle.flaggedSet
+
+        self.hideSeeds = hideSeeds
+        self.localSeeds = localSeeds
+        self.hiddenCommits = hiddenCommits
+        self.foreignCommits = foreignCommits
+        return True
+
+    @benchmark
+    def saveGraphCache(self):
+        """
+        Write the graph and the commit sequence to disk so that we can
+        reopen the repo without walking its entire history again.
+        """
+
+        path = self.graphCachePath
+
+        if self.truncatedHistory:
+            # Don't let a truncated history shadow the full history
+            GraphCache.delete(path)
+            return
+
+        cache = GraphCache(
+            refs=dict(self.refs),
+            sortKey=str(int(self.walkerSortMode())),
+            sequence=self.commitSequence,
+            graph=self.graph,
+            hideSeeds=self.hideSeeds,
+            localSeeds=self.localSeeds,
+            hiddenCommits=self.hiddenCommits,
+            foreignCommits=self.foreignCommits)
+
+        try:
+            cache.save(path)
+        except OSError as exc:
+            logger.warning(f"Couldn't write graph cache: {exc}")
+            return
+
+        self.graphCacheStale = False
+
+    @benchmark
+    def toggleHideRefPattern(self, refPattern: str, allButThis: bool = False) -> tuple[set[Oid], set[Oid]]:
+        """
+        Toggle the visibility of the refs matching a pattern and patch the set of hidden commits.
+        Returns the commits that have just been hidden, and those that have just been shown.
+        """
         if not allButThis:
             self.prefs.showPatterns.clear()  # clear show patterns in non-allButThis mode
             toggleSetElement(self.prefs.hidePatterns, refPattern)
@@ -400,17 +739,19 @@ class RepoModel:
         self.prefs.setDirty()
         self.refreshHiddenRefCache()
 
-        # Sync hidden commits
-        heads = self.refs.values()
+        # Sync hidden commits. Local seeds (and therefore foreign commits) aren't affected.
+        heads = set(self.refs.values())
         newHideSeeds = self.getHiddenTips()
-        newLocalSeeds = self.getLocalTips()
-        gsl = GraphSpliceLoop(self.graph, self.commitSequence, oldHeads=heads, newHeads=heads,
-                              hideSeeds=newHideSeeds, localSeeds=newLocalSeeds)
-        gsl.sendAll(self.commitSequence)  # send the same commit sequence
-        self.hiddenCommits = gsl.hiddenCommits
-        self.foreignCommits = gsl.foreignCommits
+        newlyHidden, newlyShown = GraphTrickle.hiddenDelta(
+            self.graph, self.commitSequence, heads, self.hideSeeds, newHideSeeds, self.hiddenCommits)
+        logger.debug(f"Hidden commits: +{len(newlyHidden)} -{len(newlyShown)}")
+
+        # Patch the set in place rather than copying it (it may be huge)
+        self.hiddenCommits.difference_update(newlyShown)
+        self.hiddenCommits.update(newlyHidden)
+        self.hiddenCommitsGeneration += 1
         self.hideSeeds = newHideSeeds
-        self.localSeeds = newLocalSeeds
+        return newlyHidden, newlyShown
 
     @benchmark
     def refreshHiddenRefCache(self):
@@ -694,11 +694,14 @@ class RepoWidget(QStackedWidget):
 
     def toggleHideRefPattern(self, refPattern: str, allButThis: bool = False):
         assert refPattern.startswith("refs/")
-        self.repoModel.toggleHideRefPattern(refPattern, allButThis)
-        self.graphView.clFilter.setHiddenCommits(self.repoModel.hiddenCommits)
+        newlyHidden, newlyShown = self.repoModel.toggleHideRefPattern(refPattern, allButThis)
+
+        # Only refilter the rows whose visibility has changed
+        changedRows = self.repoModel.graph.commitRows.rowsOf(newlyHidden | newlyShown)
+        self.graphView.clFilter.patchHiddenCommits(newlyHidden, newlyShown, changedRows)
 
         # Hide/draw refboxes for commits that are shared by non-hidden refs
-        self.graphView.viewport().update()
+        self.graphView.repaintAllCommits()
 
     # -------------------------------------------------------------------------
 
@@ -881,6 +884,7 @@ class RepoWidget(QStackedWidget):
         if task.postStatus:
             self.pendingStatusMessage = task.postStatus
         self.refreshRepo(task.effects, task.jumpTo)
+        self.graphView.resumeFilter()
 
     def onRepoTaskProgress(self, progressText: str, withSpinner: bool = False):
         if withSpinner:
@@ -952,11 +956,15 @@ class RepoWidget(QStackedWidget):
             locator = NavLocator.parseUrl(url)
             self.jump(locator)
         elif url.authority() == "expandlog":
-            # After loading, jump back to what is currently the last commit
-            self.pendingLocator = NavLocator.inCommit(self.repoModel.commitSequence[-1].id)
-            # Reload the repo
             maxCommits = int(kwargs.get("n", self.repoModel.nextTruncationThreshold))
-            self.primeRepo(force=True, maxCommits=maxCommits)
+            if self.repoModel.resumableBuild is not None:
+                # Keep walking from the bottom of the graph
+                self.runTask(tasks.ExpandHistory, maxCommits=maxCommits)
+            else:
+                # After loading, jump back to what is currently the last commit
+                self.pendingLocator = NavLocator.inCommit(self.repoModel.commitSequence[-1].id)
+                # Reload the repo
+                self.primeRepo(force=True, maxCommits=maxCommits)
         elif url.authority() == "opensubfolder":
             p = self.repo.in_workdir(simplePath)
             self.openRepo.emit(p, NavLocator())
@@ -146,6 +146,8 @@ class Prefs(PrefsFile):
     autoRefresh                 : bool                  = True
     middleClickToStage          : bool                  = False
     flattenLanes                : bool                  = True
+    graphCache                  : bool                  = True
+    graphPixmapCache            : bool                  = True
     animations                  : bool                  = True
     condensedFonts              : bool                  = True
     pygmentsPlugins             : bool                  = False
@@ -57,6 +57,37 @@ class SidebarDelegate(QStyledItemDelegate):
         else:
             return SidebarClickZone.Select
 
+    @staticmethod
+    def aheadBehindText(aheadBehind: tuple[int, int]) -> str:
+        ahead, behind = aheadBehind
+        parts = []
+        if ahead:
+            parts.append(f"\u2191{ahead}")
+        if behind:
+            parts.append(f"\u2193{behind}")
+        return " ".join(parts)
+
+    @staticmethod
+    def drawAheadBehind(painter: QPainter, option: QStyleOptionViewItem, textRect: QRect, aheadBehind: tuple[int, int]):
+        """ Draw the counts at the right of textRect, then shrink textRect to leave room for them. """
+        text = SidebarDelegate.aheadBehindText(aheadBehind)
+
+        painter.save()
+        font = QFont(option.font)
+        font.setPointSizeF(font.pointSizeF() * .85)
+        painter.setFont(font)
+        penColor = painter.pen().color()
+        penColor.setAlphaF(penColor.alphaF() * .66)
+        painter.setPen(penColor)
+
+        width = painter.fontMetrics().horizontalAdvance(text)
+        r = QRect(textRect)
+        r.setLeft(r.right() - width)
+        painter.drawText(r, Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter, text)
+        painter.restore()
+
+        textRect.adjust(0, 0, -(width + PADDING), 0)
+
     def paint(self, painter: QPainter, option: QStyleOptionViewItem, index: QModelIndex):
         node = SidebarNode.fromIndex(index)
         assert node.parent is not None, "can't paint root node"
@@ -153,6 +184,13 @@ class SidebarDelegate(QStyledItemDelegate):
         textRect = QRect(option.rect)
         if makeRoomForEye:
             textRect.adjust(0, 0, -EYE_WIDTH, 0)
+
+        # Draw ahead/behind counts on the right
+        if node.kind == SidebarItem.LocalBranch:
+            aheadBehind = index.data(SidebarModel.Role.AheadBehind)
+            if aheadBehind and any(aheadBehind):
+                self.drawAheadBehind(painter, option, textRect, aheadBehind)
+
         font: QFont = index.data(Qt.ItemDataRole.FontRole) or option.font
         painter.setFont(font)
         fullText = index.data(Qt.ItemDataRole.DisplayRole)
@@ -210,6 +210,7 @@ class SidebarModel(QAbstractItemModel):
     class Role:
         Ref = Qt.ItemDataRole(Qt.ItemDataRole.UserRole + 0)
         IconKey = Qt.ItemDataRole(Qt.ItemDataRole.UserRole + 1)
+        AheadBehind = Qt.ItemDataRole(Qt.ItemDataRole.UserRole + 2)
 
     @property
     def _parentWidget(self) -> QWidget:
@@ -577,6 +578,7 @@ class SidebarModel(QAbstractItemModel):
         fontRole = role == Qt.ItemDataRole.FontRole
         refRole = role == SidebarModel.Role.Ref
         iconKeyRole = role == SidebarModel.Role.IconKey
+        aheadBehindRole = role == SidebarModel.Role.AheadBehind
 
         row = index.row()
         item = node.kind
@@ -600,6 +602,10 @@ class SidebarModel(QAbstractItemModel):
                 with suppress(KeyError):
                     upstream = self.repoModel.upstreams[branchName]
                     text += "\n" + _("Upstream: {0}", escape(upstream))
+                with suppress(KeyError):
+                    ahead, behind = self.repoModel.aheadBehind[branchName]
+                    text += "\n" + _n("{n} commit ahead", "{n} commits ahead", ahead)
+                    text += ", " + _n("{n} commit behind", "{n} commits behind", behind)
                 if branchName == self._checkedOut:
                     text += f"\n{self._iconTag('git-head')} HEAD " + _("(this is the checked-out branch)")
                 text += self.visibilityToolTip(node)
@@ -607,6 +613,8 @@ class SidebarModel(QAbstractItemModel):
                 return text
             elif iconKeyRole:
                 return "git-branch" if branchName != self._checkedOut else "git-head"
+            elif aheadBehindRole:
+                return self.repoModel.aheadBehind.get(branchName, None)
 
         elif item == SidebarItem.UnbornHead:
             target = node.data
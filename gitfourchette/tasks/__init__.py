@@ -41,8 +41,11 @@ from gitfourchette.tasks.exporttasks import (
 )
 from gitfourchette.tasks.misctasks import (
     EditRepoSettings,
+    FilterCommits,
     GetCommitInfo,
     NewIgnorePattern,
+    PrefetchCommitTexts,
+    SearchCommits,
 )
 from gitfourchette.tasks.jumptasks import (
     Jump,
@@ -53,7 +56,7 @@ from gitfourchette.tasks.jumptasks import (
     JumpToUncommittedChanges,
     RefreshRepo,
 )
-from gitfourchette.tasks.loadtasks import PrimeRepo
+from gitfourchette.tasks.loadtasks import ExpandHistory, PrimeRepo
 from gitfourchette.tasks.nettasks import (
     DeleteRemoteBranch,
     RenameRemoteBranch,
@@ -16,6 +16,7 @@ from collections.abc import Generator
 
 from gitfourchette.diffview.diffdocument import DiffDocument
 from gitfourchette.diffview.specialdiff import SpecialDiffError, DiffConflict, DiffImagePair
+from gitfourchette.graph import GraphSpliceLoop
 from gitfourchette.graphview.commitlogmodel import SpecialRow
 from gitfourchette.localization import *
 from gitfourchette.nav import NavLocator, NavContext, NavFlags
@@ -23,7 +24,8 @@ from gitfourchette.porcelain import DeltaStatus, NULL_OID, Oid, Patch
 from gitfourchette.qt import *
 from gitfourchette.repomodel import UC_FAKEREF
 from gitfourchette.tasks import TaskPrereqs
-from gitfourchette.tasks.loadtasks import LoadCommit, LoadPatch, LoadWorkdir
+from gitfourchette.tasks.loadtasks import ExpandHistory, LoadCommit, LoadPatch, LoadWorkdir
+from gitfourchette.tasks.misctasks import FilterCommits, SearchCommits
 from gitfourchette.tasks.repotask import AbortTask, RepoTask, TaskEffects, RepoGoneError, FlowControlToken
 from gitfourchette.toolbox import *
 
@@ -45,7 +47,14 @@ class Jump(RepoTask):
         patch: Patch | None = None
 
     def canKill(self, task: RepoTask):
-        return isinstance(task, Jump | RefreshRepo)
+        # Clicking around (or selecting a search result) takes precedence over a search
+        # or a filter pass (the filter picks up where it left off once we're done)
+        return isinstance(task, Jump | RefreshRepo | SearchCommits | FilterCommits)
+
+    def canDefer(self, task: RepoTask):
+        # The filter mode may need to catch up with the commit log once we're done.
+        # A search may want to keep indexing the log in the background.
+        return isinstance(task, FilterCommits | SearchCommits)
 
     def flow(self, locator: NavLocator):
         if not locator:
@@ -253,6 +262,7 @@ class Jump(RepoTask):
 
         commit = rw.repo.peel_commit(locator.commit)
         warnings = []
+        canFindInHistory = False
 
         # Select row in commit log
         from gitfourchette.graphview.graphview import GraphView
@@ -264,6 +274,8 @@ class Jump(RepoTask):
                 rw.graphView.clearSelection()
                 if not isStash:  # Don't show a warning for stashes - never shown in graph
                     warnings.append(str(e))
+                    # Offer to keep walking the truncated history until the commit turns up
+                    canFindInHistory = e.likelyTruncated and rw.repoModel.resumableBuild is not None
 
         # Attempt to select matching ref in sidebar
         with (
@@ -334,6 +346,11 @@ class Jump(RepoTask):
                     _("Detect Renames"),
                     lambda: Jump.invoke(rw, locator.withExtraFlags(NavFlags.AllowLargeCommits | NavFlags.ForceDiff)))
 
+            if canFindInHistory:
+                area.diffBanner.addButton(
+                    _("Find in Commit Log"),
+                    lambda: ExpandHistory.invoke(rw, 0, locator.commit))
+
         return locator
 
     def saveFinalLocator(self, locator: NavLocator):
@@ -442,13 +459,34 @@ class JumpToHEAD(Jump):
 
 
 class RefreshRepo(RepoTask):
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.pendingSplice: GraphSpliceLoop | None = None
+        self.uiBehindModel = False
+
     @staticmethod
     def canKill_static(task: RepoTask):
-        return task is None or isinstance(task, Jump | RefreshRepo)
+        return task is None or isinstance(task, Jump | RefreshRepo | SearchCommits | FilterCommits)
 
     def canKill(self, task: RepoTask):
         return RefreshRepo.canKill_static(task)
 
+    def canDefer(self, task: RepoTask):
+        # New commits may need to be filtered once they're in the commit log
+        return isinstance(task, FilterCommits)
+
+    def isKillable(self):
+        # Once RepoModel has picked up the new refs, the next refresh won't see them
+        # as changes anymore: don't die before the UI has caught up with them.
+        return not self.uiBehindModel
+
+    def cleanup(self):
+        assert onAppThread()
+        # If we were killed while splicing on the worker thread, the refs in
+        # RepoModel are already up to date - don't leave the graph behind.
+        if self.pendingSplice is not None:
+            self.swapTopOfGraph()
+
     def flow(self, effectFlags: TaskEffects = TaskEffects.DefaultRefresh, jumpTo: NavLocator = NavLocator.Empty):
         rw = self.rw
         repoModel = self.repoModel
@@ -484,6 +522,9 @@ class RefreshRepo(RepoTask):
         upstreamsChanged = False
         homeBranchChanged = False
 
+        # Until the sidebar is refreshed, the UI lags behind RepoModel
+        self.uiBehindModel = True
+
         if effectFlags & (TaskEffects.Head | TaskEffects.Workdir):
             submodulesChanged = repoModel.syncSubmodules()
 
@@ -505,17 +546,28 @@ class RefreshRepo(RepoTask):
 
             # Load commits from changed refs only
             if refsChanged:
-                self.syncTopOfGraph(oldRefs)
+                yield from self.flowSyncTopOfGraph(oldRefs)
+
+        # Count commits ahead/behind upstreams
+        aheadBehindChanged = False
+        if refsChanged or upstreamsChanged:
+            yield from self.flowEnterWorkerThread()
+            aheadBehindChanged = repoModel.syncAheadBehind()
+            yield from self.flowEnterUiThread()
 
         # Schedule a repaint of the entire GraphView if the refs changed
         if effectFlags & (TaskEffects.Head | TaskEffects.Refs):
-            rw.graphView.viewport().update()
+            rw.graphView.repaintAllCommits()
 
         # Refresh sidebar
         rw.sidebar.backUpSelection()
         if refsChanged | stashesChanged | submodulesChanged | remotesChanged | homeBranchChanged | upstreamsChanged:
             with QSignalBlockerContext(rw.sidebar):
                 rw.sidebar.refresh(repoModel)
+        elif aheadBehindChanged:
+            rw.sidebar.viewport().update()
+
+        self.uiBehindModel = False
 
         # Now jump to where we should be after the refresh
         assert rw.navLocator == initialLocator, "locator has changed"
@@ -577,7 +629,17 @@ class RefreshRepo(RepoTask):
         logger.debug(f"Changes detected on refresh: Ref={int(refsChanged)} Sta={int(stashesChanged)} "
                      f"Sub={int(submodulesChanged)} Rem={int(remotesChanged)} Ups={int(upstreamsChanged)}")
 
-    def syncTopOfGraph(self, oldRefs: dict[str, Oid]):
+    def flowSyncTopOfGraph(self, oldRefs: dict[str, Oid]):
+        # Walk the new commits and weave the new graph front on the worker thread.
+        # GraphView keeps painting the current graph in the meantime:
+        # the splice leaves it intact until we swap in the new front.
+        yield from self.flowEnterWorkerThread()
+        self.pendingSplice = self.repoModel.spliceTopOfGraph(oldRefs)
+
+        yield from self.flowEnterUiThread()
+        self.swapTopOfGraph()
+
+    def swapTopOfGraph(self):
         repoModel = self.repoModel
         graphView = self.rw.graphView
         clModel = graphView.clModel
@@ -587,8 +649,11 @@ class RefreshRepo(RepoTask):
         # We don't want GraphView to try to read an incomplete state while repainting.
         assert onAppThread()
 
+        gsl = self.pendingSplice
+        self.pendingSplice = None
+
         # Update our graph model
-        gsl = repoModel.syncTopOfGraph(oldRefs)
+        repoModel.swapTopOfGraph(gsl)
 
         with QSignalBlockerContext(graphView):
             # Hidden commits may have changed in RepoState.syncTopOfGraph!
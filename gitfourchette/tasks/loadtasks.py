@@ -15,12 +15,13 @@ from gitfourchette.syntax.lexercache import LexerCache
 from gitfourchette.syntax.lexjob import LexJob
 from gitfourchette.syntax.lexjobcache import LexJobCache
 from gitfourchette.diffview.specialdiff import (ShouldDisplayPatchAsImageDiff, SpecialDiffError, DiffImagePair)
-from gitfourchette.graph import GraphBuildLoop
+from gitfourchette.graph import CommitSequence, GraphBuildLoop, parenttable
 from gitfourchette.graphview.commitlogmodel import SpecialRow
 from gitfourchette.localization import *
 from gitfourchette.nav import NavLocator, NavFlags, NavContext
 from gitfourchette.porcelain import *
 from gitfourchette.qt import *
+from gitfourchette.repomodel import RepoModel, ResumableBuild
 from gitfourchette.tasks.repotask import RepoTask, TaskEffects
 from gitfourchette.toolbox import *
 from gitfourchette.trtables import TrTables
@@ -41,15 +42,41 @@ class PrimeRepo(RepoTask):
     progressMessage = Signal(str)
     progressAbortable = Signal(bool)
 
+    progressiveDisplayThreshold = 5000
+    """
+    In large repositories, show the top of the graph as soon as this many
+    commits have been woven, without waiting for the rest of the history
+    to load. 0 disables progressive display.
+    """
+
+    progressiveDisplayInterval = 50000
+    "While the rest of the history is loading, append rows to the log in batches of this size."
+
+    progressInterval = 1000
+    "Report progress and check for pending jumps every so many commits."
+
     abortFlag: bool
 
+    uiPrimed: bool = False
+    "True once the RepoWidget shows the graph (which may still be loading)"
+
     def onAbortButtonClicked(self):
         self.abortFlag = True
 
+    def canDefer(self, task: RepoTask) -> bool:
+        from gitfourchette.tasks.jumptasks import Jump, RefreshRepo
+        from gitfourchette.tasks.misctasks import FilterCommits, SearchCommits
+        # Once the top of the graph is shown, the user may click around
+        # while the rest of the history is loading. Jumps don't have to wait
+        # until we're done: see flowPublishPartialGraph.
+        return self.uiPrimed and isinstance(task, Jump | RefreshRepo | SearchCommits | FilterCommits)
+
+    def isJumpWaiting(self) -> bool:
+        from gitfourchette.tasks.jumptasks import Jump
+        return self.rw.repoTaskRunner.hasDeferredTasks(lambda task: isinstance(task, Jump))
+
     def flow(self, path: str, maxCommits: int = -1):
         from gitfourchette.repowidget import RepoWidget
-        from gitfourchette.repomodel import RepoModel
-        from gitfourchette.tasks.jumptasks import Jump
 
         assert path
 
@@ -59,6 +86,7 @@ class PrimeRepo(RepoTask):
         progressWidget = rw.setPlaceholderWidgetOpenRepoProgress()
 
         self.abortFlag = False
+        self.uiPrimed = False
         self.progressRange.connect(progressWidget.ui.progressBar.setRange)
         self.progressValue.connect(progressWidget.ui.progressBar.setValue)
         self.progressMessage.connect(progressWidget.ui.label.setText)
@@ -90,93 +118,36 @@ class PrimeRepo(RepoTask):
         # ---------------------------------------------------------------------
         yield from self.flowEnterWorkerThread()
 
-        locale = QLocale()
-
-        # Prime the walker (this might take a while)
-        walker = repoModel.primeWalker()
-
-        commitSequence = [repoModel.uncommittedChangesMockCommit()]
-
-        # Retrieve the number of commits that we loaded last time we opened this repo
-        # so we can estimate how long it'll take to load it again
-        numCommitsBallpark = settings.history.getRepoNumCommits(repo.workdir)
-        if numCommitsBallpark != 0:
-            # Reserve second half of progress bar for graph progress
-            self.progressRange.emit(0, 2*numCommitsBallpark)
-
-        # ---------------------------------------------------------------------
-        # Build commit sequence
-
-        self.progressAbortable.emit(True)
-
-        truncatedHistory = False
         if maxCommits < 0:  # -1 means take maxCommits from prefs. Warning, pref value can be 0, meaning infinity!
             maxCommits = settings.prefs.maxCommits
         if maxCommits == 0:  # 0 means infinity
             maxCommits = 2**63  # ought to be enough
-        progressInterval = 1000 if maxCommits >= 10000 else 1000
-
-        for i, commit in enumerate(walker):
-            commitSequence.append(commit)
 
-            if i+1 >= maxCommits or (self.abortFlag and i+1 >= progressInterval):
-                truncatedHistory = True
-                break
-
-            # Report progress, not too often
-            if i % progressInterval == 0:
-                message = _("{0} commits…", locale.toString(i))
-                self.progressMessage.emit(message)
-                if numCommitsBallpark > 0 and i <= numCommitsBallpark:
-                    self.progressValue.emit(i)
-                    # Let RepoTaskRunner kill us here (e.g. if closing the RepoWidget tab while we're loading)
-                    yield from self.flowEnterWorkerThread()
-
-        # Can't abort anymore
-        self.progressAbortable.emit(False)
-
-        numCommits = len(commitSequence) - 1
-        logger.info(f"{repoModel.shortName}: loaded {numCommits} commits")
-        if truncatedHistory:
-            message = _("{0} commits (truncated log).", locale.toString(numCommits))
-        else:
-            message = _("{0} commits total.", locale.toString(numCommits))
-        self.progressMessage.emit(message)
-
-        if numCommitsBallpark != 0:
-            # First half of progress bar was for commit log
-            self.progressRange.emit(-numCommits, numCommits)
-        else:
-            self.progressRange.emit(0, numCommits)
-        self.progressValue.emit(0)
+        # Try to reuse the graph that we built last time we opened this repo.
+        # Otherwise, walk the entire history.
+        if not (settings.prefs.graphCache and repoModel.restoreGraphCache(maxCommits)):
+            yield from self.flowBuildGraph(repoModel, maxCommits)
 
-        # ---------------------------------------------------------------------
-        # Build graph
+        truncatedHistory = repoModel.truncatedHistory
+        numCommits = repoModel.numRealCommits
 
-        hideSeeds = self.repoModel.getHiddenTips()
-        localSeeds = self.repoModel.getLocalTips()
-        buildLoop = GraphBuildLoop(heads=self.repoModel.getKnownTips(), hideSeeds=hideSeeds, localSeeds=localSeeds)
-        buildLoop.onKeyframe = self.progressValue.emit
-        buildLoop.sendAll(commitSequence)
-        self.progressValue.emit(numCommits)
+        repoModel.syncAheadBehind()
 
-        graph = buildLoop.graph
-        repoModel.hiddenCommits = buildLoop.hiddenCommits
-        repoModel.foreignCommits = buildLoop.foreignCommits
-        repoModel.commitSequence = commitSequence
-        repoModel.truncatedHistory = truncatedHistory
-        repoModel.graph = graph
-        repoModel.hideSeeds = hideSeeds
-        repoModel.localSeeds = localSeeds
+        if settings.prefs.graphCache and repoModel.graphCacheStale:
+            repoModel.saveGraphCache()
 
         # ---------------------------------------------------------------------
         # RETURN TO UI THREAD
         # ---------------------------------------------------------------------
         yield from self.flowEnterUiThread()
 
-        # Assign RepoModel to RepoWidget
-        rw.repoModel = repoModel
-        rw.updateBoundRepo()
+        extraRow = self.extraRow(repoModel)
+        if not self.uiPrimed:
+            yield from self.flowPrimeUi(repoModel, repoModel.commitSequence, extraRow)
+        else:
+            # The top of the graph is already visible; append the rest of the commits.
+            self.publishCommits(repoModel, repoModel.commitSequence, extraRow)
+            rw.sidebar.viewport().update()  # show ahead/behind counts
 
         # Save commit count (if not truncated)
         if not truncatedHistory:
@@ -188,20 +159,26 @@ class PrimeRepo(RepoTask):
         settings.history.write()
         rw.window().fillRecentMenu()  # TODO: emit signal instead?
 
-        # Finally, prime the UI.
+        # It's not necessary to refresh everything again (including workdir patches)
+        # after priming the repo.
+        self.effects = TaskEffects.Nothing
+
+    def flowPrimeUi(self, repoModel: RepoModel, commitSequence: CommitSequence, extraRow: SpecialRow):
+        from gitfourchette.tasks.jumptasks import Jump
+
+        rw = self.rw
+        self.uiPrimed = True
+
+        # Assign RepoModel to RepoWidget
+        rw.repoModel = repoModel
+        rw.updateBoundRepo()
 
         # Prime GraphView
         with QSignalBlockerContext(rw.graphView):
-            if repoModel.truncatedHistory:
-                extraRow = SpecialRow.TruncatedHistory
-            elif repo.is_shallow:
-                extraRow = SpecialRow.EndOfShallowHistory
-            else:
-                extraRow = SpecialRow.Invalid
-
             rw.graphView.clFilter.setHiddenCommits(repoModel.hiddenCommits)
             rw.graphView.clModel._extraRow = extraRow
-            rw.graphView.clModel.setCommitSequence(repoModel.commitSequence)
+            rw.graphView.clModel.repo = repoModel.repo
+            rw.graphView.clModel.setCommitSequence(commitSequence)
             rw.graphView.selectRowForLocator(NavLocator.inWorkdir(), force=True)
 
         # Prime Sidebar
@@ -241,15 +218,313 @@ class PrimeRepo(RepoTask):
         rw.refreshNumUncommittedChanges()
         rw.graphView.scrollToRowForLocator(initialLocator, QAbstractItemView.ScrollHint.PositionAtCenter)
 
-        # It's not necessary to refresh everything again (including workdir patches)
-        # after priming the repo.
-        self.effects = TaskEffects.Nothing
+    def flowBuildGraph(self, repoModel: RepoModel, maxCommits: int):
+        locale = QLocale()
+
+        # Read the history from Git's commit-graph file if it's up to date,
+        # otherwise prime the walker (this might take a while)
+        walker = repoModel.walkCommitGraph()
+        if walker is None:
+            walker = repoModel.primeWalker()
+
+        # Retrieve the number of commits that we loaded last time we opened this repo
+        # so we can estimate how long it'll take to load it again
+        numCommitsBallpark = settings.history.getRepoNumCommits(repoModel.repo.workdir)
+        if numCommitsBallpark != 0:
+            self.progressRange.emit(0, numCommitsBallpark)
+
+        # ---------------------------------------------------------------------
+        # Walk the commits and weave the graph in a single pass.
+        # Each commit is fed to the graph builder as soon as the walker yields
+        # it, so we never have to go over the entire commit sequence twice.
+
+        hideSeeds = repoModel.getHiddenTips()
+        localSeeds = repoModel.getLocalTips()
+        buildLoop = GraphBuildLoop(heads=repoModel.getKnownTips(), hideSeeds=hideSeeds, localSeeds=localSeeds,
+                                   batchTrickles=parenttable.numpyAvailable)
+        coBuild = buildLoop.coBuild()
+        coBuild.send(None)  # prime the generator
+
+        ucCommit = repoModel.uncommittedChangesMockCommit()
+        commitSequence = CommitSequence([ucCommit])
+        coBuild.send(ucCommit)
+
+        # The graph is woven in place, so the UI may look at it before we're done.
+        # Hidden/foreign commits are collected by the build loop and handed over to
+        # RepoModel's own sets whenever we publish some rows (see takeBuildFlags).
+        repoModel.hiddenCommits = set()
+        repoModel.foreignCommits = set()
+        repoModel.commitSequence = commitSequence
+        repoModel.graph = buildLoop.graph
+        repoModel.hideSeeds = hideSeeds
+        repoModel.localSeeds = localSeeds
+
+        self.progressAbortable.emit(True)
+
+        truncatedHistory = False
+        progressInterval = self.progressInterval
+        nextPublish = self.progressiveDisplayThreshold or -1
+
+        for i, commit in enumerate(walker):
+            commitSequence.append(commit)
+            coBuild.send(commit)
+
+            if i+1 >= maxCommits or (self.abortFlag and i+1 >= progressInterval):
+                truncatedHistory = True
+                break
+
+            # Show the commits we've got so far, but keep loading
+            if i+1 == nextPublish:
+                nextPublish += self.progressiveDisplayInterval
+                yield from self.flowPublishPartialGraph(repoModel, buildLoop)
+
+            # Report progress, not too often
+            if i % progressInterval == 0:
+                message = _("{0} commits…", locale.toString(i))
+                self.progressMessage.emit(message)
+                if numCommitsBallpark > 0 and i <= numCommitsBallpark:
+                    self.progressValue.emit(i)
+                    # Let RepoTaskRunner kill us here (e.g. if closing the RepoWidget tab while we're loading)
+                    yield from self.flowEnterWorkerThread()
+
+                # The user has clicked on a commit that is already shown:
+                # publish what we've got so far and let the jump through.
+                if self.uiPrimed and self.isJumpWaiting():
+                    yield from self.flowPublishPartialGraph(repoModel, buildLoop)
+
+        coBuild.close()  # flush it
+
+        if buildLoop.pendingKeyframes is not None:
+            # We've published a partial graph, so keyframes and flags must be handed over on the UI thread
+            yield from self.flowEnterUiThread()
+            buildLoop.flushKeyframes()
+            repoModel.takeBuildFlags(buildLoop)
+            yield from self.flowEnterWorkerThread()
+        else:
+            repoModel.takeBuildFlags(buildLoop)
+
+        # Can't abort anymore
+        self.progressAbortable.emit(False)
+
+        numCommits = len(commitSequence) - 1
+        logger.info(f"{repoModel.shortName}: loaded {numCommits} commits")
+        if truncatedHistory:
+            message = _("{0} commits (truncated log).", locale.toString(numCommits))
+        else:
+            message = _("{0} commits total.", locale.toString(numCommits))
+        self.progressMessage.emit(message)
+        self.progressRange.emit(0, numCommits)
+        self.progressValue.emit(numCommits)
+
+        repoModel.truncatedHistory = truncatedHistory
+        if truncatedHistory:
+            # Keep the weaver and the walker around in case we want to load more commits
+            repoModel.resumableBuild = ResumableBuild(buildLoop, walker)
+
+    def flowPublishPartialGraph(self, repoModel: RepoModel, buildLoop: GraphBuildLoop):
+        """
+        Show the rows that have been woven so far while the rest of the history
+        is loading, then run any jumps that the user has made in the meantime.
+
+        The UI thread may play back the graph while we keep weaving it on the
+        worker thread:
+
+        - The commit sequence shown in the UI is a snapshot that never grows
+          behind its back.
+        - New arcs are only ever appended past the rows that the UI can see.
+        - Keyframes are inserted into the middle of a list that the UI also
+          writes to, so they're only saved into the graph here, on the UI thread.
+        - The build loop collects hidden/foreign commits into its own sets.
+          They're only handed over to RepoModel here, on the UI thread.
+
+        Jumps run while the build is paused here, so they see a graph that
+        matches the rows shown.
+        """
+        from gitfourchette.tasks.jumptasks import Jump
+
+        buildLoop.deferKeyframes()
+        buildLoop.flushTrickles()
+
+        # Take a snapshot of the rows that are ready to be shown.
+        # The graph view needs a list that doesn't keep growing behind its back.
+        snapshot = repoModel.commitSequence.copy()
+
+        yield from self.flowEnterUiThread()
+
+        buildLoop.flushKeyframes()
+        repoModel.takeBuildFlags(buildLoop)
+
+        if not self.uiPrimed:
+            logger.info(f"{repoModel.shortName}: showing first {len(snapshot)} commits while loading")
+            yield from self.flowPrimeUi(repoModel, snapshot, SpecialRow.Invalid)
+        else:
+            self.publishCommits(repoModel, snapshot)
+
+        yield from self.flowAdoptDeferredTasks(Jump)
+
+        yield from self.flowEnterWorkerThread()
+
+    def publishCommits(self, repoModel: RepoModel, commitSequence: CommitSequence, extraRow=SpecialRow.Invalid):
+        assert onAppThread()
+        graphView = self.rw.graphView
+        graphView.clFilter.extendHiddenCommits(repoModel.hiddenCommits)
+        graphView.clModel.extendCommitSequence(commitSequence, extraRow)
+
+    @staticmethod
+    def extraRow(repoModel: RepoModel) -> SpecialRow:
+        if repoModel.truncatedHistory:
+            return SpecialRow.TruncatedHistory
+        elif repoModel.repo.is_shallow:
+            return SpecialRow.EndOfShallowHistory
+        else:
+            return SpecialRow.Invalid
 
     def onError(self, exc: Exception):
         self.rw.cleanup(str(exc), allowAutoReload=False)
         super().onError(exc)
 
 
+class ExpandHistory(RepoTask):
+    """
+    Load more commits below a truncated history.
+
+    Instead of reloading the repo, pick up the graph build where PrimeRepo
+    stopped it, and append the new rows at the bottom of the log.
+
+    If untilCommit is given, keep walking until that commit turns up (or until
+    the user stops the search from the diff banner), then jump to it.
+    """
+
+    progressMessage = Signal(str)
+
+    progressInterval = 1000
+    "Report progress and check for the stop button every so many commits."
+
+    abortFlag: bool
+
+    def onAbortButtonClicked(self):
+        self.abortFlag = True
+
+    def canDefer(self, task: RepoTask) -> bool:
+        from gitfourchette.tasks.jumptasks import Jump, RefreshRepo
+        from gitfourchette.tasks.misctasks import FilterCommits, SearchCommits
+        # The user may keep clicking around while the rest of the history is loading.
+        return isinstance(task, Jump | RefreshRepo | SearchCommits | FilterCommits)
+
+    def flow(self, maxCommits: int, untilCommit: Oid = NULL_OID):
+        from gitfourchette.tasks.jumptasks import Jump
+
+        repoModel = self.repoModel
+        locale = QLocale()
+        self.abortFlag = False
+
+        if maxCommits == 0:  # 0 means infinity
+            maxCommits = 2**63
+
+        if untilCommit and (untilCommit in repoModel.graph.commitRows or repoModel.resumableBuild is None):
+            # Already loaded (e.g. the user clicked the button twice), or nothing left to load
+            yield from self.flowSubtask(Jump, NavLocator.inCommit(untilCommit))
+            return
+
+        build = repoModel.takeResumableBuild()
+        assert build is not None, "can't resume graph build"
+        buildLoop = build.buildLoop
+
+        # After loading, jump back to what is currently the last commit (or to the commit we're looking for)
+        lastCommitId = untilCommit or repoModel.commitSequence[-1].id
+
+        if untilCommit:
+            banner = self.rw.diffArea.diffBanner
+            banner.popUp(_("Looking for commit {0} in the history…", hquo(shortHash(untilCommit))), "")
+            banner.addButton(_("Stop"), self.onAbortButtonClicked)
+            self.progressMessage.connect(banner.setText)
+
+        # GraphView holds on to the current sequence, so append to a copy.
+        # The graph is woven in place, so keyframes must be saved on the UI thread.
+        commitSequence = repoModel.commitSequence.copy()
+        repoModel.commitSequence = commitSequence
+        repoModel.reachability = None  # doesn't cover the new rows
+        buildLoop.deferKeyframes()
+
+        # ---------------------------------------------------------------------
+        # EXIT UI THREAD
+        # ---------------------------------------------------------------------
+        yield from self.flowEnterWorkerThread()
+
+        coBuild = buildLoop.coBuild()
+        coBuild.send(None)  # prime the generator
+
+        truncatedHistory = False
+        progressInterval = self.progressInterval
+        nextPublish = len(commitSequence) + PrimeRepo.progressiveDisplayInterval
+
+        for i, commit in enumerate(build.walker, start=len(commitSequence)):
+            commitSequence.append(commit)
+            coBuild.send(commit)
+
+            if i >= maxCommits or commit.id == untilCommit:
+                truncatedHistory = True
+                break
+
+            # Show the commits we've got so far, but keep loading
+            if i == nextPublish:
+                nextPublish += PrimeRepo.progressiveDisplayInterval
+                buildLoop.flushTrickles()
+                yield from self.flowPublishCommits(buildLoop, commitSequence.copy())
+                yield from self.flowEnterWorkerThread()
+
+            if i % progressInterval == 0:
+                self.progressMessage.emit(_("{0} commits…", locale.toString(i)))
+
+                # Let RepoTaskRunner kill us here (e.g. if closing the RepoWidget tab while we're loading)
+                yield from self.flowEnterWorkerThread()
+
+                if self.abortFlag:
+                    truncatedHistory = True
+                    break
+
+        coBuild.close()  # flush it
+
+        logger.info(f"{repoModel.shortName}: loaded {repoModel.numRealCommits} commits")
+        repoModel.truncatedHistory = truncatedHistory
+        if truncatedHistory:
+            repoModel.resumableBuild = build
+
+        # Counts that ran off the end of the history may be settled now
+        aheadBehindChanged = repoModel.syncAheadBehind(retryUnknown=True)
+
+        # ---------------------------------------------------------------------
+        # RETURN TO UI THREAD
+        # ---------------------------------------------------------------------
+        yield from self.flowPublishCommits(buildLoop, commitSequence, PrimeRepo.extraRow(repoModel))
+
+        if aheadBehindChanged:
+            self.rw.sidebar.viewport().update()
+
+        if not truncatedHistory:
+            settings.history.setRepoNumCommits(repoModel.repo.workdir, repoModel.numRealCommits)
+            settings.history.write()
+
+            if settings.prefs.graphCache:
+                yield from self.flowEnterWorkerThread()
+                repoModel.saveGraphCache()
+                yield from self.flowEnterUiThread()
+
+        yield from self.flowSubtask(Jump, NavLocator.inCommit(lastCommitId))
+
+    def flowPublishCommits(self, buildLoop: GraphBuildLoop, commitSequence: CommitSequence,
+                           extraRow=SpecialRow.Invalid):
+        yield from self.flowEnterUiThread()
+
+        buildLoop.flushKeyframes()
+        self.repoModel.takeBuildFlags(buildLoop)
+
+        graphView = self.rw.graphView
+        with QSignalBlockerContext(graphView):
+            graphView.clFilter.extendHiddenCommits(self.repoModel.hiddenCommits)
+            graphView.clModel.extendCommitSequence(commitSequence, extraRow)
+
+
 class LoadWorkdir(RepoTask):
     """
     Refresh stage/dirty diffs in the RepoModel.
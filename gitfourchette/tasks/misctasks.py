@@ -5,15 +5,19 @@
 # -----------------------------------------------------------------------------
 
 import logging
+from collections.abc import Callable
 from contextlib import suppress
 from pathlib import Path
 
 from gitfourchette import settings
 from gitfourchette.forms.ignorepatterndialog import IgnorePatternDialog
 from gitfourchette.forms.reposettingsdialog import RepoSettingsDialog
+from gitfourchette.graph import CommitSequence
+from gitfourchette.graphview.commitsearch import CommitFilterQuery, CommitSearchIndex, CommitSearchResults
+from gitfourchette.graphview.rowtextcache import RowText, RowTextCache, RowTextStyle
 from gitfourchette.localization import *
 from gitfourchette.nav import NavLocator
-from gitfourchette.porcelain import Oid, Signature
+from gitfourchette.porcelain import Oid, RefPrefix, Signature
 from gitfourchette.qt import *
 from gitfourchette.repomodel import UC_FAKEID
 from gitfourchette.tasks import TaskEffects
@@ -49,6 +53,8 @@ class EditRepoSettings(RepoTask):
 
 
 class GetCommitInfo(RepoTask):
+    MaxContainingRefs = 20
+
     @staticmethod
     def formatSignature(sig: Signature):
         dateText = signatureDateFormat(sig)
@@ -70,8 +76,20 @@ class GetCommitInfo(RepoTask):
             colon = _(":")
             return f"<tr><th>{th}{colon}</th><td>{td}</td></tr>"
 
+        def refLink(refName):
+            refLocator = NavLocator.inRef(refName)
+            link = links.new(lambda invoker: self.saveLocator(refLocator))
+            return linkify(escape(RefPrefix.split(refName)[1]), link)
+
         repo = self.repo
         repoModel = self.repoModel
+
+        # Finding out which refs contain the commit requires an index of the entire graph
+        if repoModel.reachability is None:
+            yield from self.flowEnterWorkerThread()
+            repoModel.buildReachabilityIndex()
+            yield from self.flowEnterUiThread()
+
         commit = repo.peel_commit(oid)
 
         # Break down commit message into summary/details
@@ -90,6 +108,16 @@ class GetCommitInfo(RepoTask):
             shallowCloneBlurb = _("You’re working in a shallow clone. This commit may actually have parents in the full history.")
             parentMarkup = tagify(shallowCloneBlurb, "<p><em>")
 
+        # Refs containing the commit
+        try:
+            containingRefs = repoModel.refsContaining(oid)
+        except KeyError:  # not in the graph (e.g. hidden by truncated history)
+            containingRefs = []
+        numOverflow = max(0, len(containingRefs) - self.MaxContainingRefs)
+        containingMarkup = ", ".join(refLink(r) for r in containingRefs[:self.MaxContainingRefs]) or "-"
+        if numOverflow:
+            containingMarkup += " " + _n("and {n} more", "and {n} more", numOverflow)
+
         # Committer
         if commit.author == commit.committer:
             committerMarkup = tagify(_("(same as author)"), "<i>")
@@ -101,6 +129,7 @@ class GetCommitInfo(RepoTask):
         table += tableRow(parentTitle, parentMarkup)
         table += tableRow(_("Author"), self.formatSignature(commit.author))
         table += tableRow(_("Committer"), committerMarkup)
+        table += tableRow(_("Contained in"), containingMarkup)
 
         # Graph debug info
         if withDebugInfo:
@@ -162,6 +191,140 @@ class GetCommitInfo(RepoTask):
         self.jumpTo = locator
 
 
+class SearchCommits(RepoTask):
+    """
+    Find the commits that match a search term, on the worker thread.
+
+    The commits are indexed as the search goes (see CommitSearchIndex), so
+    the first search in a large history takes the longest. The search is
+    carried out in chunks, from the top of the log down. The results so far
+    are passed to onResults after each chunk, so the UI can jump to a match
+    before the entire log has been searched.
+
+    If the user changes the search term in the meantime, the new search kills
+    this one between two chunks, and the new search picks up the indexing
+    where this one left off. Pass partialResults to resume a search that was
+    interrupted.
+    """
+
+    ChunkSize = 5000
+
+    def canKill(self, task: RepoTask) -> bool:
+        # A new search term supersedes the previous one
+        return isinstance(task, SearchCommits)
+
+    def flow(self, searchIndex: CommitSearchIndex, sequence: CommitSequence, term: str, likelyHash: bool,
+             onResults: Callable[[CommitSearchResults], None], partialResults: CommitSearchResults | None = None):
+        yield from self.flowEnterWorkerThread()
+
+        rawIds = sequence.buffers()[0]
+        numRows = len(sequence)
+
+        if partialResults is not None:
+            assert partialResults.isValidFor(term, likelyHash, sequence)
+            rows = list(partialResults.rows)
+            firstRow = partialResults.stop
+        else:
+            rows = []
+            firstRow = 1  # Skip row 0 (uncommitted changes)
+
+        for start in range(firstRow, numRows, self.ChunkSize):
+            stop = min(start + self.ChunkSize, numRows)
+            searchIndex.indexCommits(self.repo, rawIds, start, stop)
+            rows += searchIndex.search(rawIds, start, stop, term, likelyHash)
+
+            if stop < numRows:
+                # Publish the results so far. This also lets RepoTaskRunner kill us here
+                # (e.g. if the search term has changed).
+                yield from self.flowEnterUiThread()
+                onResults(CommitSearchResults(term, likelyHash, sequence, list(rows), stop))
+                yield from self.flowEnterWorkerThread()
+
+        yield from self.flowEnterUiThread()
+        onResults(CommitSearchResults(term, likelyHash, sequence, rows, max(firstRow, numRows)))
+
+
+class FilterCommits(RepoTask):
+    """
+    Evaluate the commit log's filter mode query on the worker thread.
+
+    The verdicts are written to a mask with one byte per row in the commit
+    log (see CommitLogFilter). Only the rows that are pending in the mask are
+    evaluated, so that the commits that show up at the top of the log after a
+    refresh don't cause the entire log to be filtered again.
+
+    The mask is passed to onResults after each chunk. If a jump or a refresh
+    kills this task, a new FilterCommits can pick up the pending rows where
+    this one left off.
+    """
+
+    ChunkSize = 5000
+
+    def canKill(self, task: RepoTask) -> bool:
+        # A new query supersedes the previous one; filtering takes over from searching
+        return isinstance(task, FilterCommits | SearchCommits)
+
+    def flow(self, searchIndex: CommitSearchIndex, sequence: CommitSequence, query: CommitFilterQuery,
+             mask: bytearray, onResults: Callable[[CommitFilterQuery, CommitSequence, bytearray], None]):
+        yield from self.flowEnterWorkerThread()
+
+        rawIds = sequence.buffers()[0]
+        numRows = len(sequence)
+
+        # Skip row 0 (uncommitted changes)
+        for start in range(1, numRows, self.ChunkSize):
+            stop = min(start + self.ChunkSize, numRows)
+            searchIndex.filterCommits(self.repo, rawIds, mask, start, stop, query)
+
+            if stop < numRows:
+                # Publish a copy of the verdicts so far (we'll keep writing to the mask).
+                # This also lets RepoTaskRunner kill us here (e.g. if the query has changed).
+                yield from self.flowEnterUiThread()
+                onResults(query, sequence, bytearray(mask))
+                yield from self.flowEnterWorkerThread()
+
+        yield from self.flowEnterUiThread()
+        onResults(query, sequence, mask)
+
+
+class PrefetchCommitTexts(RepoTask):
+    """
+    Format the display text of the rows around the viewport of the commit log
+    on the worker thread, so that they're ready to paint (see RowTextCache).
+
+    This task is expendable: any other task may kill it between two chunks.
+    """
+
+    ChunkSize = 100
+
+    def canKill(self, task: RepoTask) -> bool:
+        # The viewport has moved on
+        return isinstance(task, PrefetchCommitTexts)
+
+    def isExpendable(self) -> bool:
+        return True
+
+    def flow(self, style: RowTextStyle, oids: list[Oid],
+             onResults: Callable[[RowTextStyle, dict[Oid, RowText]], None]):
+        yield from self.flowEnterWorkerThread()
+
+        texts = {}
+
+        for start in range(0, len(oids), self.ChunkSize):
+            for oid in oids[start: start + self.ChunkSize]:
+                try:
+                    commit = self.repo.peel_commit(oid)
+                except KeyError:
+                    continue
+                texts[oid] = RowTextCache.formatCommit(commit, style)
+
+            # Let RepoTaskRunner kill us here (e.g. if the user has started another task)
+            yield from self.flowEnterWorkerThread()
+
+        yield from self.flowEnterUiThread()
+        onResults(style, texts)
+
+
 class NewIgnorePattern(RepoTask):
     def flow(self, seedPath: str):
         dlg = IgnorePatternDialog(seedPath, self.parentWidget())
@@ -10,7 +10,7 @@ import enum
 import logging
 import re
 import warnings
-from collections.abc import Generator
+from collections.abc import Callable, Generator
 from typing import Any, TYPE_CHECKING, Literal, TypeVar
 
 from gitfourchette.localization import *
@@ -270,6 +270,30 @@ class RepoTask(QObject):
         """
         return False
 
+    def canDefer(self, task: RepoTask) -> bool:
+        """
+        Return true if the given task may wait for this task to complete,
+        instead of being turned away while this task is running.
+        """
+        return False
+
+    def isExpendable(self) -> bool:
+        """
+        Return true if any other task may kill this task while it's running
+        (e.g. speculative work in the background that can be redone later).
+        Expendable tasks don't report any progress.
+        """
+        return False
+
+    def isKillable(self) -> bool:
+        """
+        Return false while this task mustn't be interrupted, even by a task
+        whose canKill() allows it (e.g. while the UI is catching up with
+        changes in RepoModel). The task that would have killed this task is
+        deferred instead.
+        """
+        return True
+
     def _isRunningOnAppThread(self):
         return onAppThread() and self._runningOnUiThread
 
@@ -374,6 +398,50 @@ class RepoTask(QObject):
         # To ensure correct deletion of the subtask when we get deleted, we are the subtask's parent
         subtask = subtaskClass(self)
         subtask.setRepoModel(self.repoModel)
+
+        # Get flow generator from subtask
+        subtask._currentFlow = subtask.flow(*args, **kwargs)
+        assert isinstance(subtask._currentFlow, Generator), "flow() must contain at least one yield statement"
+
+        yield from self._flowRunSubtask(subtask)
+        return subtask
+
+    def flowAdoptDeferredTasks(self, *taskTypes: type[RepoTask]):
+        """
+        Run the deferred tasks of the given types that are waiting for this
+        task to complete as if they were subtasks, then pick up where we left
+        off. This lets a long task give way to e.g. a Jump in between two of
+        its steps. Unlike with flowSubtask, an exception in an adopted task is
+        reported without stopping this task.
+        You must be on the UI thread.
+
+        This function is intended to be called by flow() with "yield from".
+        """
+        assert self._currentFlow is not None
+        assert self._isRunningOnAppThread(), "Adopted tasks must start on UI thread"
+
+        runner = self.rw.repoTaskRunner
+
+        # More tasks may be deferred while we're running the adopted ones
+        while adopted := runner.takeDeferredTasks(lambda task: isinstance(task, taskTypes)):
+            for task in adopted:
+                try:
+                    task.checkPrereqs()
+                    yield from self._flowRunSubtask(task)
+                except Exception as exc:
+                    if not onAppThread():
+                        yield FlowControlToken(FlowControlToken.Kind.ContinueOnUiThread)
+                    # Unwind the adopted task along with any subtasks that it left on the stack
+                    while task in self._taskStack:
+                        self._popSubtask()
+                    if isinstance(exc, AbortTask):
+                        runner.reportAbortTask(task, exc)
+                    else:
+                        task.onError(exc)
+                task.deleteLater()
+
+    def _flowRunSubtask(self, subtask: RepoTask):
+        assert subtask._currentFlow is not None
         subtask.setObjectName(f"{self.objectName()}:{subtask.objectName()}")
         # logger.debug(f"Subtask {subtask}")
 
@@ -381,10 +449,6 @@ class RepoTask(QObject):
         subtask._taskStack = self._taskStack  # share reference to task stack
         self._taskStack.append(subtask)
 
-        # Get flow generator from subtask
-        subtask._currentFlow = subtask.flow(*args, **kwargs)
-        assert isinstance(subtask._currentFlow, Generator), "flow() must contain at least one yield statement"
-
         # Forward coroutine continuation signal
         subtask.uiReady.connect(self.uiReady)
 
@@ -399,8 +463,6 @@ class RepoTask(QObject):
         rc = self._popSubtask()
         assert rc is subtask
 
-        return subtask
-
     def _popSubtask(self) -> RepoTask:
         assert self._taskStack, "task stack is already empty!"
         assert onAppThread()
@@ -630,6 +692,9 @@ class RepoTaskRunner(QObject):
     _zombieTask: RepoTask | None
     "Task that is being interrupted"
 
+    _deferredTasks: list[RepoTask]
+    "Tasks that will start one after the other once the current task completes"
+
     _currentTaskBenchmark: Benchmark
     "Context manager"
 
@@ -638,6 +703,7 @@ class RepoTaskRunner(QObject):
         self.setObjectName("RepoTaskRunner")
         self._currentTask = None
         self._zombieTask = None
+        self._deferredTasks = []
         self._currentTaskBenchmark = Benchmark("???")
 
         self._workerThread = FlowWorkerThread(self)
@@ -651,17 +717,27 @@ class RepoTaskRunner(QObject):
     def isBusy(self):
         return self._currentTask is not None or self._zombieTask is not None or self._workerThread.isRunning()
 
-    def killCurrentTask(self):
+    def killCurrentTask(self, successor: RepoTask | None = None):
         """
         Interrupt current task next time it yields a FlowControlToken.
 
         The task will not die immediately; use joinZombieTask() after killing
         the task to block the current thread until the task runner is empty.
+
+        If the task is being replaced with a successor, the deferred tasks
+        keep waiting (on the successor), except those that the successor
+        supersedes. Otherwise, the deferred tasks are discarded.
         """
         if not self._currentTask:
             # Nothing to kill.
             return
 
+        # Don't let a deferred task outlive the task it was waiting on, unless it can wait on the successor
+        if successor is None:
+            self._discardDeferredTasks(lambda deferred: True)
+        else:
+            self._discardDeferredTasks(lambda deferred: RepoTaskRunner._supersedes(successor, deferred))
+
         if not self._zombieTask:
             # Move the currently-running task to zombie mode.
             # It'll get deleted next time it yields a FlowControlToken.
@@ -714,11 +790,19 @@ class RepoTaskRunner(QObject):
             self._currentTask = task
             self._startTask(task)
 
-        elif task.canKill(self._currentTask):
+        elif ((task.canKill(self._currentTask) and self._currentTask.isKillable())
+              or self._currentTask.isExpendable()):
             logger.info(f"Task {task} killed task {self._currentTask}")
-            self.killCurrentTask()
+            self.killCurrentTask(successor=task)
             self._currentTask = task
 
+        elif self._currentTask.canDefer(task) or task.canKill(self._currentTask):
+            logger.info(f"Task {task} deferred until {self._currentTask} completes")
+            # Supersede any deferred task of the same kind, but let other kinds of tasks
+            # keep their turn (e.g. a refresh mustn't cancel a jump that's waiting)
+            self._discardDeferredTasks(lambda deferred: RepoTaskRunner._supersedes(task, deferred))
+            self._deferredTasks.append(task)
+
         else:
             logger.info(f"Task {task} cannot kill task {self._currentTask}")
             message = _("Please wait for the current operation to complete ({0}).", hquo(self._currentTask.name()))
@@ -838,6 +922,11 @@ class RepoTaskRunner(QObject):
 
             task.deleteLater()
 
+            # Start the next task that was waiting for this one to complete
+            if self._deferredTasks and self._currentTask is None:
+                self._currentTask = self._deferredTasks.pop(0)
+                self._startTask(self._currentTask)
+
         else:
             raise NotImplementedError(f"Unsupported FlowControlToken {token.flowControl}")
 
@@ -851,9 +940,45 @@ class RepoTaskRunner(QObject):
             token = FlowControlToken(FlowControlToken.Kind.InterruptedByException, exception)
         return token
 
+    @staticmethod
+    def _supersedes(task: RepoTask, deferred: RepoTask) -> bool:
+        # Don't let a task supersede another kind of task, or a task that it can't kill
+        # (e.g. two staging operations in a row must both be carried out)
+        return type(deferred) is type(task) and task.canKill(deferred)
+
+    def hasDeferredTasks(self, predicate: Callable[[RepoTask], bool]) -> bool:
+        """
+        Return true if any deferred task matches the predicate. The current
+        task may call this from its worker thread, as a hint that it should
+        give way to deferred tasks (see RepoTask.flowAdoptDeferredTasks).
+        """
+        return any(predicate(deferred) for deferred in self._deferredTasks)
+
+    def takeDeferredTasks(self, predicate: Callable[[RepoTask], bool]) -> list[RepoTask]:
+        """
+        Remove the deferred tasks that match the predicate from the queue
+        and return them, so that the current task may run them itself.
+        """
+        assert onAppThread()
+        taken = [deferred for deferred in self._deferredTasks if predicate(deferred)]
+        if taken:
+            self._deferredTasks = [deferred for deferred in self._deferredTasks if deferred not in taken]
+        return taken
+
+    def _discardDeferredTasks(self, predicate: Callable[[RepoTask], bool]):
+        keep = []
+        for deferred in self._deferredTasks:
+            if predicate(deferred):
+                logger.info(f"Discarding deferred task {deferred}")
+                deferred.deleteLater()
+            else:
+                keep.append(deferred)
+        self._deferredTasks = keep
+
     def _releaseTask(self, task: RepoTask):
         logger.debug(f"<<< {task}")
-        self.progress.emit("", False)
+        if not task.isExpendable():
+            self.progress.emit("", False)
         self._currentTaskBenchmark.__exit__(None, None, None)
 
         assert onAppThread()
@@ -50,6 +50,7 @@ class TaskBook:
             tasks.DropStash: _("Delete stash"),
             tasks.EditRemote: _("Edit remote"),
             tasks.EditUpstreamBranch: _("Edit upstream branch"),
+            tasks.ExpandHistory: _("Load more commits"),
             tasks.ExportCommitAsPatch: _("Export commit as patch file"),
             tasks.ExportPatchCollection: _("Export patch file"),
             tasks.ExportStashAsPatch: _("Export stash as patch file"),
@@ -57,6 +58,7 @@ class TaskBook:
             tasks.FastForwardBranch: _("Fast-forward branch"),
             tasks.FetchRemotes: _("Fetch remote branches"),
             tasks.FetchRemoteBranch: _("Fetch remote branch"),
+            tasks.FilterCommits: _("Filter commits"),
             tasks.GetCommitInfo: _("Get commit information"),
             tasks.HardSolveConflicts: _("Accept/reject incoming changes"),
             tasks.Jump: _("Navigate in repo"),
@@ -75,6 +77,7 @@ class TaskBook:
             tasks.NewRemote: _("Add remote"),
             tasks.NewStash: _("Stash changes"),
             tasks.NewTag: _("New tag"),
+            tasks.PrefetchCommitTexts: _("Prepare commit log"),
             tasks.PrimeRepo: _("Open repo"),
             tasks.PullBranch: _("Pull remote branch"),
             tasks.PushBranch: _("Push branch"),
@@ -90,6 +93,7 @@ class TaskBook:
             tasks.RestoreRevisionToWorkdir: _("Restore file revision"),
             tasks.RevertCommit: _("Revert commit"),
             tasks.RevertPatch: _("Revert selected text"),
+            tasks.SearchCommits: _("Find commit"),
             tasks.SetUpGitIdentity: _("Git identity"),
             tasks.EditRepoSettings: _("Repository settings"),
             tasks.StageFiles: _("Stage files"),
@@ -441,6 +441,14 @@ class TrTables:
                 _("After restarting, {app} will use this Qt binding if available."),
                 _("You can also pass the name of a Qt binding via the “QT_API” environment variable."),
             ),
+            "graphCache": _("Cache the commit graph on disk"),
+            "graphCache_help": "<p>" + _(
+                "Reopening a large repository is faster if {app} can reuse the commit graph "
+                "that it built last time. The cache is stored in the repository’s .git folder."),
+            "graphPixmapCache": _("Keep rendered commit graph rows in memory"),
+            "graphPixmapCache_help": "<p>" + _(
+                "Scrolling through the commit graph is smoother if {app} can reuse the rows "
+                "that it has already drawn. This takes up a few megabytes of memory per repository."),
             "condensedFonts": _("Use condensed fonts"),
             "condensedFonts_help": "<p>" + _(
                 "When a branch name or author name is too long to fit in its allotted space, "
@@ -0,0 +1,127 @@
+# -----------------------------------------------------------------------------
+# Copyright (C) 2025 Iliyas Jorio.
+# This file is part of GitFourchette, distributed under the GNU GPL v3.
+# For full terms, see the included LICENSE file.
+# -----------------------------------------------------------------------------
+
+import hashlib
+import random
+
+from gitfourchette import repomodel
+from gitfourchette.graph import CommitSequence, MockCommit, countAheadBehind
+from gitfourchette.graphview.commitlogmodel import SpecialRow
+from gitfourchette.nav import NavContext, NavLocator
+from gitfourchette.sidebar.sidebarmodel import SidebarModel
+from .util import *
+
+
+def makeRandomHistory(rng: random.Random, numCommits: int) -> list[MockCommit]:
+    oids = [Oid(raw=hashlib.sha1(f"{i}".encode()).digest()) for i in range(numCommits)]
+    commits = []
+    for i, oid in enumerate(oids):
+        candidates = oids[i + 1: i + 8]
+        numParents = min(rng.choice([0, 1, 1, 1, 2, 3]), len(candidates))
+        commits.append(MockCommit(oid, rng.sample(candidates, numParents)))
+    return commits
+
+
+def ancestors(commits: list[MockCommit], oid: Oid) -> set[Oid]:
+    byId = {c.id: c for c in commits}
+    stack = [oid]
+    seen = set()
+    while stack:
+        oid = stack.pop()
+        if oid not in seen and oid in byId:
+            seen.add(oid)
+            stack.extend(byId[oid].parent_ids)
+    return seen
+
+
+def testCountAheadBehindMatchesBruteForce():
+    rng = random.Random(0)
+
+    for _trial in range(200):
+        commits = makeRandomHistory(rng, rng.randint(1, 40))
+        oids = [c.id for c in commits]
+        pairs = [(rng.choice(oids), rng.choice(oids)) for _ in range(rng.randint(0, 8))]
+
+        # Truncate the history now and then
+        numLoaded = len(commits) if rng.random() < .6 else rng.randint(1, len(commits))
+        rows = {c.id: row for row, c in enumerate(commits[:numLoaded])}
+        counts = countAheadBehind(CommitSequence(commits[:numLoaded]), pairs, rows.__getitem__)
+
+        for (a, b), result in zip(pairs, counts, strict=True):
+            historyA = ancestors(commits, a)
+            historyB = ancestors(commits, b)
+            expected = (len(historyA - historyB), len(historyB - historyA))
+            if numLoaded == len(commits):
+                assert result == expected
+            else:
+                assert result is None or result == expected
+
+
+def testAheadBehindInSidebar(tempDir, mainWindow, monkeypatch):
+    wd = unpackRepo(tempDir)
+    rw = mainWindow.openRepo(wd)
+    sidebarModel = rw.sidebar.sidebarModel
+
+    def sidebarAheadBehind(branchName):
+        node = rw.sidebar.findNodeByRef(RefPrefix.HEADS + branchName)
+        return node.createIndex(sidebarModel).data(SidebarModel.Role.AheadBehind)
+
+    def expectedAheadBehind(branchName):
+        with RepoContext(wd) as repo:
+            upstream = repo.branches.local[branchName].upstream
+            return repo.ahead_behind(repo.branches.local[branchName].target, upstream.target)
+
+    assert sidebarAheadBehind("master") == expectedAheadBehind("master") == (2, 0)
+    assert sidebarAheadBehind("no-parent") == (0, 0)
+
+    node = rw.sidebar.findNodeByRef("refs/heads/master")
+    toolTip = node.createIndex(sidebarModel).data(Qt.ItemDataRole.ToolTipRole)
+    assert re.search(r"2 commits ahead, 0 commits behind", toolTip)
+    rw.sidebar.grab()  # exercise the delegate
+
+    # Count calls to the walk from now on
+    numWalkedPairs = []
+    countAheadBehindOriginal = repomodel.countAheadBehind
+    def countAheadBehindSpy(sequence, pairs, rowOf):
+        numWalkedPairs.append(len(pairs))
+        return countAheadBehindOriginal(sequence, pairs, rowOf)
+    monkeypatch.setattr(repomodel, "countAheadBehind", countAheadBehindSpy)
+
+    # Commit on master
+    with RepoContext(wd) as repo:
+        repo.create_commit_on_head("ahead by one more", TEST_SIGNATURE, TEST_SIGNATURE)
+    rw.refreshRepo()
+    assert sidebarAheadBehind("master") == expectedAheadBehind("master") == (3, 0)
+    assert numWalkedPairs == [1]
+
+    # Counts are cached by pair of tips: creating an unrelated branch shouldn't walk anything
+    with RepoContext(wd) as repo:
+        repo.create_branch_on_head("unrelated")
+    rw.refreshRepo()
+    assert numWalkedPairs == [1]
+
+    # Move master behind its upstream
+    with RepoContext(wd) as repo:
+        repo.reset(Oid(hex="6e1475206e57110fcef4b92320436c1e9872a322"), ResetMode.HARD)
+    rw.refreshRepo()
+    assert sidebarAheadBehind("master") == expectedAheadBehind("master") == (0, 3)
+
+
+def testAheadBehindInTruncatedHistory(tempDir, mainWindow):
+    mainWindow.onAcceptPrefsDialog({"maxCommits": 5})
+    wd = unpackRepo(tempDir)
+    rw = mainWindow.openRepo(wd)
+    repoModel = rw.repoModel
+
+    # The tip of no-parent isn't loaded
+    assert repoModel.aheadBehind["master"] == (2, 0)
+    assert "no-parent" not in repoModel.aheadBehind
+
+    # Load the rest of the history
+    rw.jump(NavLocator(NavContext.SPECIAL, path=str(SpecialRow.TruncatedHistory)))
+    triggerMenuAction(rw.graphView.makeContextMenu(), "load full commit history")
+    assert not repoModel.truncatedHistory
+    assert repoModel.aheadBehind["no-parent"] == (0, 0)
@@ -0,0 +1,109 @@
+# -----------------------------------------------------------------------------
+# Copyright (C) 2025 Iliyas Jorio.
+# This file is part of GitFourchette, distributed under the GNU GPL v3.
+# For full terms, see the included LICENSE file.
+# -----------------------------------------------------------------------------
+
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from gitfourchette.graph import GraphDiagram
+from gitfourchette.graph.commitgraphfile import CommitGraph, CommitGraphError
+from gitfourchette.graphview.commitlogmodel import CommitLogModel
+from gitfourchette.porcelain import SortMode
+from .util import *
+
+requiresGit = pytest.mark.skipif(shutil.which("git") is None, reason="requires git")
+
+
+def writeCommitGraph(wd: str, split=False):
+    command = ["git", "-C", wd, "commit-graph", "write", "--reachable"]
+    if split:
+        command.append("--split")
+    subprocess.run(command, check=True, capture_output=True)
+
+
+@requiresGit
+@pytest.mark.parametrize("split", [False, True])
+@pytest.mark.parametrize("sortTime", [False, True])
+@pytest.mark.parametrize("testRepoName", ["TestGitRepository", "testrepoformerging"])
+def testCommitGraphMatchesWalker(tempDir, testRepoName, split, sortTime):
+    wd = unpackRepo(tempDir, testRepoName)
+
+    if split:
+        # Build a chain of two layers
+        with RepoContext(wd) as repo:
+            repo.checkout_local_branch("master")
+        writeCommitGraph(wd, split=True)
+        with RepoContext(wd) as repo:
+            repo.create_commit_on_head("new commit", TEST_SIGNATURE, TEST_SIGNATURE)
+    writeCommitGraph(wd, split=split)
+
+    with RepoContext(wd) as repo:
+        tips = list(repo.map_refs_to_ids().values())
+        tips += tips[:2]  # pushing the same tip twice shouldn't throw off the order
+
+        walker = repo.walk(None, SortMode.TOPOLOGICAL | (SortMode.TIME if sortTime else 0))
+        for tip in tips:
+            walker.push(tip)
+        expected = [(c.id, list(c.parent_ids)) for c in walker]
+
+        objectsDir = os.path.join(repo.path, "objects")
+
+    with CommitGraph.open(objectsDir) as commitGraph:
+        assert len(commitGraph.layers) == (2 if split else 1)
+        commits = [(c.id, list(c.parent_ids)) for c in commitGraph.walk(tips, sortTime)]
+
+    assert commits == expected
+
+
+def testNoCommitGraph(tempDir):
+    wd = unpackRepo(tempDir)
+    assert CommitGraph.open(f"{wd}/.git/objects") is None
+
+
+def testCorruptCommitGraph(tempDir):
+    wd = unpackRepo(tempDir)
+    writeFile(f"{wd}/.git/objects/info/commit-graph", "this isn't a commit-graph")
+    with pytest.raises(CommitGraphError):
+        CommitGraph.open(f"{wd}/.git/objects")
+
+
+@requiresGit
+def testLoadHistoryFromCommitGraph(tempDir, mainWindow):
+    wd = unpackRepo(tempDir)
+
+    rw = mainWindow.openRepo(wd)
+    cachePath = rw.repoModel.graphCachePath
+    walkedSequence = [(c.id, list(c.parent_ids)) for c in rw.repoModel.commitSequence]
+    walkedDiagram = GraphDiagram.diagram(rw.repoModel.graph)
+    mainWindow.closeAllTabs()
+    os.unlink(cachePath)
+
+    writeCommitGraph(wd)
+    rw = mainWindow.openRepo(wd)
+    sequence = rw.repoModel.commitSequence
+    assert [(c.id, list(c.parent_ids)) for c in sequence] == walkedSequence
+    assert GraphDiagram.diagram(rw.repoModel.graph) == walkedDiagram
+
+    # The UI still gets full commits
+    commit = rw.graphView.clModel.data(rw.graphView.clModel.index(1, 0), CommitLogModel.Role.Commit)
+    assert isinstance(commit, Commit)
+    assert commit.id == sequence[1].id
+    assert commit.message
+
+
+@requiresGit
+def testStaleCommitGraphFallsBackToWalker(tempDir, mainWindow):
+    wd = unpackRepo(tempDir)
+    writeCommitGraph(wd)
+
+    with RepoContext(wd) as repo:
+        newOid = repo.create_commit_on_head("not in commit-graph", TEST_SIGNATURE, TEST_SIGNATURE)
+
+    rw = mainWindow.openRepo(wd)
+    assert rw.repoModel.walkCommitGraph() is None
+    assert rw.repoModel.commitSequence[1].id == newOid
@@ -0,0 +1,99 @@
+# -----------------------------------------------------------------------------
+# Copyright (C) 2025 Iliyas Jorio.
+# This file is part of GitFourchette, distributed under the GNU GPL v3.
+# For full terms, see the included LICENSE file.
+# -----------------------------------------------------------------------------
+
+import hashlib
+
+import pytest
+
+from gitfourchette.graph import CommitSequence, MockCommit
+from gitfourchette.graphview.commitlogmodel import CommitLogModel
+from .util import *
+
+
+def makeCommits(n: int) -> list[MockCommit]:
+    oids = [Oid(raw=hashlib.sha1(str(i).encode()).digest()) for i in range(n)]
+    commits = []
+    for i, oid in enumerate(oids):
+        if i == n - 1:
+            parents = []
+        elif i % 5 == 0 and i + 2 < n:
+            parents = [oids[i + 1], oids[i + 2]]
+        else:
+            parents = [oids[i + 1]]
+        commits.append(MockCommit(oid, parents))
+    return commits
+
+
+def asTuples(sequence):
+    return [(c.id, list(c.parent_ids)) for c in sequence]
+
+
+def testCommitSequenceRoundTrip():
+    commits = makeCommits(20)
+    sequence = CommitSequence(commits)
+
+    assert len(sequence) == 20
+    assert asTuples(sequence) == asTuples(commits)
+    assert sequence[-1] == commits[-1]
+    assert sequence.oidAt(3) == commits[3].id
+    assert sequence.parentIdsAt(5) == commits[5].parent_ids
+    assert [raw for raw, _ in sequence.iterRaw()] == [c.id.raw for c in commits]
+    assert sequence.rawIdsBetween(3, 6) == b"".join(c.id.raw for c in commits[3:6])
+    assert sequence.rawIdsBetween(18, 100) == b"".join(c.id.raw for c in commits[18:])
+    assert sequence.rawIdsBetween(25, 30) == b""
+
+    with pytest.raises(IndexError):
+        _dummy = sequence[20]
+
+
+@pytest.mark.parametrize("start,stop", [(0, 20), (0, 0), (3, 11), (5, 6), (-4, None), (12, 100)])
+def testCommitSequenceSlicing(start, stop):
+    commits = makeCommits(20)
+    sequence = CommitSequence(commits)
+    piece = sequence[start:stop]
+    assert isinstance(piece, CommitSequence)
+    assert asTuples(piece) == asTuples(commits[start:stop])
+
+
+def testCommitSequenceConcatenation():
+    commits = makeCommits(20)
+    sequence = CommitSequence(commits)
+
+    # The splicer glues a list of new commits on top of the old sequence
+    spliced = commits[:4] + sequence[7:]
+    assert isinstance(spliced, CommitSequence)
+    assert asTuples(spliced) == asTuples(commits[:4] + commits[7:])
+
+    spliced = sequence[:2] + sequence[10:]
+    assert asTuples(spliced) == asTuples(commits[:2] + commits[10:])
+
+    # Copies are independent
+    copy = sequence.copy()
+    copy.append(commits[0])
+    assert len(copy) == 21
+    assert len(sequence) == 20
+
+
+def testCommitSequenceIsCompact():
+    sequence = CommitSequence(makeCommits(1000))
+    assert sequence.memoryFootprint() < 1000 * 80
+
+
+def testCommitLogModelCachesFewCommits(tempDir, mainWindow, monkeypatch):
+    monkeypatch.setattr(CommitLogModel, "CommitCacheSize", 2)
+
+    wd = unpackRepo(tempDir)
+    rw = mainWindow.openRepo(wd)
+    clModel = rw.graphView.clModel
+    sequence = rw.repoModel.commitSequence
+    assert isinstance(sequence, CommitSequence)
+
+    for row in range(1, len(sequence)):
+        commit = clModel.data(clModel.index(row, 0), CommitLogModel.Role.Commit)
+        assert isinstance(commit, Commit)
+        assert commit.id == sequence[row].id
+
+    assert len(clModel._commitCache) <= 2 * CommitLogModel.CommitCacheSize
@@ -0,0 +1,62 @@
+# -----------------------------------------------------------------------------
+# Copyright (C) 2025 Iliyas Jorio.
+# This file is part of GitFourchette, distributed under the GNU GPL v3.
+# For full terms, see the included LICENSE file.
+# -----------------------------------------------------------------------------
+
+from gitfourchette.graph import *
+import pytest
+
+from gitfourchette.graph.graphbench import SCENARIOS, benchmarkGraph, benchmarkSequence, main, syntheticSequence
+
+
+def testSyntheticSequence():
+    sequence, heads = syntheticSequence(20, mergeEvery=7, mergeSpan=5)
+    assert len(sequence) == 20
+    assert heads == {sequence[0].id}
+    assert sequence[0].parent_ids == [sequence[1].id, sequence[5].id]
+    assert sequence[1].parent_ids == [sequence[2].id]
+    assert sequence[-1].parent_ids == []
+
+    graph = GraphBuildLoop(heads, keyframeInterval=4).sendAll(sequence).graph
+    graph.testConsistency()
+
+
+def testBenchmarkSmoke():
+    results = benchmarkGraph(300, keyframeInterval=20)
+    assert "build" in results
+    assert "bisect keyframes (int)" in results
+    assert all(seconds >= 0 for seconds in results.values())
+
+
+@pytest.mark.parametrize("scenario", SCENARIOS.keys())
+def testScenarioSequences(scenario):
+    sequence, heads = SCENARIOS[scenario](200)
+    assert len(sequence) >= 200
+    assert len({c.id for c in sequence}) == len(sequence)
+
+    # Parents must come after their children
+    rows = {c.id: row for row, c in enumerate(sequence)}
+    assert all(rows[p] > rows[c.id] for c in sequence for p in c.parent_ids)
+    assert heads <= rows.keys()
+
+    graph = GraphBuildLoop(heads, keyframeInterval=16).sendAll(sequence).graph
+    graph.testConsistency()
+
+
+def testBenchmarkSequenceSmoke():
+    sequence, heads = SCENARIOS["linux"](300)
+    timings, peakMemory = benchmarkSequence(sequence, heads, keyframeInterval=20, numSamples=10)
+    assert {"build", "splice", "getFrame (random)", "flattenLanes", "hidden trickle"} <= timings.keys()
+    assert timings["build"].rows == len(sequence)
+    assert peakMemory > 0
+
+
+def testBenchmarkCommandLine(tempDir, capsys):
+    from .util import unpackRepo
+    wd = unpackRepo(tempDir)
+    main(["octopus", "-n", "100", "-k", "10", "--repo", wd])
+    output = capsys.readouterr().out
+    assert "octopus (" in output
+    assert f"{wd} (" in output
+    assert "walk" in output
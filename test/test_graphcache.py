@@ -0,0 +1,111 @@
+# -----------------------------------------------------------------------------
+# Copyright (C) 2025 Iliyas Jorio.
+# This file is part of GitFourchette, distributed under the GNU GPL v3.
+# For full terms, see the included LICENSE file.
+# -----------------------------------------------------------------------------
+
+import os
+
+import pytest
+
+from gitfourchette.graph import *
+from gitfourchette.repomodel import UC_FAKEID
+from .util import *
+
+SCENARIOS = {
+    "linear": ("a-b-c-d-e", ""),
+    "octopus": ("a-b:c,d,e,f c:p d:q,f e:r f-s:z r:z p:z q:z z", ""),
+    "parentless": ("a-b-c x y-z", ""),
+    "junctions": ("a-b:c k:l c:c',l c':d l:e d-e-f", ""),
+    "spliced": ("a-b:c,x d-e:y x:z y-z", "a-b:c,x i-j-k-d-e:y x:z y-z"),
+    "spliced junctions": ("a-b:c k:l c:c',l c'-m-n-o:d,l l:e d-e-f",
+                          "x-y-z-a-b:c k:l c:c',l p-q:r,l r-c'-m-n-o:d,l l:e d-e-f"),
+}
+
+
+def summarizeFrames(graph: Graph, numRows: int):
+    # Loaded oids are real Oids (not MockOids), so compare raw hashes
+    def arcSummary(arc: Arc | None):
+        if arc is None:
+            return None
+        junctions = [(int(j.joinedAt), j.joinedBy.raw) for j in arc.junctions]
+        return (arc.lane, arc.openedBy.raw, arc.closedBy.raw, int(arc.openedAt), int(arc.closedAt),
+                int(arc.chain.topRow), int(arc.chain.bottomRow), junctions)
+
+    summary = []
+    for row in range(numRows):
+        frame = graph.getFrame(row)
+        summary.append((frame.commit.raw,
+                        [arcSummary(a) for a in frame.solvedArcs],
+                        [arcSummary(a) for a in frame.openArcs]))
+    return summary
+
+
+@pytest.mark.parametrize("scenarioKey", SCENARIOS.keys())
+def testGraphCacheRoundTrip(tempDir, scenarioKey):
+    textGraph1, textGraph2 = SCENARIOS[scenarioKey]
+    sequence, heads = GraphDiagram.parseDefinition(textGraph1)
+    builder = GraphBuildLoop(heads, keyframeInterval=2).sendAll(sequence)
+    graph = builder.graph
+
+    # Make the graph span several batches and aliased chains
+    if textGraph2:
+        sequence2, heads2 = GraphDiagram.parseDefinition(textGraph2)
+        GraphSpliceLoop(graph, sequence, heads, heads2, keyframeInterval=2).sendAll(sequence2)
+        sequence, heads = sequence2, heads2
+
+    path = f"{tempDir.name}/graph.cache"
+    refs = {f"refs/heads/{h}": h for h in heads}
+    GraphCache(refs=refs, sortKey="xyz", sequence=sequence, graph=graph,
+               hiddenCommits={sequence[-1].id}).save(path)
+
+    cache = GraphCache.load(path)
+    assert cache is not None
+    assert cache.sortKey == "xyz"
+    assert cache.refs == refs
+    assert cache.hiddenCommits == {sequence[-1].id}
+    assert [c.id for c in cache.sequence] == [c.id for c in sequence]
+    assert [c.parent_ids for c in cache.sequence] == [list(c.parent_ids) for c in sequence]
+    assert [int(r) for r in cache.graph.keyframeRows] == [int(r) for r in graph.keyframeRows]
+
+    cache.graph.testConsistency()
+    assert list(range(len(sequence))) == [cache.graph.getCommitRow(c.id) for c in sequence]
+    assert summarizeFrames(cache.graph, len(sequence)) == summarizeFrames(graph, len(sequence))
+
+
+def testGraphCacheRejectsGarbage(tempDir):
+    path = f"{tempDir.name}/graph.cache"
+    assert GraphCache.load(path) is None
+
+    with open(path, "wb") as f:
+        f.write(b"this isn't a graph cache")
+    assert GraphCache.load(path) is None
+
+
+def testReopenRepoFromGraphCache(tempDir, mainWindow):
+    wd = unpackRepo(tempDir)
+    rw = mainWindow.openRepo(wd)
+    cachePath = rw.repoModel.graphCachePath
+    sequence1 = [c.id for c in rw.repoModel.commitSequence]
+    diagram1 = GraphDiagram.diagram(rw.repoModel.graph)
+    assert os.path.isfile(cachePath)
+    mainWindow.closeAllTabs()
+
+    # Reopen without moving any refs
+    rw = mainWindow.openRepo(wd)
+    assert not rw.repoModel.graphCacheStale
+    assert [c.id for c in rw.repoModel.commitSequence] == sequence1
+    assert GraphDiagram.diagram(rw.repoModel.graph) == diagram1
+    assert rw.graphView.clModel.rowCount() == len(sequence1)
+    mainWindow.closeAllTabs()
+
+    # Move a ref behind our back; the cache should be spliced
+    with RepoContext(wd) as repo:
+        newOid = repo.create_commit_on_head("cache test", TEST_SIGNATURE, TEST_SIGNATURE)
+
+    rw = mainWindow.openRepo(wd)
+    assert rw.repoModel.commitSequence[1].id == newOid
+    assert [c.id for c in rw.repoModel.commitSequence[2:]] == sequence1[1:]
+    assert rw.repoModel.commitSequence[0].id == UC_FAKEID
+    assert not rw.repoModel.graphCacheStale  # spliced graph was written back to the cache
+    rw.repoModel.graph.testConsistency()
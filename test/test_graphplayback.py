@@ -220,3 +220,83 @@ def testVisibleJunctionOnHiddenArc():
     assert laneRemap['d'] == [(0, 0), (1, 1), (2, 2)]
     assert laneRemap['e'] == [(0, 0), (1, 1), (2, 2)]
     assert laneRemap['z'] == [(0, X), (1, X), (2, X)]
+
+
+def testArcsWithoutJunctionsShareEmptyTuple():
+    g = GraphDiagram.parse("a:d b:c,d c-d")
+
+    arcs = {(str(arc.openedBy), str(arc.closedBy)): arc for arc in g.startArc.nextArc}
+    assert not hasattr(arcs["b", "c"], "__dict__")
+    assert arcs["b", "c"].junctions == ()
+    assert arcs["c", "d"].junctions == ()
+    assert [str(j.joinedBy) for j in arcs["a", "d"].junctions] == ["b"]
+    assert isinstance(arcs["a", "d"].junctions, list)
+
+
+def testVolatileKeyframeEviction():
+    sequence, heads = GraphDiagram.parseDefinition("-".join(f"c{i}" for i in range(200)))
+    g = GraphBuildLoop(heads, keyframeInterval=50).sendAll(sequence).graph
+    pinned = list(zip(g.keyframeRows, g.keyframes, strict=True))
+    assert [int(r) for r, _ in pinned] == [0, 50, 100, 150]
+
+    # Seeking saves volatile keyframes with exponential spacing
+    g.getFrame(40)
+    assert g.keyframeStats.misses == 1
+    assert g.keyframeStats.replayedRows == 40
+    assert len(g.volatileKeyframes) > 0
+    assert len(g.keyframes) == len(pinned) + len(g.volatileKeyframes)
+
+    # Landing on a keyframe is a hit
+    volatileRow = next(int(kf.row) for kf in g.volatileKeyframes.values())
+    g.getFrame(volatileRow)
+    assert g.keyframeStats.hits == 1
+
+    # Squeeze the budget: only the most recently used volatile keyframe survives
+    g.volatileKeyframeBudget = 1
+    g.getFrame(190)
+    assert len(g.volatileKeyframes) == 1
+    assert g.keyframeStats.evictions > 0
+    assert g.volatileKeyframeBytes == sum(Graph.estimateKeyframeSize(kf) for kf in g.volatileKeyframes.values())
+
+    # Pinned keyframes are never evicted
+    for row, kf in pinned:
+        kfID = g.getBestKeyframeID(int(row))
+        assert g.keyframes[kfID] is kf
+    assert len(g.keyframes) == len(pinned) + 1
+    g.testConsistency()
+
+
+def testPinVolatileKeyframe():
+    g = GraphDiagram.parse("a-b-c-d-e-f-g-h")
+    g.getFrame(6)
+    kf = g.keyframes[g.getBestKeyframeID(4)]
+    assert int(kf.row) == 4
+    assert id(kf) in g.volatileKeyframes
+
+    # Saving a regular keyframe on top of a volatile one pins it
+    g.saveKeyframe(g.getFrame(4))
+    assert id(kf) not in g.volatileKeyframes
+    g.volatileKeyframeBudget = 0
+    g.evictVolatileKeyframes()
+    assert g.keyframes[g.getBestKeyframeID(4)] is kf
+
+
+def testGetFramesInOnePlayback():
+    sequence, heads = GraphDiagram.parseDefinition("a:c b-c:e d:e e-f")
+    g = GraphBuildLoop(heads, keyframeInterval=100).sendAll(sequence).graph
+    replayedBefore = g.keyframeStats.replayedRows
+
+    frames = list(g.getFrames(1, 5))
+    assert [int(f.row) for f in frames] == [1, 2, 3, 4]
+
+    # Same frames as random access, at the cost of a single seek
+    assert g.keyframeStats.replayedRows - replayedBefore == 1
+    # The next range picks up where this one left off
+    assert int(g.keyframes[g.getBestKeyframeID(4)].row) == 4
+    for frame in frames:
+        assert frame == g.getFrame(int(frame.row))
+
+    # Stop at the bottom of the graph
+    assert [int(f.row) for f in g.getFrames(4, 100)] == [4, 5]
+    assert list(g.getFrames(6, 100)) == []
+    assert list(g.getFrames(3, 3)) == []
@@ -403,3 +403,53 @@ def testGraphSplicing(scenarioKey):
                            newHeads=heads1, keyframeInterval=KF_INTERVAL_TEST)
     gsl2.sendAll(sequence1)
     g.testConsistency()
+
+
+def testCommitRowIndexFollowsSplice():
+    sequence1, heads1 = GraphDiagram.parseDefinition("a-b:e c-d-e-f-g")
+    sequence2, heads2 = GraphDiagram.parseDefinition("m-n:a o:e,a a-b:e c-d-e-f-g")
+
+    g = GraphBuildLoop(keyframeInterval=KF_INTERVAL_TEST).sendAll(sequence1).graph
+    assert isinstance(g.commitRows, CommitRowIndex)
+
+    GraphSpliceLoop(g, sequence1, heads1, heads2, keyframeInterval=KF_INTERVAL_TEST).sendAll(sequence2)
+
+    # Old rows were shifted down by batch, without touching the index
+    oids = [c.id for c in sequence2]
+    assert [g.commitRows.rowOf(oid) for oid in oids] == list(range(len(sequence2)))
+    assert [int(g.commitRows[oid]) for oid in oids] == list(range(len(sequence2)))
+
+    # Unknown commits are skipped when resolving several rows at once
+    assert g.commitRows.rowsOf(oids[::-1] + MockOid.encodeAll("zzz")) == list(range(len(sequence2)))[::-1]
+    with pytest.raises(KeyError):
+        g.commitRows.rowOf(MockOid.encode("zzz"))
+
+
+def testDeferredSwapLeavesGraphIntact():
+    sequence1, heads1 = GraphDiagram.parseDefinition("a-b:e c-d-e-f-g")
+    sequence2, heads2 = GraphDiagram.parseDefinition("m-n:a o:e,a a-b:e c-d-e-f-g")
+    verification = GraphBuildLoop(keyframeInterval=KF_INTERVAL_TEST).sendAll(sequence2).graph
+
+    g = GraphBuildLoop(keyframeInterval=KF_INTERVAL_TEST).sendAll(sequence1).graph
+    diagramBefore = GraphDiagram.diagram(g, verbose=True)
+    generationBefore = g.generation
+
+    gsl = GraphSpliceLoop(g, sequence1, heads1, heads2, keyframeInterval=KF_INTERVAL_TEST, deferSwap=True)
+    gsl.sendAll(sequence2)
+    assert gsl.splicer.foundEquilibrium
+    assert [c.id for c in gsl.commitSequence] == [c.id for c in sequence2]
+
+    # The old graph is still readable as-is until we swap in the new front
+    assert GraphDiagram.diagram(g, verbose=True) == diagramBefore
+    assert g.generation == generationBefore
+    assert [g.getCommitRow(c.id) for c in sequence1] == list(range(len(sequence1)))
+    assert all(c.id not in g.commitRows for c in sequence2[:3])
+
+    gsl.swap()
+    g.testConsistency()
+    assert g.generation == generationBefore + 1
+    assert [g.getCommitRow(c.id) for c in sequence2] == list(range(len(sequence2)))
+
+    g.keyframes = []
+    g.keyframeRows = []
+    assert GraphDiagram.diagram(g, verbose=True) == GraphDiagram.diagram(verification, verbose=True)
@@ -10,6 +10,14 @@ from dataclasses import dataclass
 import pytest
 
 from gitfourchette.graph import *
+from gitfourchette.graph.graphtrickle import STOP
+from gitfourchette.graph.parenttable import numpyAvailable
+
+requiresNumpy = pytest.mark.skipif(not numpyAvailable, reason="requires numpy")
+
+# Run the trickles one commit at a time, or in batches over a ParentTable
+parametrizeTrickleBackend = pytest.mark.parametrize(
+    "batchTrickles", [False, pytest.param(True, marks=requiresNumpy)], ids=["loop", "batch"])
 
 
 @dataclass
@@ -295,7 +303,8 @@ allFixtures = [
     argvalues=itertools.chain.from_iterable(g.hiddenCommitsParametrizedArgs() for g in allFixtures),
     ids=itertools.chain.from_iterable(g.hiddenCommitsParametrizedNames() for g in allFixtures),
 )
-def testHiddenCommitMarks(fixture: ChainMarkerFixture, seedsAscii, expectedHidden):
+@parametrizeTrickleBackend
+def testHiddenCommitMarks(fixture: ChainMarkerFixture, seedsAscii, expectedHidden, batchTrickles):
     seeds = set(MockOid.encodeAll(seedsAscii))
     fixtureHeads = set(MockOid.encodeAll(fixture.headsDef.split()))
 
@@ -304,7 +313,7 @@ def testHiddenCommitMarks(fixture: ChainMarkerFixture, seedsAscii, expectedHidde
 
     hiddenTips = set(MockOid.encodeAll(c for c in seedsAscii if not c.endswith("!")))
     hiddenTaps = set(MockOid.encodeAll(c.removesuffix("!") for c in seedsAscii if c.endswith("!")))
-    gbu = GraphBuildLoop(fixtureHeads, hideSeeds=hiddenTips, forceHide=hiddenTaps)
+    gbu = GraphBuildLoop(fixtureHeads, hideSeeds=hiddenTips, forceHide=hiddenTaps, batchTrickles=batchTrickles)
     gbu.sendAll(sequence)
 
     print("\n" + GraphDiagram.diagram(gbu.graph, verbose=False))
@@ -328,14 +337,15 @@ def testHiddenCommitMarks(fixture: ChainMarkerFixture, seedsAscii, expectedHidde
     argvalues=itertools.chain.from_iterable(g.localCommitsParametrizedArgs() for g in allFixtures),
     ids=itertools.chain.from_iterable(g.localCommitsParametrizedNames() for g in allFixtures),
 )
-def testLocalCommitMarks(fixture: ChainMarkerFixture, seedsAscii, expected):
+@parametrizeTrickleBackend
+def testLocalCommitMarks(fixture: ChainMarkerFixture, seedsAscii, expected, batchTrickles):
     seeds = set(MockOid.encodeAll(seedsAscii))
     fixtureHeads = set(MockOid.encodeAll(fixture.headsDef.split()))
 
     sequence, graphHeads = GraphDiagram.parseDefinition(fixture.graphDef)
     assert all(h in fixtureHeads for h in graphHeads)
 
-    builder = GraphBuildLoop(heads=fixtureHeads, localSeeds=seeds)
+    builder = GraphBuildLoop(heads=fixtureHeads, localSeeds=seeds, batchTrickles=batchTrickles)
     builder.sendAll(sequence)
     assert builder.foreignTrickle.done or builder.weaver.isDangling()
 
@@ -349,3 +359,125 @@ def testLocalCommitMarks(fixture: ChainMarkerFixture, seedsAscii, expected):
         oid = commit.id
         isLocal = oid not in builder.foreignCommits
         assert isLocal == (oid in expected), f"{oid} should be marked {oid in expected}, was marked {isLocal}"
+
+
+@pytest.mark.parametrize("fixture", allFixtures, ids=[g.graphName for g in allFixtures])
+@parametrizeTrickleBackend
+def testTakeFlaggedCommitsWhileBuilding(fixture: ChainMarkerFixture, batchTrickles):
+    heads = set(MockOid.encodeAll(fixture.headsDef.split()))
+    sequence, _dummy = GraphDiagram.parseDefinition(fixture.graphDef)
+
+    for seedsAscii in fixture.hiddenCommits:
+        seeds = set(MockOid.encodeAll(c for c in seedsAscii.split() if not c.endswith("!")))
+        expected = GraphBuildLoop(heads, hideSeeds=seeds, localSeeds=seeds).sendAll(sequence)
+
+        builder = GraphBuildLoop(heads, hideSeeds=seeds, localSeeds=seeds, batchTrickles=batchTrickles)
+        coBuild = builder.coBuild()
+        coBuild.send(None)
+        hiddenCommits, foreignCommits = set(), set()
+
+        # The flags handed over after each commit only concern the commits sent so far,
+        # and the builder never touches the sets that it has handed over
+        for row, commit in enumerate(sequence):
+            coBuild.send(commit)
+            builder.flushTrickles()
+            hidden, foreign = builder.takeFlaggedCommits()
+            sent = {c.id for c in sequence[:row + 1]}
+            assert hidden <= sent
+            assert foreign <= sent
+            hiddenCommits.update(hidden)
+            foreignCommits.update(foreign)
+
+        coBuild.close()
+        hidden, foreign = builder.takeFlaggedCommits()
+        assert not hidden and not foreign
+        assert hiddenCommits == expected.hiddenCommits
+        assert foreignCommits == expected.foreignCommits
+
+
+@pytest.mark.parametrize("fixture", allFixtures, ids=[g.graphName for g in allFixtures])
+def testHiddenDelta(fixture: ChainMarkerFixture):
+    heads = set(MockOid.encodeAll(fixture.headsDef.split()))
+    sequence, _dummy = GraphDiagram.parseDefinition(fixture.graphDef)
+    seedSets = [set(MockOid.encodeAll(k.split())) for k in fixture.hiddenCommits if "!" not in k]
+
+    for oldSeeds, newSeeds in itertools.product(seedSets, repeat=2):
+        builder = GraphBuildLoop(heads, hideSeeds=oldSeeds).sendAll(sequence)
+        oldHidden = builder.hiddenCommits
+        expectedHidden = GraphBuildLoop(heads, hideSeeds=newSeeds).sendAll(sequence).hiddenCommits
+
+        newlyHidden, newlyShown = GraphTrickle.hiddenDelta(
+            builder.graph, sequence, heads, oldSeeds, newSeeds, oldHidden)
+
+        assert not (newlyHidden & oldHidden)
+        assert newlyShown <= oldHidden
+        assert (oldHidden - newlyShown) | newlyHidden == expectedHidden, f"{oldSeeds} -> {newSeeds}"
+
+
+def testHiddenDeltaStopsWhenFrontierStabilizes():
+    # Side branch x1-x2 forks off a long linear history
+    trunk = [f"c{i}" for i in range(100)]
+    sequence, heads = GraphDiagram.parseDefinition("x1-x2:c3 " + "-".join(trunk))
+    heads = set(heads)
+    graph = GraphBuildLoop(heads).sendAll(sequence).graph
+
+    class SpySequence(list):
+        def __getitem__(self, i):
+            visited.append(i)
+            return super().__getitem__(i)
+
+    visited = []
+    newlyHidden, newlyShown = GraphTrickle.hiddenDelta(
+        graph, SpySequence(sequence), heads, set(), {MockOid("x1")}, set())
+    assert newlyHidden == set(MockOid.encodeAll(["x1", "x2"]))
+    assert not newlyShown
+    assert max(visited) < 10
+
+
+@pytest.mark.parametrize("fixture", allFixtures, ids=[g.graphName for g in allFixtures])
+def testTrickleLiveCount(fixture: ChainMarkerFixture):
+    heads = set(MockOid.encodeAll(fixture.headsDef.split()))
+    sequence, _dummy = GraphDiagram.parseDefinition(fixture.graphDef)
+
+    def checkLiveCount(trickle: GraphTrickle):
+        assert trickle.numLive == sum(1 for v in trickle.frontier.values() if v != STOP)
+
+    for seedsAscii in fixture.hiddenCommits:
+        hiddenTips = set(MockOid.encodeAll(c for c in seedsAscii.split() if not c.endswith("!")))
+        hiddenTaps = set(MockOid.encodeAll(c.removesuffix("!") for c in seedsAscii.split() if c.endswith("!")))
+        trickles = [GraphTrickle.newHiddenTrickle(heads, hiddenTips, hiddenTaps),
+                    GraphTrickle.newForeignTrickle(heads, hiddenTips)]
+        for trickle in trickles:
+            checkLiveCount(trickle)
+            for commit in sequence:
+                trickle.newCommit(commit.id, commit.parent_ids)
+                checkLiveCount(trickle)
+
+
+@requiresNumpy
+@pytest.mark.parametrize("fixture", allFixtures, ids=[g.graphName for g in allFixtures])
+def testParentTableMatchesTrickleLoop(fixture: ChainMarkerFixture):
+    heads = set(MockOid.encodeAll(fixture.headsDef.split()))
+    sequence, _dummy = GraphDiagram.parseDefinition(fixture.graphDef)
+    commitSequence = CommitSequence(sequence)
+
+    for seedsAscii in fixture.hiddenCommits:
+        hiddenTips = set(MockOid.encodeAll(c for c in seedsAscii.split() if not c.endswith("!")))
+        hiddenTaps = set(MockOid.encodeAll(c.removesuffix("!") for c in seedsAscii.split() if c.endswith("!")))
+        newTrickles = [lambda tips=hiddenTips, taps=hiddenTaps: GraphTrickle.newHiddenTrickle(heads, tips, taps),
+                       lambda tips=hiddenTips: GraphTrickle.newForeignTrickle(heads, tips)]
+
+        for newTrickle in newTrickles:
+            expected = newTrickle()
+            for commit in sequence:
+                expected.newCommit(commit.id, commit.parent_ids)
+
+            # Split the sequence into two chunks at every possible row.
+            # The trickle must be in the same state after each chunk as if it had been fed one commit at a time.
+            for split in range(len(sequence) + 1):
+                trickle = newTrickle()
+                ParentTable(commitSequence[:split]).trickle(trickle)
+                ParentTable(commitSequence[split:]).trickle(trickle)
+                assert trickle.flaggedSet == expected.flaggedSet
+                assert trickle.frontier == expected.frontier
+                assert trickle.numLive == expected.numLive
@@ -9,6 +9,7 @@ import dataclasses
 import pytest
 
 from gitfourchette.graph import GraphDiagram, GraphBuildLoop, GraphSpliceLoop, MockOid
+from gitfourchette.graph.parenttable import numpyAvailable
 
 
 @dataclasses.dataclass
@@ -124,9 +125,11 @@ SCENARIOS = [
 ]
 
 
+@pytest.mark.parametrize('batchTrickles', [False, pytest.param(True, marks=pytest.mark.skipif(
+    not numpyAvailable, reason="requires numpy"))], ids=["loop", "batch"])
 @pytest.mark.parametrize('reverse', ["", "reverse"])
 @pytest.mark.parametrize('scenario', SCENARIOS)
-def testGraphTrickleStabilization(scenario, reverse):
+def testGraphTrickleStabilization(scenario, reverse, batchTrickles):
     sequence, _dummy = GraphDiagram.parseDefinition(scenario.oldSequence)
     if scenario.newSequence:
         newSequence, _dummy = GraphDiagram.parseDefinition(scenario.newSequence)
@@ -145,7 +148,7 @@ def testGraphTrickleStabilization(scenario, reverse):
         oldHideSeeds, newHideSeeds = newHideSeeds, oldHideSeeds
         oldHiddenCommitsExpected, newHiddenCommitsExpected = newHiddenCommitsExpected, oldHiddenCommitsExpected
 
-    gbl = GraphBuildLoop(oldHeads, hideSeeds=oldHideSeeds)
+    gbl = GraphBuildLoop(oldHeads, hideSeeds=oldHideSeeds, batchTrickles=batchTrickles)
     gbl.sendAll(sequence)
 
     print()
@@ -7,8 +7,9 @@
 import pygit2.enums
 import pytest
 
-from gitfourchette.graphview.commitlogmodel import SpecialRow
+from gitfourchette.graphview.commitlogmodel import CommitLogModel, SpecialRow
 from gitfourchette.nav import NavLocator
+from gitfourchette.repomodel import UC_FAKEID
 from .util import *
 
 
@@ -349,3 +350,1148 @@ def testCommitAmendedOutsideAppVanishesFromGraph(tempDir, mainWindow):
 
     rw.refreshRepo()
     assert rw.navLocator.commit == newHeadId
+
+
+@pytest.mark.parametrize("maxCommits", [0, 10])
+@pytest.mark.parametrize("threaded", [False, True])
+def testProgressiveDisplay(tempDir, mainWindow, monkeypatch, request, maxCommits, threaded):
+    from gitfourchette.graph import GraphBuildLoop, GraphDiagram
+    from gitfourchette.graphview.commitlogmodel import CommitLogModel
+    from gitfourchette.tasks import PrimeRepo
+
+    # Make the small test repo large enough for progressive display
+    monkeypatch.setattr(PrimeRepo, "progressiveDisplayThreshold", 3)
+    monkeypatch.setattr(PrimeRepo, "progressiveDisplayInterval", 4)
+
+    rowCounts = []
+    extendCommitSequence = CommitLogModel.extendCommitSequence
+
+    def spyExtendCommitSequence(model, newCommitSequence, *args, **kwargs):
+        extendCommitSequence(model, newCommitSequence, *args, **kwargs)
+        rowCounts.append(model.rowCount())
+
+    monkeypatch.setattr(CommitLogModel, "extendCommitSequence", spyExtendCommitSequence)
+
+    wd = unpackRepo(tempDir)
+    mainWindow.onAcceptPrefsDialog({"maxCommits": maxCommits, "graphCache": False})
+
+    if threaded:
+        request.getfixturevalue("taskThread")
+        rw = mainWindow.openRepo(wd)
+        # Click on a commit while the rest of the history is loading
+        waitUntilTrue(lambda: rw.isLoaded, timeout=10000)
+        clickedOid = rw.repoModel.commitSequence[2].id
+        rw.graphView.selectRowForLocator(NavLocator.inCommit(clickedOid))
+        waitUntilTrue(lambda: not rw.repoTaskRunner.isBusy(), timeout=10000)
+        assert rw.navLocator.commit == clickedOid
+    else:
+        rw = mainWindow.openRepo(wd)
+
+    repoModel = rw.repoModel
+    clModel = rw.graphView.clModel
+
+    # Rows were appended in several batches after the top of the graph was shown
+    assert len(rowCounts) >= 2
+    assert rowCounts == sorted(rowCounts)
+    assert rowCounts[-1] == clModel.rowCount()
+
+    # The final state must be identical to a graph that was built in one go
+    assert clModel._commitSequence is repoModel.commitSequence
+    assert repoModel.truncatedHistory == (maxCommits != 0)
+    if repoModel.truncatedHistory:
+        assert repoModel.numRealCommits == maxCommits
+        assert clModel._extraRow == SpecialRow.TruncatedHistory
+    else:
+        assert clModel._extraRow == SpecialRow.Invalid
+
+    repoModel.graph.testConsistency()
+    refBuilder = GraphBuildLoop(heads=repoModel.getKnownTips()).sendAll(repoModel.commitSequence)
+    assert GraphDiagram.diagram(repoModel.graph) == GraphDiagram.diagram(refBuilder.graph)
+
+    # The graph view is usable
+    oid = repoModel.commitSequence[5].id
+    rw.jump(NavLocator.inCommit(oid))
+    waitUntilTrue(lambda: not rw.repoTaskRunner.isBusy())
+    assert rw.navLocator.commit == oid
+    assert rw.graphView.currentRowKind == SpecialRow.Commit
+
+
+def testJumpWhileLoading(tempDir, mainWindow, taskThread, monkeypatch):
+    import time
+    from gitfourchette.graph import GraphBuildLoop, parenttable
+    from gitfourchette.graph.graphweaver import GraphWeaver
+    from gitfourchette.tasks import PrimeRepo
+
+    # Show the top of the graph early, then keep loading slowly.
+    # Feed the trickles one commit at a time so that they flag commits as we go.
+    monkeypatch.setattr(PrimeRepo, "progressiveDisplayThreshold", 3)
+    monkeypatch.setattr(PrimeRepo, "progressiveDisplayInterval", 1000)
+    monkeypatch.setattr(PrimeRepo, "progressInterval", 1)
+    monkeypatch.setattr(parenttable, "numpyAvailable", False)
+
+    wd = unpackRepo(tempDir)
+    mainWindow.onAcceptPrefsDialog({"maxCommits": 0, "graphCache": False})
+    rw = mainWindow.openRepo(wd)
+
+    newCommit = GraphWeaver.newCommit
+    leaks = []
+
+    def slowNewCommit(weaver, *args, **kwargs):
+        # The worker thread mustn't touch the flags that the UI can see:
+        # they may only concern the rows that have been published
+        if rw.isLoaded:
+            repoModel = rw.repoModel
+            numPublished = len(rw.graphView.clModel._commitSequence)
+            flagged = repoModel.hiddenCommits | repoModel.foreignCommits
+            leaks.extend(oid for oid in flagged if repoModel.graph.getCommitRow(oid) >= numPublished)
+        time.sleep(.03)
+        return newCommit(weaver, *args, **kwargs)
+
+    monkeypatch.setattr(GraphWeaver, "newCommit", slowNewCommit)
+
+    # Click on a commit while the rest of the history is loading
+    waitUntilTrue(lambda: rw.isLoaded, timeout=10000)
+    clickedOid = rw.repoModel.commitSequence[2].id
+    rw.graphView.selectRowForLocator(NavLocator.inCommit(clickedOid))
+
+    # The jump goes through without waiting for the entire history to load
+    waitUntilTrue(lambda: rw.navLocator.commit == clickedOid, timeout=10000)
+    assert rw.isPriming
+    assert rw.graphView.clModel.rowCount() < rw.repoModel.numRealCommits
+
+    waitUntilTrue(lambda: not rw.repoTaskRunner.isBusy(), timeout=20000)
+    assert rw.navLocator.commit == clickedOid
+    assert not leaks
+
+    # The flags that were handed over while loading add up to those of a graph built in one go
+    repoModel = rw.repoModel
+    refBuilder = GraphBuildLoop(heads=repoModel.getKnownTips(), localSeeds=repoModel.getLocalTips())
+    refBuilder.sendAll(repoModel.commitSequence)
+    assert repoModel.foreignCommits == refBuilder.foreignCommits
+    assert repoModel.foreignCommits
+
+
+def testRowLayoutCache(tempDir, mainWindow, monkeypatch):
+    from gitfourchette import settings
+
+    wd = unpackRepo(tempDir)
+    rw = mainWindow.openRepo(wd)
+    graphView = rw.graphView
+    layoutCache = graphView.itemDelegate().rowLayoutCache
+
+    graph = rw.repoModel.graph
+    getFrameCalls = []
+    originalGetFrame = graph.getFrame
+    monkeypatch.setattr(graph, "getFrame", lambda row, *a, **k: getFrameCalls.append(row) or originalGetFrame(row, *a, **k))
+
+    graphView.viewport().grab()
+    assert getFrameCalls
+    assert layoutCache.layouts
+
+    # Repainting doesn't touch the graph
+    getFrameCalls.clear()
+    graphView.viewport().grab()
+    assert not getFrameCalls
+
+    # Toggling lane flattening invalidates the cache
+    monkeypatch.setattr(settings.prefs, "flattenLanes", not settings.prefs.flattenLanes)
+    graphView.viewport().grab()
+    assert getFrameCalls
+
+    # Splicing the graph invalidates the cache
+    getFrameCalls.clear()
+    generation = graph.generation
+    with RepoContext(rw.repo) as repo:
+        repo.create_commit_on_head("layout cache test", TEST_SIGNATURE, TEST_SIGNATURE)
+    rw.refreshRepo()
+    assert rw.repoModel.graph is graph
+    assert graph.generation > generation
+    graphView.viewport().grab()
+    assert getFrameCalls
+
+
+def testFramePrefetch(tempDir, mainWindow, monkeypatch):
+    from gitfourchette import settings
+
+    wd = unpackRepo(tempDir)
+    rw = mainWindow.openRepo(wd)
+    graphView = rw.graphView
+    model = graphView.model()
+    layoutCache = graphView.itemDelegate().rowLayoutCache
+    monkeypatch.setattr(settings.prefs, "graphPixmapCache", False)
+    monkeypatch.setattr(graphView, "FramePrefetchChunk", 2)
+
+    # Only show a few rows at a time
+    graphView.setFixedHeight(graphView.sizeHintForRow(0) * 4)
+    QTest.qWait(0)
+    graphView.scrollToTop()
+    top, bottom = graphView.visibleRowSpan()
+    numRows = model.rowCount()
+    assert 0 == top < bottom < numRows // 2
+
+    def drainQueue():
+        while graphView.framePrefetchQueue:
+            graphView.prefetchFrames()
+
+    def oidsInRows(rows):
+        oids = (model.index(row, 0).data(CommitLogModel.Role.Oid) for row in rows)
+        return {oid for oid in oids if oid is not None}
+
+    graph = rw.repoModel.graph
+    getFrameCalls = []
+    originalGetFrame = graph.getFrame
+    monkeypatch.setattr(graph, "getFrame", lambda row, *a, **k: getFrameCalls.append(row) or originalGetFrame(row, *a, **k))
+
+    # Lay out the rows in the viewport and below it ahead of time
+    layoutCache.clear()
+    graphView.scheduleFramePrefetch()
+    assert graphView.framePrefetchQueue[0] == range(0, 2)
+    drainQueue()
+    assert oidsInRows(range(numRows)) <= layoutCache.layouts.keys()
+    assert not getFrameCalls
+
+    # Scrolling through the prefetched rows doesn't seek through the graph
+    for row in range(numRows):
+        graphView.scrollTo(model.index(row, 0))
+        graphView.viewport().grab()
+    assert not getFrameCalls
+
+    # When scrolling up, lay out the rows above the viewport, nearest first
+    graphView.scrollToBottom()
+    top, bottom = graphView.visibleRowSpan()
+    graphView.scrollVelocity = -1000.0
+    graphView.scheduleFramePrefetch()
+    lookahead = [r for r in graphView.framePrefetchQueue if r.start < top]
+    assert lookahead[0] == range(top - 2, top)
+    assert [r.start for r in lookahead] == sorted((r.start for r in lookahead), reverse=True)
+
+    # Jumping far queues up the new rows first, to be laid out in the next slice of idle time
+    layoutCache.clear()
+    graphView.framePrefetchQueue.clear()
+    graphView.scrollToTop()
+    top, bottom = graphView.visibleRowSpan()
+    assert not layoutCache.layouts
+    assert graphView.framePrefetchQueue[0] == range(top, top + 2)
+    graphView.prefetchFrames()
+    graphView.prefetchFrames()
+    assert oidsInRows(range(top, bottom + 1)) <= layoutCache.layouts.keys()
+    graphView.viewport().grab()
+    assert not getFrameCalls
+
+    # Don't touch the graph while the worker thread may be reading it
+    layoutCache.clear()
+    graphView.scheduleFramePrefetch()
+    monkeypatch.setattr(rw.repoTaskRunner, "isBusy", lambda: True)
+    graphView.prefetchFrames()
+    assert not layoutCache.layouts
+    assert graphView.framePrefetchQueue[0] == range(top, top + 2)
+
+
+def testRowTextCache(tempDir, mainWindow, monkeypatch):
+    from gitfourchette import settings
+    from gitfourchette.graphview.rowtextcache import RowTextCache, RowTextStyle
+    from gitfourchette.toolbox import AuthorDisplayStyle
+
+    wd = unpackRepo(tempDir)
+    rw = mainWindow.openRepo(wd)
+    graphView = rw.graphView
+    textCache = graphView.itemDelegate().rowTextCache
+    oid = Oid(hex="42e4e7c5e507e113ebbb7801b16b52cf867b7ce1")
+
+    commitAtCalls = []
+    originalCommitAt = graphView.clModel.commitAt
+    monkeypatch.setattr(graphView.clModel, "commitAt", lambda row: commitAtCalls.append(row) or originalCommitAt(row))
+
+    # The rows around the viewport are formatted ahead of time
+    textCache.clear()
+    graphView.prefetchRowTexts()
+    assert len(textCache.texts) == len(rw.repoModel.commitSequence) - 1
+    assert textCache.texts[oid] == RowTextCache.formatCommit(rw.repo.peel_commit(oid), textCache.style)
+    assert textCache.texts[oid].hash == str(oid)[:settings.prefs.shortHashChars]
+
+    # Painting doesn't need to look up the commits
+    graphView.viewport().grab()
+    assert not commitAtCalls
+
+    # Changing the author display style invalidates the cache
+    monkeypatch.setattr(settings.prefs, "authorDisplayStyle", AuthorDisplayStyle.Initials)
+    graphView.viewport().grab()
+    assert commitAtCalls
+    assert textCache.style == RowTextStyle.current(graphView.locale())
+    assert textCache.style.authorStyle == AuthorDisplayStyle.Initials
+    topOid = graphView.model().index(1, 0).data(CommitLogModel.Role.Oid)
+    assert textCache.texts[topOid] == RowTextCache.formatCommit(rw.repo.peel_commit(topOid), textCache.style)
+
+
+def testHighlightSearchTermInMissingCommit(tempDir, mainWindow, monkeypatch):
+    from gitfourchette import settings
+
+    wd = unpackRepo(tempDir)
+    rw = mainWindow.openRepo(wd)
+    graphView = rw.graphView
+    monkeypatch.setattr(settings.prefs, "graphPixmapCache", False)
+
+    graphView.prefetchRowTexts()
+    graphView.searchBar.popUp()
+    QTest.keyClicks(graphView.searchBar.lineEdit, "zzz not in any summary")
+
+    # The text of the rows is cached, but the commits can't be looked up anymore
+    monkeypatch.setattr(graphView.clModel, "commitAt", lambda row: None)
+    graphView.viewport().grab()
+
+
+def testRowTextPrefetchYieldsToOtherTasks(tempDir, mainWindow, taskThread, monkeypatch):
+    from gitfourchette.graphview.rowtextcache import RowTextCache
+    from gitfourchette.tasks import PrefetchCommitTexts
+
+    wd = unpackRepo(tempDir)
+    rw = mainWindow.openRepo(wd)
+    waitUntilTrue(lambda: rw.isLoaded and not rw.repoTaskRunner.isBusy(), timeout=10000)
+    graphView = rw.graphView
+    textCache = graphView.itemDelegate().rowTextCache
+
+    # Make the prefetch crawl
+    formatCommit = RowTextCache.formatCommit
+    monkeypatch.setattr(PrefetchCommitTexts, "ChunkSize", 1)
+    monkeypatch.setattr(RowTextCache, "formatCommit", lambda c, s: QThread.msleep(20) or formatCommit(c, s))
+
+    prefetchResults = []
+    monkeypatch.setattr(graphView, "onPrefetchedRowTexts", lambda *args: prefetchResults.append(args))
+
+    textCache.clear()
+    graphView.prefetchRowTexts()
+    assert isinstance(rw.repoTaskRunner.currentTask, PrefetchCommitTexts)
+
+    # Another task takes precedence over the prefetch without a "please wait" message
+    oid = Oid(hex="42e4e7c5e507e113ebbb7801b16b52cf867b7ce1")
+    rw.jump(NavLocator.inCommit(oid))
+    waitUntilTrue(lambda: not rw.repoTaskRunner.isBusy())
+    assert graphView.currentCommitId == oid
+    assert not prefetchResults
+    with pytest.raises(KeyError):
+        findQMessageBox(rw, "please wait")
+
+
+def testRowPixmapCache(tempDir, mainWindow, monkeypatch):
+    from gitfourchette import settings
+    from gitfourchette.graphview.rowpixmapcache import RowPixmapCache
+
+    wd = unpackRepo(tempDir)
+    rw = mainWindow.openRepo(wd)
+    graphView = rw.graphView
+    delegate = graphView.itemDelegate()
+    pixmapCache = delegate.rowPixmapCache
+    oid = Oid(hex="49322bb17d3acc9146f98c97d078513228bbf3c0")
+
+    paintedOids = []
+    originalPaint = delegate._paint
+    def spyPaint(painter, option, index):
+        paintedOids.append(index.data(CommitLogModel.Role.Oid))
+        return originalPaint(painter, option, index)
+    monkeypatch.setattr(delegate, "_paint", spyPaint)
+
+    # Reference rendering without the cache
+    monkeypatch.setattr(settings.prefs, "graphPixmapCache", False)
+    referenceImage = graphView.viewport().grab().toImage()
+    assert not pixmapCache.rows
+    monkeypatch.setattr(settings.prefs, "graphPixmapCache", True)
+
+    # The rows are rendered once, then blitted
+    paintedOids.clear()
+    assert graphView.viewport().grab().toImage() == referenceImage
+    assert oid in paintedOids
+    assert pixmapCache.rows
+    paintedOids.clear()
+    graphView.clModel._toolTipZones.clear()
+    assert graphView.viewport().grab().toImage() == referenceImage
+    assert paintedOids == [UC_FAKEID]  # special rows aren't cached
+
+    # Tooltip zones are still available for cached rows
+    row = graphView.getFilterIndexForCommit(oid).row()
+    assert graphView.clModel._toolTipZones[row]
+
+    # Repainting a single commit
+    paintedOids.clear()
+    graphView.repaintCommit(oid)
+    graphView.viewport().grab()
+    assert paintedOids == [UC_FAKEID, oid]
+
+    # Refs have changed
+    paintedOids.clear()
+    with RepoContext(wd) as repo:
+        repo.create_branch_from_commit("pixmap-cache-test", oid)
+    rw.refreshRepo()
+    graphView.viewport().grab()
+    assert oid in paintedOids
+
+    # Prefs have changed
+    paintedOids.clear()
+    graphView.refreshPrefs()
+    graphView.viewport().grab()
+    assert oid in paintedOids
+
+    # The cache doesn't go over its memory budget
+    monkeypatch.setattr(RowPixmapCache, "MaxBytes", 3 * pixmapCache.numBytes // len(pixmapCache.rows))
+    graphView.refreshPrefs()
+    graphView.viewport().grab()
+    assert 1 <= len(pixmapCache.rows) <= 3
+    assert pixmapCache.numBytes <= RowPixmapCache.MaxBytes
+
+
+def testRefboxLayoutCache(tempDir, mainWindow, monkeypatch):
+    from gitfourchette import settings
+    from gitfourchette.toolbox import FittedText
+
+    wd = unpackRepo(tempDir)
+    oid = Oid(hex="49322bb17d3acc9146f98c97d078513228bbf3c0")
+    with RepoContext(wd) as repo:
+        for i in range(30):
+            repo.create_reference(f"refs/tags/release-{i}", oid)
+
+    monkeypatch.setattr(settings.prefs, "graphPixmapCache", False)
+    rw = mainWindow.openRepo(wd)
+    graphView = rw.graphView
+    row = graphView.getFilterIndexForCommit(oid).row()
+
+    fittedTexts = []
+    originalFit = FittedText.fit
+    monkeypatch.setattr(FittedText, "fit", lambda font, maxWidth, text, *a, **k:
+                        fittedTexts.append(text) or originalFit(font, maxWidth, text, *a, **k))
+
+    def refToolTips():
+        zones = graphView.clModel._toolTipZones[row]
+        return [z.data for z in zones if z.kind == "ref"]
+
+    image = graphView.viewport().grab().toImage()
+    assert "release-0" in fittedTexts
+    assert "refs/tags/release-0" in refToolTips()
+
+    # Repainting doesn't measure the refboxes again
+    fittedTexts.clear()
+    graphView.clModel._toolTipZones.clear()
+    assert graphView.viewport().grab().toImage() == image
+    assert not [t for t in fittedTexts if t.startswith("release-")]
+    assert "refs/tags/release-0" in refToolTips()
+
+    # New refs on the commit
+    with RepoContext(wd) as repo:
+        repo.create_reference("refs/tags/release-30", oid)
+    rw.refreshRepo()
+    graphView.viewport().grab()
+    assert "release-30" in fittedTexts
+
+
+def testToggleHiddenBranchPatchesFilter(tempDir, mainWindow, monkeypatch):
+    from gitfourchette.graph import CommitSequence
+
+    wd = unpackRepo(tempDir)
+    rw = mainWindow.openRepo(wd)
+    clFilter = rw.graphView.clFilter
+    numRows = clFilter.rowCount()
+
+    # Patching the filter mustn't copy the entire history
+    rawIdsBetween = CommitSequence.rawIdsBetween
+    copiedRows = []
+    monkeypatch.setattr(CommitSequence, "buffers", lambda seq: pytest.fail("copied the entire sequence"))
+    monkeypatch.setattr(CommitSequence, "rawIdsBetween",
+                        lambda seq, start, stop: copiedRows.append(stop - start) or rawIdsBetween(seq, start, stop))
+
+    def visibleIds():
+        return {clFilter.index(row, 0).data(CommitLogModel.Role.Oid) for row in range(clFilter.rowCount())}
+
+    # The rows that change must be removed/inserted in runs, without invalidating the entire layout
+    layoutChanges = []
+    clFilter.layoutChanged.connect(lambda: layoutChanges.append(1))
+    hiddenSet = rw.repoModel.hiddenCommits
+    generation = rw.repoModel.hiddenCommitsGeneration
+
+    # Only show 'no-parent'
+    rw.toggleHideRefPattern("refs/heads/no-parent", allButThis=True)
+    assert rw.repoModel.hiddenCommits is hiddenSet  # patched in place
+    assert rw.repoModel.hiddenCommitsGeneration > generation
+    hiddenCommits = rw.repoModel.hiddenCommits - {UC_FAKEID}  # UC_FAKEID always has a row
+    assert Oid(hex="c9ed7bf12c73de26422b7c5a44d74cfce5a8993b") in hiddenCommits  # master
+    assert clFilter.rowCount() == numRows - len(hiddenCommits)
+    assert not (visibleIds() & hiddenCommits)
+
+    rw.toggleHideRefPattern("refs/heads/no-parent", allButThis=True)
+    assert not rw.repoModel.hiddenCommits
+    assert clFilter.rowCount() == numRows
+    assert hiddenCommits <= visibleIds()
+    assert sum(copiedRows) < numRows
+    assert not layoutChanges
+
+
+@pytest.mark.parametrize("interrupt", [False, True])
+def testSpliceOnWorkerThread(tempDir, mainWindow, taskThread, monkeypatch, interrupt):
+    from gitfourchette.repomodel import RepoModel
+    from gitfourchette.toolbox import onAppThread
+
+    wd = unpackRepo(tempDir)
+    rw = mainWindow.openRepo(wd)
+    waitUntilTrue(lambda: rw.isLoaded and not rw.repoTaskRunner.isBusy(), timeout=10000)
+
+    repoModel = rw.repoModel
+    clModel = rw.graphView.clModel
+    oldSequence = repoModel.commitSequence
+    oldRowCount = clModel.rowCount()
+
+    spliceThreads = []
+    spliceTopOfGraph = RepoModel.spliceTopOfGraph
+
+    def spySpliceTopOfGraph(model, *args, **kwargs):
+        gsl = spliceTopOfGraph(model, *args, **kwargs)
+        spliceThreads.append(onAppThread())
+        # Nothing has been swapped in yet
+        assert model.commitSequence is oldSequence
+        assert newOid not in model.graph.commitRows
+        return gsl
+
+    monkeypatch.setattr(RepoModel, "spliceTopOfGraph", spySpliceTopOfGraph)
+
+    with RepoContext(wd) as repo:
+        newOid = repo.create_commit_on_head("spliced on worker thread", TEST_SIGNATURE, TEST_SIGNATURE)
+        repo.create_branch_from_commit("spliced-branch", newOid)
+
+    rw.refreshRepo()
+    if interrupt:
+        # Click a commit while the refresh task is splicing.
+        # The jump must wait until the UI has caught up with the new refs.
+        rw.jump(NavLocator.inCommit(oldSequence[3].id))
+    waitUntilTrue(lambda: not rw.repoTaskRunner.isBusy(), timeout=10000)
+
+    assert spliceThreads == [False]
+    assert rw.sidebar.findNodeByRef("refs/heads/spliced-branch")
+    if interrupt:
+        assert rw.navLocator.commit == oldSequence[3].id
+    assert repoModel.commitSequence[1].id == newOid
+    assert repoModel.graph.getCommitRow(newOid) == 1
+    assert clModel.rowCount() == oldRowCount + 1
+    repoModel.graph.testConsistency()
+
+
+@pytest.mark.parametrize("threaded", [False, True])
+@pytest.mark.parametrize("hideBranch", [False, True])
+def testExpandTruncatedHistory(tempDir, mainWindow, monkeypatch, request, hideBranch, threaded):
+    from gitfourchette.graph import GraphBuildLoop, GraphDiagram
+    from gitfourchette.graph.graphweaver import GraphWeaver
+    from gitfourchette.tasks import PrimeRepo
+    from gitfourchette.toolbox import makeInternalLink
+
+    # Append rows to the log in several batches while expanding
+    monkeypatch.setattr(PrimeRepo, "progressiveDisplayInterval", 4)
+
+    wd = unpackRepo(tempDir)
+
+    # Make a branch whose own commit is buried below the truncation threshold
+    with RepoContext(wd) as repo:
+        parent = repo.peel_commit(Oid(hex="6462e7d8024396b14d7651e2ec11e2bbf07a05c4"))
+        signature = Signature(TEST_SIGNATURE.name, TEST_SIGNATURE.email, parent.commit_time + 1, 0)
+        buriedOid = repo.create_commit("refs/heads/buried", signature, signature, "buried", parent.tree_id, [parent.id])
+
+    mainWindow.onAcceptPrefsDialog({"maxCommits": 5, "graphCache": False})
+    if threaded:
+        request.getfixturevalue("taskThread")
+    rw = mainWindow.openRepo(wd)
+    waitUntilTrue(lambda: rw.isLoaded and not rw.repoTaskRunner.isBusy(), timeout=10000)
+    repoModel = rw.repoModel
+    clModel = rw.graphView.clModel
+    assert repoModel.truncatedHistory
+    assert repoModel.resumableBuild is not None
+    assert buriedOid not in repoModel.graph.commitRows
+
+    if hideBranch:
+        rw.toggleHideRefPattern("refs/heads/buried")
+        assert repoModel.resumableBuild is not None
+
+    numWoven = 0
+    newCommit = GraphWeaver.newCommit
+
+    def spyNewCommit(weaver, *args, **kwargs):
+        nonlocal numWoven
+        numWoven += 1
+        return newCommit(weaver, *args, **kwargs)
+
+    monkeypatch.setattr(GraphWeaver, "newCommit", spyNewCommit)
+
+    # Load a few more commits
+    rw.processInternalLink(makeInternalLink("expandlog", n="10"))
+    waitUntilTrue(lambda: not rw.repoTaskRunner.isBusy(), timeout=10000)
+    assert numWoven == 5
+    assert repoModel.numRealCommits == 10
+    assert repoModel.truncatedHistory
+    assert clModel.rowCount() == len(repoModel.commitSequence) + 1
+    assert clModel._extraRow == SpecialRow.TruncatedHistory
+    assert rw.navLocator.commit == repoModel.commitSequence[5].id
+
+    # Load the rest
+    rw.processInternalLink(makeInternalLink("expandlog", n="0"))
+    waitUntilTrue(lambda: not rw.repoTaskRunner.isBusy(), timeout=10000)
+    sequence = repoModel.commitSequence
+    assert numWoven == len(sequence) - 6
+    assert not repoModel.truncatedHistory
+    assert repoModel.resumableBuild is None
+    assert clModel.rowCount() == len(sequence)
+    assert clModel._extraRow == SpecialRow.Invalid
+
+    # The final state must be identical to a graph that was built in one go
+    heads = set(repoModel.getKnownTips())
+    refBuilder = GraphBuildLoop(heads=heads, hideSeeds=repoModel.hideSeeds, localSeeds=repoModel.localSeeds)
+    refBuilder.sendAll(sequence)
+    repoModel.graph.testConsistency()
+    assert GraphDiagram.diagram(repoModel.graph) == GraphDiagram.diagram(refBuilder.graph)
+    assert repoModel.hiddenCommits == refBuilder.hiddenCommits
+    assert repoModel.foreignCommits == refBuilder.foreignCommits
+    assert repoModel.hiddenCommits == ({buriedOid} if hideBranch else set())
+    assert rw.graphView.clFilter.rowCount() == len(sequence) - len(repoModel.hiddenCommits)
+
+    walker = repoModel.primeWalker()
+    assert [c.id for c in sequence[1:]] == [c.id for c in walker]
+
+
+def testExpandTruncatedHistoryAfterSplice(tempDir, mainWindow):
+    from gitfourchette.toolbox import makeInternalLink
+
+    wd = unpackRepo(tempDir)
+    mainWindow.onAcceptPrefsDialog({"maxCommits": 5, "graphCache": False})
+    rw = mainWindow.openRepo(wd)
+    assert rw.repoModel.resumableBuild is not None
+
+    with RepoContext(wd) as repo:
+        newOid = repo.create_commit_on_head("new commit", TEST_SIGNATURE, TEST_SIGNATURE)
+    rw.refreshRepo()
+    assert rw.repoModel.commitSequence[1].id == newOid
+
+    # The graph has been spliced, so we can't keep walking from where we stopped
+    assert rw.repoModel.resumableBuild is None
+    rw.processInternalLink(makeInternalLink("expandlog", n="0"))
+    assert not rw.repoModel.truncatedHistory
+    assert rw.repoModel.commitSequence[1].id == newOid
+    assert rw.graphView.clModel.rowCount() == len(rw.repoModel.commitSequence)
+
+
+@pytest.mark.parametrize("threaded", [False, True])
+def testFindCommitInTruncatedHistory(tempDir, mainWindow, request, threaded):
+    from gitfourchette.toolbox import makeInternalLink
+
+    wd = unpackRepo(tempDir)
+    mainWindow.onAcceptPrefsDialog({"maxCommits": 5, "graphCache": False})
+    if threaded:
+        request.getfixturevalue("taskThread")
+    rw = mainWindow.openRepo(wd)
+    waitUntilTrue(lambda: rw.isLoaded and not rw.repoTaskRunner.isBusy(), timeout=10000)
+    repoModel = rw.repoModel
+    graphView = rw.graphView
+    banner = rw.diffArea.diffBanner
+    oid = Oid(hex="d31f5a60d406e831d056b8ac2538d515100c2df2")
+    assert oid not in repoModel.graph.commitRows
+
+    # Jumping to a commit beyond the truncated history offers to look for it
+    rw.jump(NavLocator.inCommit(oid))
+    waitUntilTrue(lambda: not rw.repoTaskRunner.isBusy())
+    assert banner.isVisibleTo(rw)
+    assert "truncated" in banner.label.text()
+    assert "find" in banner.buttons[-1].text().lower()
+
+    # Walk the history down to the commit, and no further
+    banner.buttons[-1].click()
+    waitUntilTrue(lambda: not rw.repoTaskRunner.isBusy(), timeout=10000)
+    assert repoModel.commitSequence[-1].id == oid
+    assert repoModel.truncatedHistory
+    assert repoModel.resumableBuild is not None
+    assert graphView.clModel.rowCount() == len(repoModel.commitSequence) + 1
+    assert graphView.currentCommitId == oid
+    assert rw.navLocator.commit == oid
+    assert not banner.isVisibleTo(rw)
+
+    # The rest of the history can still be loaded later
+    rw.processInternalLink(makeInternalLink("expandlog", n="0"))
+    waitUntilTrue(lambda: not rw.repoTaskRunner.isBusy(), timeout=10000)
+    assert not repoModel.truncatedHistory
+    assert [c.id for c in repoModel.commitSequence[1:]] == [c.id for c in repoModel.primeWalker()]
+    repoModel.graph.testConsistency()
+
+
+def testStopLookingForCommitInTruncatedHistory(tempDir, mainWindow, monkeypatch):
+    from gitfourchette.tasks import ExpandHistory
+
+    # Check for the stop button after every commit
+    monkeypatch.setattr(ExpandHistory, "progressInterval", 1)
+
+    wd = unpackRepo(tempDir)
+    mainWindow.onAcceptPrefsDialog({"maxCommits": 5, "graphCache": False})
+    rw = mainWindow.openRepo(wd)
+    repoModel = rw.repoModel
+    numCommits = len(repoModel.commitSequence)
+    oid = Oid(hex="d31f5a60d406e831d056b8ac2538d515100c2df2")
+
+    # Click "Stop" as soon as the search starts
+    banner = rw.diffArea.diffBanner
+    originalAddButton = banner.addButton
+
+    def addButtonAndStop(*args, **kwargs):
+        button = originalAddButton(*args, **kwargs)
+        if "stop" in button.text().lower():
+            button.click()
+        return button
+
+    monkeypatch.setattr(banner, "addButton", addButtonAndStop)
+    ExpandHistory.invoke(rw, 0, oid)
+    assert oid not in repoModel.graph.commitRows
+    assert len(repoModel.commitSequence) == numCommits + 1
+    assert repoModel.truncatedHistory
+    assert repoModel.resumableBuild is not None
+    assert rw.navLocator.commit == oid
+    assert "find" in banner.buttons[-1].text().lower()
+
+
+def testCommitSearchIndexMatchesHashPrefixes():
+    from gitfourchette.graph import CommitSequence, MockCommit
+    from gitfourchette.graphview.commitsearch import CommitSearchIndex, CommitSearchResults
+    from gitfourchette.toolbox import AuthorDisplayStyle
+
+    oids = [Oid(hex=h * 40) for h in "0123"] + [Oid(hex="12" + "f" * 38)]
+    sequence = CommitSequence([MockCommit(oid, []) for oid in oids])
+    rawIds = sequence.buffers()[0]
+
+    index = CommitSearchIndex(AuthorDisplayStyle.FullName)
+    index.texts = {oid.raw: f"message {i}\0author" for i, oid in enumerate(oids)}
+
+    assert index.search(rawIds, 0, len(oids), "1", likelyHash=True) == [1, 4]
+    assert index.search(rawIds, 0, len(oids), "12", likelyHash=True) == [4]
+    assert index.search(rawIds, 0, len(oids), "12f", likelyHash=True) == [4]
+    assert index.search(rawIds, 0, len(oids), "111", likelyHash=True) == [1]
+    assert index.search(rawIds, 2, len(oids), "1", likelyHash=True) == [4]
+    assert index.search(rawIds, 0, len(oids), "1", likelyHash=False) == [1]  # "message 1"
+    assert index.search(rawIds, 0, len(oids), "author", likelyHash=False) == [0, 1, 2, 3, 4]
+    assert index.search(rawIds, 0, len(oids), "1 author", likelyHash=False) == []  # doesn't straddle message/author
+
+    results = CommitSearchResults("x", False, sequence, [1, 4, 6, 9], 10)
+    assert list(results.rowsBetween(0, 10)) == [1, 4, 6, 9]
+    assert list(results.rowsBetween(4, 8)) == [4, 6]
+    assert list(results.rowsBetween(8, 0)) == [6, 4, 1]
+    assert list(results.rowsBetween(9, 9)) == [9]
+    assert list(results.rowsBetween(7, 8)) == []
+
+
+def testCommitSearchOnWorkerThread(tempDir, mainWindow, taskThread, monkeypatch):
+    from gitfourchette.tasks import SearchCommits
+
+    wd = unpackRepo(tempDir)
+    rw = mainWindow.openRepo(wd)
+    waitUntilTrue(lambda: rw.isLoaded and not rw.repoTaskRunner.isBusy(), timeout=10000)
+    graphView = rw.graphView
+    searchBar = graphView.searchBar
+    searchEdit = searchBar.lineEdit
+
+    searchedTerms = []
+    searchFlow = SearchCommits.flow
+
+    def spySearchFlow(task, searchIndex, sequence, term, *args):
+        searchedTerms.append(term)
+        return searchFlow(task, searchIndex, sequence, term, *args)
+
+    monkeypatch.setattr(SearchCommits, "flow", spySearchFlow)
+
+    QTest.qWait(0)
+    QTest.keySequence(mainWindow, "Ctrl+F")
+    QTest.keyClicks(searchEdit, "first")
+    waitUntilTrue(lambda: graphView.currentCommitId == Oid(hex="6462e7d8024396b14d7651e2ec11e2bbf07a05c4"))
+    assert searchedTerms == ["first"]
+    assert len(graphView.searchIndex) == len(rw.repoModel.commitSequence) - 1
+
+    # Next/previous don't search the log again
+    QTest.keySequence(searchEdit, "Return")
+    assert graphView.currentCommitId == Oid(hex="42e4e7c5e507e113ebbb7801b16b52cf867b7ce1")
+    QTest.keySequence(searchEdit, "Shift+Return")
+    assert graphView.currentCommitId == Oid(hex="6462e7d8024396b14d7651e2ec11e2bbf07a05c4")
+    assert searchedTerms == ["first"]
+    waitUntilTrue(lambda: not rw.repoTaskRunner.isBusy())
+
+    # After a refresh, the log is searched again, but only the new commit needs indexing
+    numIndexed = len(graphView.searchIndex)
+    with RepoContext(wd) as repo:
+        newOid = repo.create_commit_on_head("first commit after refresh", TEST_SIGNATURE, TEST_SIGNATURE)
+    rw.refreshRepo()
+    waitUntilTrue(lambda: not rw.repoTaskRunner.isBusy())
+    QTest.keySequence(searchEdit, "Shift+Return")
+    waitUntilTrue(lambda: graphView.currentCommitId == newOid)
+    assert searchedTerms == ["first", "first"]
+    assert len(graphView.searchIndex) == numIndexed + 1
+
+    # Hidden commits can't be found
+    waitUntilTrue(lambda: not rw.repoTaskRunner.isBusy())
+    rw.toggleHideRefPattern("refs/heads/no-parent", allButThis=True)
+    waitUntilTrue(lambda: not rw.repoTaskRunner.isBusy())
+    searchEdit.selectAll()
+    QTest.keyClicks(searchEdit, "c9ed7bf")  # master
+    waitUntilTrue(lambda: searchBar.isRed())
+    QTest.keySequence(searchEdit, "Return")
+    rejectQMessageBox(searchBar, "not found among the branches that aren.t hidden")
+
+
+def testCommitSearchJumpsToMatchBeforeIndexingIsComplete(tempDir, mainWindow, taskThread, monkeypatch):
+    from gitfourchette.graphview.commitsearch import CommitSearchIndex
+    from gitfourchette.tasks import SearchCommits
+
+    wd = unpackRepo(tempDir)
+    rw = mainWindow.openRepo(wd)
+    waitUntilTrue(lambda: rw.isLoaded and not rw.repoTaskRunner.isBusy(), timeout=10000)
+    graphView = rw.graphView
+    searchEdit = graphView.searchBar.lineEdit
+
+    # Make the search crawl
+    indexCommits = CommitSearchIndex.indexCommits
+    monkeypatch.setattr(SearchCommits, "ChunkSize", 1)
+    monkeypatch.setattr(CommitSearchIndex, "indexCommits",
+                        lambda index, *args: QThread.msleep(10) or indexCommits(index, *args))
+
+    QTest.qWait(0)
+    QTest.keySequence(mainWindow, "Ctrl+F")
+    QTest.keyClicks(searchEdit, "first")
+    waitUntilTrue(lambda: graphView.currentCommitId == Oid(hex="6462e7d8024396b14d7651e2ec11e2bbf07a05c4"))
+    assert not graphView.searchResults.isComplete()
+
+    # Wrapping around to the bottom of the log must wait for the bottom to be searched
+    QTest.keySequence(searchEdit, "Shift+Return")
+    assert graphView.currentCommitId == Oid(hex="6462e7d8024396b14d7651e2ec11e2bbf07a05c4")
+    waitUntilTrue(lambda: not rw.repoTaskRunner.isBusy(), timeout=30000)
+    assert graphView.searchResults.isComplete()
+    assert len(graphView.searchIndex) == len(rw.repoModel.commitSequence) - 1
+    assert graphView.currentIndex().row() == graphView.searchResults.rows[-1]
+
+    # Wrap around to the top
+    QTest.keySequence(searchEdit, "Return")
+    assert graphView.currentCommitId == Oid(hex="6462e7d8024396b14d7651e2ec11e2bbf07a05c4")
+
+
+def testCommitLogFilterMatchesBruteForce():
+    import random
+    from gitfourchette.graph import CommitSequence, MockCommit
+    from gitfourchette.graphview.commitlogfilter import CommitLogFilter
+    from gitfourchette.graphview.commitsearch import FilterVerdict
+
+    rng = random.Random(0)
+    nextId = 0
+
+    def newCommits(n: int) -> list[MockCommit]:
+        nonlocal nextId
+        nextId += n
+        return [MockCommit(Oid(hex=f"{i:040x}"), []) for i in range(nextId - n + 1, nextId + 1)]
+
+    clModel = CommitLogModel(None)
+    clFilter = CommitLogFilter(None)
+    clFilter.setSourceModel(clModel)
+
+    hidden = set()
+    accepted = set()  # commits that pass the filter
+    filterOn = False
+
+    def sequence() -> list[MockCommit]:
+        return list(clModel._commitSequence)
+
+    def evaluateFilter():
+        mask = clFilter.filterMask
+        for row, commit in enumerate(sequence()):
+            if mask[row] == FilterVerdict.Pending:
+                mask[row] = FilterVerdict.Accept if commit.id in accepted else FilterVerdict.Reject
+        clFilter.setFilterMask(mask)
+
+    def check(persistent: QPersistentModelIndex | None = None, persistentOid: Oid | None = None):
+        commits = sequence()
+        expected = [row for row in range(clModel.rowCount())
+                    if row == 0 or row >= len(commits)
+                    or (commits[row].id not in hidden and (not filterOn or clFilter.filterMask[row] == FilterVerdict.Accept))]
+
+        assert clFilter.rowCount() == len(expected)
+        assert [clFilter.mapToSource(clFilter.index(i, 0)).row() for i in range(clFilter.rowCount())] == expected
+        for row in range(clModel.rowCount()):
+            proxyIndex = clFilter.mapFromSource(clModel.index(row, 0))
+            assert proxyIndex.row() == (expected.index(row) if row in expected else -1)
+        assert clFilter.numVisibleCommits() == sum(1 <= row < len(commits) for row in expected)
+
+        # Persistent indexes (e.g. the current index in the view) follow their commits around
+        if persistent is not None:
+            rows = [row for row, c in enumerate(commits) if c.id == persistentOid]
+            if rows and rows[0] in expected:
+                assert persistent.row() == expected.index(rows[0])
+                assert persistent.data(CommitLogModel.Role.Oid) == persistentOid
+            else:
+                assert not persistent.isValid()
+
+    clModel.setCommitSequence(CommitSequence([MockCommit(UC_FAKEID, [])] + newCommits(30)))
+
+    for _step in range(300):
+        commits = sequence()
+        visibleRows = list(range(clFilter.rowCount()))
+        persistentRow = rng.choice(visibleRows[1:] or visibleRows)
+        persistent = QPersistentModelIndex(clFilter.index(persistentRow, 0))
+        persistentOid = persistent.data(CommitLogModel.Role.Oid)
+        if persistentOid in (None, UC_FAKEID):  # special row
+            persistent = None
+
+        dice = rng.random()
+        if dice < .25:
+            # Splice the top of the log
+            numRemoved = rng.randint(1, len(commits) - 1)
+            top = newCommits(rng.randint(1, 6))
+            if rng.random() < .5:
+                hidden.update(c.id for c in top if rng.random() < .3)
+                clFilter.setHiddenCommits(hidden)
+            accepted.update(c.id for c in top if rng.random() < .5)
+            newSequence = CommitSequence([commits[0]] + top + commits[numRemoved + 1:])
+            clModel.mendCommitSequence(numRemoved, len(top), newSequence)
+        elif dice < .4:
+            # Append commits at the bottom of the log
+            bottom = newCommits(rng.randint(0, 20))
+            newlyHidden = {c.id for c in bottom if rng.random() < .3}
+            hidden.update(newlyHidden)
+            accepted.update(c.id for c in bottom if rng.random() < .5)
+            clFilter.extendHiddenCommits(newlyHidden)
+            extraRow = rng.choice([SpecialRow.Invalid, SpecialRow.TruncatedHistory])
+            clModel.extendCommitSequence(CommitSequence(commits + bottom), extraRow)
+        elif dice < .45:
+            # Replace the log wholesale
+            clModel.setCommitSequence(CommitSequence([commits[0]] + newCommits(rng.randint(0, 40))))
+        elif dice < .6:
+            hidden = {c.id for c in commits[1:] if rng.random() < .2}
+            clFilter.setHiddenCommits(hidden)
+        elif dice < .75:
+            # Toggle a few commits
+            toggled = {c.id for c in rng.sample(commits, min(5, len(commits))) if c.id != UC_FAKEID}
+            newlyHidden, newlyShown = toggled - hidden, toggled & hidden
+            hidden ^= toggled
+            changedRows = [row for row, c in enumerate(commits) if c.id in toggled]
+            clFilter.patchHiddenCommits(newlyHidden, newlyShown, changedRows)
+            assert clFilter.hiddenIds == hidden
+        elif dice < .85:
+            filterOn = not filterOn
+            if filterOn:
+                accepted = {c.id for c in commits if rng.random() < .5}
+                clFilter.setFilterMask(clFilter.makePendingFilterMask())
+                check(persistent, persistentOid)  # pending rows are hidden
+                persistent = None
+                evaluateFilter()
+            else:
+                clFilter.setFilterMask(None)
+        check(persistent, persistentOid)
+
+        # Rows that have just appeared in the log are pending evaluation
+        if clFilter.hasPendingFilterRows():
+            assert filterOn
+            evaluateFilter()
+            assert not clFilter.hasPendingFilterRows()
+            check()
+
+
+def testCommitFilterQuery():
+    from gitfourchette.graphview.commitsearch import CommitFilterQuery
+
+    query = CommitFilterQuery.parse('author:Thor  fix(ed)?   path:"c/my file.txt" since:2022-01-01 until:2022-01-16 bug')
+    assert query.author == "thor"
+    assert query.path == "c/my file.txt"
+    assert query.message.pattern == "fix(ed)? bug"
+    assert query.until - query.since == 16 * 24 * 3600
+
+    # Keys must be at the start of a word; other colons are part of the message
+    query = CommitFilterQuery.parse("fix: typo in xpath:foo")
+    assert query.message.pattern == "fix: typo in xpath:foo"
+    assert not query.path
+
+    for badQuery, error in [("since:yesterday", "invalid date"),
+                            ("until:2022-02-30", "invalid date"),
+                            ("fix(", "invalid regular expression"),
+                            ("path:/", "invalid path")]:
+        with pytest.raises(ValueError, match=f"(?i){error}"):
+            CommitFilterQuery.parse(badQuery)
+
+
+def testFilterMode(tempDir, mainWindow):
+    wd = unpackRepo(tempDir)
+    rw = mainWindow.openRepo(wd)
+    graphView = rw.graphView
+    clFilter = graphView.clFilter
+    searchBar = graphView.searchBar
+    searchEdit = searchBar.lineEdit
+    numRows = clFilter.rowCount()
+
+    def shownCommits():
+        return [str(clFilter.index(row, 0).data(CommitLogModel.Role.Oid))[:7]
+                for row in range(1, clFilter.rowCount())]
+
+    def setQuery(text: str):
+        searchEdit.selectAll()
+        QTest.keyClicks(searchEdit, text)
+        QTest.qWait(0)
+
+    QTest.qWait(0)
+    QTest.keySequence(mainWindow, "Ctrl+F")
+    graphView.filterButton.click()
+    assert clFilter.filterMask is None  # nothing to filter yet
+
+    setQuery("path:c/c2.txt")
+    assert shownCommits() == ["ce112d0", "1203b03", "6462e7d"]
+    assert graphView.filterCountLabel.text() == "3 commits"
+
+    # Criteria are cumulative
+    setQuery("path:c/c2.txt since:2022-01-01")
+    assert shownCommits() == ["ce112d0"]
+    assert graphView.filterCountLabel.text() == "1 commit"
+
+    setQuery("author:THOR ^(first|second) [ab]/")
+    assert shownCommits() == ["7f82283", "59706a1", "d31f5a6", "83d2f04", "6db9c2e", "d86a2aa", "2c34933", "ac7e7e4"]
+
+    # Bad queries leave the previous results in place
+    setQuery("author:thor ^(first")
+    assert len(shownCommits()) == 8
+    assert "invalid regular expression" in graphView.filterCountLabel.toolTip().lower()
+
+    # The uncommitted changes are always shown
+    rw.jump(NavLocator.inWorkdir())
+    assert graphView.currentRowKind == SpecialRow.UncommittedChanges
+
+    # New commits are filtered after a refresh. Only the rows that the refresh spliced in need evaluating.
+    setQuery('author:"test person"')
+    assert shownCommits() == []
+    assert graphView.filterCountLabel.text() == "0 commits"
+
+    evaluatedRows = []
+    filterCommits = graphView.searchIndex.filterCommits
+
+    def spyFilterCommits(repo, rawIds, mask, start, stop, query):
+        evaluatedRows.extend(row for row in range(start, stop) if mask[row] == 2)
+        return filterCommits(repo, rawIds, mask, start, stop, query)
+
+    graphView.searchIndex.filterCommits = spyFilterCommits
+    with RepoContext(wd) as repo:
+        newOid = repo.create_commit_on_head("by someone else", TEST_SIGNATURE, TEST_SIGNATURE)
+    rw.refreshRepo()
+    assert shownCommits() == [str(newOid)[:7]]
+    assert 1 in evaluatedRows
+    assert len(evaluatedRows) <= 2
+    assert not clFilter.hasPendingFilterRows()
+
+    # The filter sticks when hiding branches
+    setQuery("^(first|second)")
+    matches = shownCommits()
+    assert len(matches) == 12
+    rw.toggleHideRefPattern("refs/heads/no-parent", allButThis=True)
+    hiddenCommits = {str(oid)[:7] for oid in rw.repoModel.hiddenCommits}
+    assert shownCommits() == [c for c in matches if c not in hiddenCommits] == ["42e4e7c"]
+    assert graphView.filterCountLabel.text() == "1 commit"
+    rw.toggleHideRefPattern("refs/heads/no-parent", allButThis=True)
+    assert shownCommits() == matches
+
+    # Turning off the filter mode shows all commits again
+    graphView.filterButton.click()
+    assert clFilter.filterMask is None
+    assert clFilter.rowCount() == numRows + 1
+    assert not graphView.filterCountLabel.isVisibleTo(searchBar)
+
+    # Closing the search bar turns off the filter mode
+    graphView.filterButton.click()
+    assert len(shownCommits()) == 12
+    QTest.keySequence(searchEdit, "Escape")
+    assert not graphView.filterButton.isChecked()
+    assert clFilter.rowCount() == numRows + 1
+
+
+def testFilterModeOnWorkerThread(tempDir, mainWindow, taskThread):
+    wd = unpackRepo(tempDir)
+    rw = mainWindow.openRepo(wd)
+    waitUntilTrue(lambda: rw.isLoaded and not rw.repoTaskRunner.isBusy(), timeout=10000)
+    graphView = rw.graphView
+
+    QTest.qWait(0)
+    QTest.keySequence(mainWindow, "Ctrl+F")
+    graphView.filterButton.click()
+    QTest.keyClicks(graphView.searchBar.lineEdit, "path:c/c2.txt")
+
+    # Refresh while filtering: one of the tasks waits for the other one to complete
+    with RepoContext(wd) as repo:
+        repo.create_commit_on_head("doesn't touch c/c2.txt", TEST_SIGNATURE, TEST_SIGNATURE)
+    rw.refreshRepo()
+
+    waitUntilTrue(lambda: graphView.filterCountLabel.text() == "3 commits" and not rw.repoTaskRunner.isBusy())
+    assert not graphView.clFilter.hasPendingFilterRows()
+    assert graphView.clFilter.rowCount() == 1 + 3  # uncommitted changes + matching commits
+
+
+def testJumpWhileFilteringSurvivesNewQuery(tempDir, mainWindow, taskThread, monkeypatch):
+    from gitfourchette.graphview.commitsearch import CommitSearchIndex
+    from gitfourchette.tasks import FilterCommits
+
+    wd = unpackRepo(tempDir)
+    rw = mainWindow.openRepo(wd)
+    waitUntilTrue(lambda: rw.isLoaded and not rw.repoTaskRunner.isBusy(), timeout=10000)
+    graphView = rw.graphView
+    runner = rw.repoTaskRunner
+    oid = Oid(hex="6462e7d8024396b14d7651e2ec11e2bbf07a05c4")
+
+    # Make the filter crawl
+    touchesPath = CommitSearchIndex.touchesPath
+    monkeypatch.setattr(FilterCommits, "ChunkSize", 1)
+    monkeypatch.setattr(CommitSearchIndex, "touchesPath",
+                        staticmethod(lambda repo, raw, path: QThread.msleep(30) or touchesPath(repo, raw, path)))
+
+    QTest.qWait(0)
+    QTest.keySequence(mainWindow, "Ctrl+F")
+    graphView.filterButton.click()
+    QTest.keyClicks(graphView.searchBar.lineEdit, "path:c")
+    waitUntilTrue(lambda: isinstance(runner.currentTask, FilterCommits))
+    firstFilter = runner.currentTask
+
+    # Click a commit: the jump interrupts the filter
+    rw.jump(NavLocator.inCommit(oid))
+
+    # Refine the query: the new filter supersedes the old one, but a pending jump still gets its turn.
+    # A refresh coming in meanwhile doesn't cancel the jump either.
+    QTest.keyClicks(graphView.searchBar.lineEdit, "/")
+    waitUntilTrue(lambda: isinstance(runner.currentTask, FilterCommits) and runner.currentTask is not firstFilter)
+    rw.refreshRepo()
+
+    waitUntilTrue(lambda: not runner.isBusy(), timeout=10000)
+    assert rw.navLocator.commit == oid
+    assert rw.diffArea.committedFiles.commitId == oid
+    assert not graphView.clFilter.hasPendingFilterRows()
+
+
+def testJumpInterruptsFilterWhichResumes(tempDir, mainWindow, taskThread, monkeypatch):
+    from gitfourchette.graphview.commitsearch import CommitSearchIndex
+    from gitfourchette.tasks import FilterCommits
+
+    wd = unpackRepo(tempDir)
+    rw = mainWindow.openRepo(wd)
+    waitUntilTrue(lambda: rw.isLoaded and not rw.repoTaskRunner.isBusy(), timeout=10000)
+    graphView = rw.graphView
+    runner = rw.repoTaskRunner
+    oid = Oid(hex="6462e7d8024396b14d7651e2ec11e2bbf07a05c4")
+    numCommits = len(rw.repoModel.commitSequence) - 1
+
+    # Make the filter crawl, and count the commits that it looks at
+    filteredCommits = []
+    touchesPath = CommitSearchIndex.touchesPath
+    monkeypatch.setattr(FilterCommits, "ChunkSize", 1)
+    monkeypatch.setattr(CommitSearchIndex, "touchesPath",
+                        staticmethod(lambda repo, raw, path: QThread.msleep(30) or filteredCommits.append(raw)
+                                     or touchesPath(repo, raw, path)))
+
+    QTest.qWait(0)
+    QTest.keySequence(mainWindow, "Ctrl+F")
+    graphView.filterButton.click()
+    QTest.keyClicks(graphView.searchBar.lineEdit, "path:c/c2.txt")
+    waitUntilTrue(lambda: len(filteredCommits) >= 3)
+    firstFilter = runner.currentTask
+    assert isinstance(firstFilter, FilterCommits)
+
+    # Click a commit: it's loaded without waiting for the entire log to be filtered
+    rw.jump(NavLocator.inCommit(oid))
+    waitUntilTrue(lambda: rw.diffArea.committedFiles.commitId == oid)
+    assert len(filteredCommits) < numCommits
+    assert graphView.clFilter.hasPendingFilterRows()
+
+    # The filter picks up where it left off (at worst, the chunk that was interrupted is evaluated again)
+    waitUntilTrue(lambda: not runner.isBusy(), timeout=10000)
+    assert not graphView.clFilter.hasPendingFilterRows()
+    assert graphView.filterCountLabel.text() == "3 commits"
+    assert numCommits <= len(filteredCommits) <= numCommits + FilterCommits.ChunkSize
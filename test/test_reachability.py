@@ -0,0 +1,199 @@
+# -----------------------------------------------------------------------------
+# Copyright (C) 2025 Iliyas Jorio.
+# This file is part of GitFourchette, distributed under the GNU GPL v3.
+# For full terms, see the included LICENSE file.
+# -----------------------------------------------------------------------------
+
+import hashlib
+import random
+
+import pytest
+
+from gitfourchette.graph import CommitSequence, GraphDiagram, MockCommit, ReachabilityIndex
+from gitfourchette.nav import NavLocator
+from .util import *
+
+
+def parseDiagramWithRealOids(definition: str) -> tuple[list[MockCommit], dict[str, Oid]]:
+    """ Turn a GraphDiagram definition into commits with 20-byte oids, plus one branch per commit. """
+    sequence, _heads = GraphDiagram.parseDefinition(definition)
+    names = {c.id: str(i) for i, c in enumerate(sequence)}
+    oids = {mockOid: Oid(raw=hashlib.sha1(name.encode()).digest()) for mockOid, name in names.items()}
+    commits = [MockCommit(oids[c.id], [oids[p] for p in c.parent_ids]) for c in sequence]
+    refs = {f"refs/heads/b{names[c.id]}": oids[c.id] for c in sequence}
+    return commits, refs
+
+
+def bruteForceContainingRefs(sequence, refs: dict[str, Oid]) -> list[set[str]]:
+    rows = {commit.id: row for row, commit in enumerate(sequence)}
+    containing = [set() for _ in rows]
+    for name, tip in refs.items():
+        if not ReachabilityIndex.isIndexedRef(name):
+            continue
+        stack = [tip]
+        seen = set()
+        while stack:
+            oid = stack.pop()
+            if oid in seen or oid not in rows:
+                continue
+            seen.add(oid)
+            containing[rows[oid]].add(name)
+            stack.extend(sequence[rows[oid]].parent_ids)
+    return containing
+
+
+def indexedRefs(index: ReachabilityIndex, numRows: int) -> list[set[str]]:
+    return [set(index.refsContaining(row)) for row in range(numRows)]
+
+
+@pytest.mark.parametrize("definition", [
+    "a-b-c",
+    "a-b:c d-c-e",
+    "m:a,b a:c b-c",
+    "a:b,c,d b:e c:e d-e-f",
+    "x-a:b,y b:z y-c-z",
+])
+def testReachabilityIndexMatchesBruteForce(definition):
+    sequence, refs = parseDiagramWithRealOids(definition)
+    compactSequence = CommitSequence(sequence)
+
+    # Throw in a few refs that the index should ignore
+    refs["HEAD"] = sequence[0].id
+    refs["UC_FAKEREF"] = sequence[0].id
+
+    index = ReachabilityIndex.build(compactSequence, refs)
+    assert indexedRefs(index, len(sequence)) == bruteForceContainingRefs(sequence, refs)
+    assert not any("HEAD" in names for names in indexedRefs(index, len(sequence)))
+
+    # The bottom commit is in all the fixtures' histories
+    assert index.contains(len(sequence) - 1, "refs/heads/b0")
+    assert not index.contains(0, f"refs/heads/b{len(sequence) - 1}")
+    assert not index.contains(0, "refs/heads/doesnotexist")
+
+
+def testReachabilityIndexSplicing():
+    rng = random.Random(0)
+    nextId = 0
+
+    def newCommits(n: int, below: list[Oid]) -> list[MockCommit]:
+        nonlocal nextId
+        oids = [Oid(hex=f"{i:040x}") for i in range(nextId + 1, nextId + n + 1)]
+        nextId += n
+        commits = []
+        for i, oid in enumerate(oids):
+            candidates = oids[i + 1: i + 6] + below[:8]
+            numParents = min(rng.choice([0, 1, 1, 1, 2, 2, 3]), len(candidates))
+            commits.append(MockCommit(oid, rng.sample(candidates, numParents)))
+        return commits
+
+    for _trial in range(100):
+        sequence = CommitSequence(newCommits(rng.randint(1, 30), []))
+        oids = [c.id for c in sequence]
+        refs = {f"refs/heads/b{i}": rng.choice(oids) for i in range(rng.randint(0, 6))}
+        index = ReachabilityIndex.build(sequence, refs)
+
+        for step in range(4):
+            # Replace the top rows with new commits, possibly followed by the old top rows
+            numRowsRemoved = rng.randint(0, len(sequence) - 1)
+            top = newCommits(rng.randint(0, 5), [c.id for c in sequence[numRowsRemoved:]])
+            if rng.random() < 0.5:
+                top += list(sequence[:numRowsRemoved])
+            newSequence = CommitSequence(top) + sequence[numRowsRemoved:]
+
+            # Move, delete and create refs. Refs that don't move must remain in the sequence.
+            newOids = [c.id for c in newSequence]
+            newRefs = {}
+            for name, tip in refs.items():
+                dice = rng.random()
+                if dice < .15:
+                    continue
+                newRefs[name] = rng.choice(newOids) if dice < .5 or tip not in newOids else tip
+            for i in range(rng.randint(0, 2)):
+                newRefs[f"refs/tags/t{step}_{i}"] = rng.choice(newOids)
+
+            newIndex = index.spliced(newSequence, len(top), numRowsRemoved, newRefs)
+            assert indexedRefs(newIndex, len(newSequence)) == bruteForceContainingRefs(newSequence, newRefs)
+            assert set(newIndex.refBits) == set(newRefs)
+
+            # The old index must be left untouched
+            assert indexedRefs(index, len(sequence)) == bruteForceContainingRefs(sequence, refs)
+
+            sequence, refs, index = newSequence, newRefs, newIndex
+
+
+def testReachabilityIndexSharesMasksAlongChains():
+    sequence, refs = parseDiagramWithRealOids("a-b-c-d-e-f-g-h")
+    index = ReachabilityIndex.build(CommitSequence(sequence), {"refs/heads/main": refs["refs/heads/b0"]})
+    assert len({id(mask) for mask in index.masks}) == 1
+
+
+def testReachabilityIndexInRealRepo(tempDir, mainWindow, monkeypatch):
+    wd = unpackRepo(tempDir)
+    rw = mainWindow.openRepo(wd)
+    repoModel = rw.repoModel
+    repo = rw.repo
+    assert repoModel.reachability is None
+
+    def checkAgainstRepo():
+        for commit in list(repoModel.commitSequence)[1:]:
+            expected = [name for name, tip in repoModel.refs.items()
+                        if ReachabilityIndex.isIndexedRef(name)
+                        and (tip == commit.id or repo.descendant_of(tip, commit.id))]
+            assert repoModel.refsContaining(commit.id) == expected
+
+    repoModel.buildReachabilityIndex()
+    checkAgainstRepo()
+
+    # The index should be patched rather than rebuilt as long as the splicer finds an equilibrium
+    def noRebuild(*args):
+        raise AssertionError("reachability index rebuilt from scratch")
+    monkeypatch.setattr(ReachabilityIndex, "build", noRebuild)
+
+    # Fast-forward a branch
+    with RepoContext(wd) as repo2:
+        repo2.create_commit_on_head("fast-forward", TEST_SIGNATURE, TEST_SIGNATURE)
+    rw.refreshRepo()
+    assert repoModel.reachability is not None
+    checkAgainstRepo()
+
+    # New branch on an old commit, deleted branch
+    with RepoContext(wd) as repo2:
+        repo2.create_branch_from_commit("old-branch", Oid(hex="6e1475206e57110fcef4b92320436c1e9872a322"))
+        repo2.delete_local_branch("no-parent")
+    rw.refreshRepo()
+    checkAgainstRepo()
+    assert "refs/heads/no-parent" not in repoModel.reachability.refBits
+    monkeypatch.undo()
+
+    # Move a branch backwards (the splicer doesn't find an equilibrium in this small repo)
+    with RepoContext(wd) as repo2:
+        repo2.reset(Oid(hex="6db9c2ebf75590eef973081736730a9ea169a0c4"), ResetMode.HARD)
+    rw.refreshRepo()
+    checkAgainstRepo()
+
+
+def testCommitInfoShowsContainingRefs(tempDir, mainWindow):
+    oid = Oid(hex="6e1475206e57110fcef4b92320436c1e9872a322")
+    wd = unpackRepo(tempDir)
+    rw = mainWindow.openRepo(wd)
+    rw.jump(NavLocator.inCommit(oid))
+
+    # Before the index is built, the context menu offers to get info instead
+    menu = rw.graphView.makeContextMenu()
+    triggerMenuAction(menu, "contained in/commit info")
+
+    qmb = findQMessageBox(rw, "contained in")
+    assert "master" in qmb.text()
+    assert "origin/master" in qmb.text()
+    assert "no-parent" not in qmb.text()
+    qmb.accept()
+    assert rw.repoModel.reachability is not None
+
+    # Now the context menu lists the branches right away
+    menu = rw.graphView.makeContextMenu()
+    assert findMenuAction(menu, r"contained in/origin.master")
+    with pytest.raises(KeyError):
+        findMenuAction(menu, "contained in/no-parent")
+
+    triggerMenuAction(menu, r"contained in/^master")
+    assert rw.graphView.currentCommitId == rw.repoModel.refs["refs/heads/master"]